@@ -0,0 +1,1149 @@
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from TwitchWebsocket import Message
+
+from CompiledModel import CompiledModel, compile_model
+from Blacklist import Blacklist
+from Corpora import generate_adversarial_messages, generate_chat_messages, generate_corpus
+from Database import FOLDED_IDS, Database
+from MarkovChainBot import MarkovChain
+from Metrics import Metrics
+from Sampler import TransitionSampler
+from Settings import Settings
+from Tokenizer import fast_tokenize, tokenize
+
+def learn_corpus(db: Database, corpus: List[List[str]]) -> None:
+    """Learn all tokenized messages in `corpus`, like `MarkovChain.message_handler` does.
+
+    Args:
+        db (Database): The Database to learn into.
+        corpus (List[List[str]]): The list of tokenized messages.
+    """
+    for words in corpus:
+        db.learn(*message_ngrams(words))
+    db.flush()
+
+def message_ngrams(words: List[str]) -> Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]:
+    """Get the start and 3-grams that `MarkovChain.message_handler` learns from the tokenized message `words`.
+
+    Args:
+        words (List[str]): The tokens of the message, e.g. ["How", "are", "you"].
+
+    Returns:
+        Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]: The start and 3-grams, for `Database.learn`.
+    """
+    rules = [tuple(words[i:i + 3]) for i in range(len(words) - 2)] + [(*words[-2:], "<END>")]
+    return [tuple(words[:2])], rules
+
+def load_corpus(path: str) -> List[List[str]]:
+    """Load and tokenize a chat log with one message per line, e.g. to measure with a realistic corpus.
+
+    Args:
+        path (str): The path of the chat log.
+
+    Returns:
+        List[List[str]]: The list of tokenized messages with at least 3 tokens.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        corpus = [tokenize(line.strip()) for line in f]
+    return [[word for word in words if word] for words in corpus if len(words) >= 3]
+
+def privmsg(message: str, user: str = "viewer", channel: str = "benchmark", message_id: str = "0") -> Message:
+    """Create the Message that Twitch sends for `message` in chat, with the tags sent with the "tags" capability.
+
+    Args:
+        message (str): The chat message.
+        user (str, optional): The user that sent the message. Defaults to "viewer".
+        channel (str, optional): The channel without "#". Defaults to "benchmark".
+        message_id (str, optional): The `id` tag of the message. Defaults to "0".
+
+    Returns:
+        Message: The parsed message.
+    """
+    return Message(f"@badge-info=;badges=;color=;display-name={user};emotes=;flags=;id={message_id};mod=0;room-id=1;subscriber=0;"
+                   f"tmi-sent-ts=0;turbo=0;user-id=1;user-type= :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{channel} :{message}")
+
+class StubWebsocket:
+    """Stands in for `TwitchWebsocket`, counting the messages and whispers the bot sends instead of sending them."""
+    def __init__(self) -> None:
+        self.messages = 0
+        self.whispers = 0
+
+    def send_message(self, message: str) -> None:
+        self.messages += 1
+
+    def send_whisper(self, user: str, message: str) -> None:
+        self.whispers += 1
+
+def create_bot(channel: str = "#benchmark", metrics: bool = False) -> MarkovChain:
+    """Set up a MarkovChain with the default settings and a `StubWebsocket`, without connecting to Twitch.
+
+    The settings file and blacklist are written to the current directory.
+
+    Args:
+        channel (str, optional): The channel of the Database of the bot. Defaults to "#benchmark".
+        metrics (bool, optional): Whether to record metrics, without serving them. Defaults to False.
+
+    Raises:
+        RuntimeError: If the sentence splitting model is missing, see `Punkt.ensure_model`.
+
+    Returns:
+        MarkovChain: The bot, without sentence pool, help messages or automatic generations.
+    """
+    Settings.PATH = os.path.join(os.getcwd(), "settings.json")
+    Settings.write_settings_file({**Settings.DEFAULTS, "Channel": channel, "Nickname": "BenchmarkBot",
+                                  "HelpMessageTimer": -1, "AutomaticGenerationTimer": -1, "SentencePoolSize": 0})
+    bot = MarkovChain(connect=False)
+    bot.metrics = Metrics(enabled=metrics)
+    bot.db = Database(bot.chan, metrics=bot.metrics)
+    bot.model = bot.db
+    bot.sentence_pool = None
+    bot.ws = StubWebsocket()
+    if metrics:
+        bot.register_metrics_collectors()
+    return bot
+
+def sharded_layout() -> Tuple[List[str], List[str], Callable[[List[str]], str], Callable[[List[str]], str]]:
+    """Get the tables of the layout from before version 6, split up by the first character of the first (and second) word.
+
+    Returns:
+        Tuple[List[str], List[str], Callable[[List[str]], str], Callable[[List[str]], str]]: The 27 start tables,
+            the 729 grammar tables, and functions that give the table for a start and for a 3-gram.
+    """
+    suffixes = list(string.ascii_uppercase) + ["_"]
+
+    def suffix(word: str) -> str:
+        return word[0].upper() if word[0] in string.ascii_letters else "_"
+
+    return (
+        [f"MarkovStart{first}" for first in suffixes],
+        [f"MarkovGrammar{first}{second}" for first in suffixes for second in suffixes],
+        lambda start: f"MarkovStart{suffix(start[0])}",
+        lambda ngram: f"MarkovGrammar{suffix(ngram[0])}{suffix(ngram[1])}",
+    )
+
+def connect_text_layout(path: str) -> sqlite3.Connection:
+    """Connect to a database for tables that store words as text, with the default PRAGMAs of `Database`.
+
+    Args:
+        path (str): The path of the database file.
+
+    Returns:
+        sqlite3.Connection: The connection, in autocommit mode.
+    """
+    conn = sqlite3.connect(path, isolation_level=None)
+    for pragma, value in Database.DEFAULT_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value};")
+    return conn
+
+def create_text_layout(conn: sqlite3.Connection, start_tables: List[str], grammar_tables: List[str]) -> None:
+    """Create MarkovStart and MarkovGrammar tables that store words as text, like before version 7, with their lookup indices.
+
+    Args:
+        conn (sqlite3.Connection): The connection to create the tables with.
+        start_tables (List[str]): The names of the tables for starts of sentences.
+        grammar_tables (List[str]): The names of the tables for 3-grams.
+    """
+    conn.execute("begin")
+    for table in start_tables:
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+            word1 TEXT COLLATE NOCASE, word2 TEXT COLLATE NOCASE, count INTEGER,
+            PRIMARY KEY (word1 COLLATE BINARY, word2 COLLATE BINARY));""")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_lookup ON {table} (word1, word2, count);")
+    for table in grammar_tables:
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+            word1 TEXT COLLATE NOCASE, word2 TEXT COLLATE NOCASE, word3 TEXT COLLATE NOCASE, count INTEGER,
+            PRIMARY KEY (word1 COLLATE BINARY, word2 COLLATE BINARY, word3 COLLATE BINARY));""")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_lookup ON {table} (word1, word2, word3, count);")
+    conn.execute("commit")
+
+def learn_text_layout(conn: sqlite3.Connection,
+                      corpus: List[List[str]],
+                      start_table: Callable[[List[str]], str] = lambda start: "MarkovStart",
+                      grammar_table: Callable[[List[str]], str] = lambda ngram: "MarkovGrammar") -> None:
+    """Learn `corpus` into tables created with `create_text_layout`, with one `executemany` UPSERT 
+    per table in transactions of 100 messages.
+
+    Args:
+        conn (sqlite3.Connection): The connection to learn with.
+        corpus (List[List[str]]): The list of tokenized messages.
+        start_table (Callable[[List[str]], str], optional): Gives the table for a start. Defaults to "MarkovStart".
+        grammar_table (Callable[[List[str]], str], optional): Gives the table for a 3-gram. Defaults to "MarkovGrammar".
+    """
+    for i in range(0, len(corpus), 100):
+        starts: Dict[str, Counter] = {}
+        ngrams: Dict[str, Counter] = {}
+        for words in corpus[i:i + 100]:
+            starts.setdefault(start_table(words), Counter())[tuple(words[:2])] += 1
+            for ngram in [words[j:j + 3] for j in range(len(words) - 2)] + [words[-2:] + ["<END>"]]:
+                ngrams.setdefault(grammar_table(ngram), Counter())[tuple(ngram)] += 1
+        conn.execute("begin")
+        for table, counter in starts.items():
+            conn.executemany(f"""INSERT INTO {table} (word1, word2, count) VALUES (?, ?, ?)
+                ON CONFLICT (word1 COLLATE BINARY, word2 COLLATE BINARY) DO UPDATE SET count = count + excluded.count;""",
+                             [(*start, count) for start, count in counter.items()])
+        for table, counter in ngrams.items():
+            conn.executemany(f"""INSERT INTO {table} (word1, word2, word3, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT (word1 COLLATE BINARY, word2 COLLATE BINARY, word3 COLLATE BINARY) DO UPDATE SET count = count + excluded.count;""",
+                             [(*ngram, count) for ngram, count in counter.items()])
+        conn.execute("commit")
+
+def measure(func: Callable[[], None], n: int) -> Dict[str, float]:
+    """Call `func` `n` times, and return the mean, p50 and p99 latency in microseconds.
+
+    Args:
+        func (Callable[[], None]): The function to measure.
+        n (int): The number of calls.
+
+    Returns:
+        Dict[str, float]: The latency statistics in microseconds.
+    """
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "mean_us": statistics.mean(timings),
+        "p50_us": timings[len(timings) // 2],
+        "p99_us": timings[int(len(timings) * 0.99)],
+    }
+
+def benchmark_get_next(n_messages: int, n_lookups: int) -> Dict[str, Dict[str, float]]:
+    """Compare the per-word `get_next` latency of a connection per query with the long-lived connections.
+
+    Args:
+        n_messages (int): The number of messages to learn before measuring.
+        n_lookups (int): The number of `get_next` calls to measure.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The latency statistics for both approaches.
+    """
+    corpus = generate_corpus(n_messages)
+    keys = [words[i:i + 2] for words in corpus for i in range(len(words) - 2)]
+    rng = random.Random(1)
+
+    db = Database("#benchmark")
+    learn_corpus(db, corpus)
+
+    def connect_per_query() -> None:
+        # The approach used before the long-lived connections
+        words = rng.choice(keys)
+        with sqlite3.connect(db.db_name) as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT word3, count FROM MarkovGrammar
+                WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS};""", [db.nocase(word) for word in words])
+            conn.commit()
+            data = cur.fetchall()
+        db.pick_word(data, 1)
+
+    def persistent() -> None:
+        db.get_next(1, rng.choice(keys))
+
+    results = {
+        "connect_per_query": measure(connect_per_query, n_lookups),
+        "persistent": measure(persistent, n_lookups),
+    }
+    db.close()
+    return results
+
+def benchmark_learn(n_messages: int, vocabulary_size: int, repeat_probability: float) -> Dict[str, Dict[str, float]]:
+    """Compare learning with one queued statement per n-gram with the in-memory learn buffer.
+
+    A small `vocabulary_size` and a large `repeat_probability` simulate a busy chat 
+    that repeats the same emotes and phrases.
+
+    Args:
+        n_messages (int): The number of messages to learn.
+        vocabulary_size (int): The number of distinct words in the synthetic corpus.
+        repeat_probability (float): The probability that a message repeats a recent message.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Messages per second and database writes per message for both approaches.
+    """
+    corpus = generate_corpus(n_messages, vocabulary_size=vocabulary_size, repeat_probability=repeat_probability)
+
+    # The approach used before the learn buffer: one INSERT OR REPLACE per n-gram,
+    # executed in transactions of 25 statements, on tables that store words as text.
+    conn = connect_text_layout("benchmark_statements.db")
+    create_text_layout(conn, ["MarkovStart"], ["MarkovGrammar"])
+    start = time.perf_counter()
+    statements = 0
+    conn.execute("begin")
+    for words in corpus:
+        ngrams = [words[i:i + 3] for i in range(len(words) - 2)] + [words[-2:] + ["<END>"]]
+        for ngram in ngrams:
+            if ngram[0] * len(ngram) == ngram:
+                continue
+            conn.execute("""
+                INSERT OR REPLACE INTO MarkovGrammar (word1, word2, word3, count)
+                VALUES (?, ?, ?, coalesce(
+                    (
+                        SELECT count + 1 FROM MarkovGrammar
+                        WHERE word1 = ? COLLATE BINARY AND word2 = ? COLLATE BINARY AND word3 = ? COLLATE BINARY
+                    ),
+                    1)
+                )""", ngram + ngram)
+            statements += 1
+        conn.execute("""
+            INSERT OR REPLACE INTO MarkovStart (word1, word2, count)
+            VALUES (?, ?, coalesce(
+                (
+                    SELECT count + 1 FROM MarkovStart
+                    WHERE word1 = ? COLLATE BINARY AND word2 = ? COLLATE BINARY
+                ),
+                1)
+            )""", words[:2] + words[:2])
+        statements += 1
+        if statements >= 25:
+            conn.execute("commit")
+            conn.execute("begin")
+    conn.execute("commit")
+    statements_duration = time.perf_counter() - start
+    conn.close()
+
+    db = Database("#benchmark_buffer")
+    start = time.perf_counter()
+    learn_corpus(db, corpus)
+    buffer_duration = time.perf_counter() - start
+    db.close()
+
+    return {
+        "statements": {
+            "messages_per_s": n_messages / statements_duration,
+            "writes_per_message": statements / n_messages,
+        },
+        "learn_buffer": {
+            "messages_per_s": n_messages / buffer_duration,
+            "writes_per_message": db.written_rows / n_messages,
+        },
+    }
+
+def benchmark_sampling(n_transitions: int, n_samples: int) -> Dict[str, Dict[str, float]]:
+    """Compare `Database.pick_word` with `TransitionSampler`, for a key with `n_transitions` next words.
+
+    Besides the latency, the total variation distance between the sampled distribution and the 
+    exact distribution is reported for both, which should be close to 0 for both, and of similar size.
+
+    Args:
+        n_transitions (int): The number of distinct next words.
+        n_samples (int): The number of samples to draw.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The latency statistics and total variation distance for both approaches.
+    """
+    rng = random.Random(2)
+    data = [(f"word{i}", rng.randint(1, 100)) for i in range(n_transitions)] + [("<END>", n_transitions * 10)]
+    db = Database("#benchmark")
+    sampler = TransitionSampler(data)
+
+    results = {}
+    for name, func in (("pick_word", lambda index: db.pick_word(data, index)),
+                       ("sampler", lambda index: sampler.sample(index))):
+        # Sample at several indices, as the weight of "<END>" depends on the index
+        for index in (0, 14, 30):
+            counts = Counter(func(index) for _ in range(n_samples))
+            weights = {word: count * ((index + 1) / 15) if word == "<END>" else count for word, count in data}
+            total = sum(weights.values())
+            distance = sum(abs(counts[word] / n_samples - weight / total) for word, weight in weights.items()) / 2
+            results.setdefault(name, {})[f"tvd_index_{index}"] = distance
+        results[name].update(measure(lambda: func(1), n_samples))
+    db.close()
+    return results
+
+def benchmark_layout(n_messages: int, n_lookups: int) -> Dict[str, Dict[str, float]]:
+    """Compare the 756 tables split up by first character from before version 6 with the single MarkovStart and MarkovGrammar tables.
+
+    Both layouts are created directly with sqlite3, with the same PRAGMAs and indices, so only the layout differs.
+    Reported are the time to run the `CREATE TABLE IF NOT EXISTS` statements on startup, the learning throughput
+    with one `executemany` UPSERT per table in transactions of 100 messages, and the latency of `get_next`-style lookups.
+
+    Args:
+        n_messages (int): The number of messages to learn.
+        n_lookups (int): The number of lookups to measure.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The startup time, learning throughput and lookup latency for both layouts.
+    """
+    corpus = generate_corpus(n_messages)
+    keys = [words[i:i + 2] for words in corpus for i in range(len(words) - 2)]
+
+    layouts = {
+        "sharded": sharded_layout(),
+        "single": (
+            ["MarkovStart"],
+            ["MarkovGrammar"],
+            lambda start: "MarkovStart",
+            lambda ngram: "MarkovGrammar",
+        ),
+    }
+
+    results = {}
+    for name, (start_tables, grammar_tables, start_table, grammar_table) in layouts.items():
+        conn = connect_text_layout(f"layout_{name}.db")
+        create_text_layout(conn, start_tables, grammar_tables)
+        # Every startup re-runs these statements on the existing database
+        startup = measure(lambda: create_text_layout(conn, start_tables, grammar_tables), 10)
+
+        start_t = time.perf_counter()
+        learn_text_layout(conn, corpus, start_table, grammar_table)
+        learn_duration = time.perf_counter() - start_t
+
+        rng = random.Random(1)
+        def lookup() -> None:
+            words = rng.choice(keys)
+            conn.execute(f"SELECT word3, count FROM {grammar_table(words)} WHERE word1 = ? AND word2 = ?;", words).fetchall()
+
+        results[name] = {
+            "startup_ms": startup["mean_us"] / 1000,
+            "learn_messages_per_s": n_messages / learn_duration,
+            **{f"lookup_{key}": value for key, value in measure(lookup, n_lookups).items()},
+        }
+        conn.close()
+    return results
+
+def benchmark_compiled(n_messages: int, n_lookups: int) -> Dict[str, Dict[str, float]]:
+    """Compare generating from the Database with generating from a compiled model.
+
+    The Database is measured without its cache of next words, i.e. as if every lookup were new.
+
+    Args:
+        n_messages (int): The number of messages to learn before compiling.
+        n_lookups (int): The number of `get_next` and `get_start` calls to measure.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The time to open, and the `get_next` and `get_start` latency, for both.
+    """
+    corpus = generate_corpus(n_messages)
+    keys = [words[i:i + 2] for words in corpus for i in range(len(words) - 2)]
+
+    db = Database("#benchmark_compiled")
+    learn_corpus(db, corpus)
+    db.close()
+    start_t = time.perf_counter()
+    stats = compile_model(db.db_name, "benchmark_compiled.model")
+    compile_duration = time.perf_counter() - start_t
+
+    results = {}
+    for name, open_model in [
+        ("database", lambda: Database("#benchmark_compiled", transition_cache_entries=0)),
+        ("compiled", lambda: CompiledModel("benchmark_compiled.model")),
+    ]:
+        rng = random.Random(1)
+        start_t = time.perf_counter()
+        model = open_model()
+        model.get_start()
+        open_duration = time.perf_counter() - start_t
+        results[name] = {
+            "open_ms": open_duration * 1000,
+            **{f"get_next_{key}": value for key, value in measure(lambda: model.get_next(1, rng.choice(keys)), n_lookups).items()},
+            **{f"get_start_{key}": value for key, value in measure(model.get_start, n_lookups).items()},
+        }
+        if isinstance(model, Database):
+            model.close()
+    results["compiled"]["compile_s"] = compile_duration
+    results["compiled"]["megabytes"] = stats["bytes"] / 1e6
+    return results
+
+def benchmark_statements(n_messages: int, n_lookups: int) -> Dict[str, Dict[str, float]]:
+    """Compare generating and unlearning with connections that cache no prepared statements, 
+    with connections that cache all statements registered in `Database.statements`.
+
+    The Database is measured without its cache of next words, so every `get_next` executes a query.
+
+    Args:
+        n_messages (int): The number of messages to learn before measuring.
+        n_lookups (int): The number of calls to measure, per operation.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The `get_next`, `get_start` and unlearning latency for both,
+            and the mean and maximum time to prepare a registered statement.
+    """
+    corpus = generate_corpus(n_messages)
+    keys = [words[i:i + 2] for words in corpus for i in range(len(words) - 2)]
+
+    results = {}
+    for name, cache_size in [("uncached", 0), ("cached", None)]:
+        db = Database(f"#benchmark_statements_{name}", transition_cache_entries=0, statement_cache_size=cache_size)
+        learn_corpus(db, corpus)
+        db.flush()
+        rng = random.Random(1)
+        messages = iter(corpus)
+        results[name] = {
+            **{f"get_next_{key}": value for key, value in measure(lambda: db.get_next(1, rng.choice(keys)), n_lookups).items()},
+            **{f"get_start_{key}": value for key, value in measure(db.get_start, n_lookups).items()},
+            # Unlearning is measured on the calling thread, as if the writer thread executes it
+            **{f"unlearn_{key}": value for key, value in measure(lambda: db.unlearn_now(" ".join(next(messages))), 
+                                                                 min(n_lookups, n_messages)).items()},
+        }
+        if cache_size is None:
+            timings = db.statement_timings()
+            results["prepare"] = {
+                "statements": len(timings),
+                "mean_us": statistics.mean(timings.values()),
+                "max_us": max(timings.values()),
+            }
+        db.close()
+    return results
+
+def benchmark_raid(n_messages: int, n_lookups: int) -> Dict[str, Dict[str, float]]:
+    """Measure the `get_next` latency while a second thread learns as fast as possible, like during a raid.
+
+    Learning only updates the delta tier, which the writer thread compacts into the database in the background.
+    Measured once without learning, and while learning with the journal synced every second, 
+    synced after every record, and disabled.
+
+    Args:
+        n_messages (int): The number of messages to learn before measuring, and while measuring.
+        n_lookups (int): The number of `get_next` calls to measure.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The learning throughput, `get_next` latency and compaction statistics.
+    """
+    corpus = generate_corpus(2 * n_messages)
+    keys = [words[i:i + 2] for words in corpus for i in range(len(words) - 2)]
+
+    results = {}
+    variants = [("idle", 1, False), ("raid", 1, True), ("raid_sync_every_record", 0, True), ("raid_without_journal", None, True)]
+    for name, sync_interval, learn in variants:
+        db = Database(f"#benchmark_{name}", journal_sync_interval=sync_interval)
+        learn_corpus(db, corpus[:n_messages])
+        before = db.delta.stats()
+
+        learned = 0
+        done = threading.Event()
+        def learner() -> None:
+            nonlocal learned
+            for words in corpus[n_messages:]:
+                if done.is_set():
+                    return
+                db.learn(*message_ngrams(words))
+                learned += 1
+
+        thread = threading.Thread(target=learner)
+        rng = random.Random(1)
+        start_t = time.perf_counter()
+        if learn:
+            thread.start()
+        latency = measure(lambda: db.get_next(1, rng.choice(keys)), n_lookups)
+        done.set()
+        if learn:
+            thread.join()
+        duration = time.perf_counter() - start_t
+        db.close()
+
+        after = db.delta.stats()
+        journal = db.journal.stats() if db.journal is not None else {"syncs": 0, "max_sync_ms": 0.0}
+        compactions = after["compactions"] - before["compactions"]
+        results[name] = {
+            "learn_messages_per_s": learned / duration,
+            **{f"get_next_{key}": value for key, value in latency.items()},
+            "compactions": compactions,
+            "mean_merge_ms": (after["total_merge_ms"] - before["total_merge_ms"]) / max(compactions, 1),
+            "journal_syncs": journal["syncs"],
+            "max_journal_sync_ms": journal["max_sync_ms"],
+        }
+    return results
+
+def benchmark_size(corpus: List[List[str]]) -> Dict[str, Dict[str, float]]:
+    """Compare the size on disk of the tables that store words as text, as before version 7, 
+    with the tables that store Vocabulary IDs.
+
+    Both databases are vacuumed after learning `corpus`, so the sizes do not include free pages.
+
+    Args:
+        corpus (List[List[str]]): The list of tokenized messages to learn.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The file size, page count and learning throughput for both layouts, 
+            and the size reduction of the ID layout.
+    """
+    def file_size(path: str, conn: sqlite3.Connection) -> Dict[str, float]:
+        conn.execute("VACUUM;")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        return {
+            "megabytes": os.path.getsize(path) / 1e6,
+            "pages": conn.execute("PRAGMA page_count;").fetchone()[0],
+        }
+
+    conn = connect_text_layout("size_text.db")
+    create_text_layout(conn, ["MarkovStart"], ["MarkovGrammar"])
+    start_t = time.perf_counter()
+    learn_text_layout(conn, corpus)
+    text = {**file_size("size_text.db", conn), "learn_messages_per_s": len(corpus) / (time.perf_counter() - start_t)}
+    conn.close()
+
+    db = Database("#size_ids")
+    start_t = time.perf_counter()
+    learn_corpus(db, corpus)
+    db.flush()
+    learn_duration = time.perf_counter() - start_t
+    with db._write_lock:
+        ids = {**file_size(db.db_name, db.writer), "learn_messages_per_s": len(corpus) / learn_duration}
+    db.close()
+
+    return {
+        "text": text,
+        "ids": ids,
+        "reduction": {
+            "megabytes_pct": 100 * (1 - ids["megabytes"] / text["megabytes"]),
+            "pages_pct": 100 * (1 - ids["pages"] / text["pages"]),
+        },
+    }
+
+def benchmark_message_handler(bot: MarkovChain, n_messages: int, seed: int = 0) -> Dict[str, float]:
+    """Measure the learning throughput of `MarkovChain.message_handler` on synthetic chat messages.
+
+    The messages are parsed in chunks before measuring each chunk, so parsing the IRC format is not included.
+    Each message gets its index as `id` tag, so `benchmark_unlearn` can delete it.
+
+    Args:
+        bot (MarkovChain): The bot, see `create_bot`.
+        n_messages (int): The number of messages to handle.
+        seed (int, optional): The seed for `generate_chat_messages`. Defaults to 0.
+
+    Returns:
+        Dict[str, float]: The number of handled messages per second, also including committing 
+            everything that was learned, and the number of learned n-grams.
+    """
+    messages = generate_chat_messages(n_messages, seed=seed)
+    handled = 0
+    duration = 0.0
+    while True:
+        chunk = [privmsg(message, message_id=str(handled + i)) for i, message in enumerate(islice(messages, 10000))]
+        if not chunk:
+            break
+        start_t = time.perf_counter()
+        for m in chunk:
+            bot.message_handler(m)
+        duration += time.perf_counter() - start_t
+        handled += len(chunk)
+    start_t = time.perf_counter()
+    bot.db.flush()
+    flush_duration = time.perf_counter() - start_t
+    return {
+        "messages_per_s": handled / duration,
+        "messages_per_s_with_commit": handled / (duration + flush_duration),
+        "learned_ngrams": bot.db.learned_ngrams,
+        "tokenization_cache_hit_rate": bot.tokenization_cache.stats()["hit_rate"],
+    }
+
+def benchmark_generate(bot: MarkovChain, n_generations: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Measure the latency of `MarkovChain.generate`, without parameters and with one or two words from chat as parameters.
+
+    Args:
+        bot (MarkovChain): The bot, which learned from `generate_chat_messages` with `seed`.
+        n_generations (int): The number of generations to measure, for both.
+        seed (int, optional): The seed for `generate_chat_messages`. Defaults to 0.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The latency statistics without and with parameters.
+    """
+    rng = random.Random(seed)
+    tokenized = [tokenize(message) for message in generate_chat_messages(1000, seed=seed)]
+    params = [words[:rng.randint(1, 2)] for words in tokenized if words]
+    return {
+        "generate": measure(bot.generate, n_generations),
+        "generate_params": measure(lambda: bot.generate(rng.choice(params)), n_generations),
+    }
+
+def benchmark_unlearn(bot: MarkovChain, n_messages: int, learned_messages: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Measure the throughput of unlearning deleted messages, through the CLEARMSG path of `MarkovChain.message_handler`.
+
+    The last `n_messages` learned messages are deleted by their `id`, so those remembered by the Database
+    are unlearned exactly, see `Database.unlearn_message`. The first `n_messages` are deleted without
+    an `id` it remembers, so they are unlearned by their words, see `Database.unlearn`.
+
+    Args:
+        bot (MarkovChain): The bot, which learned from `generate_chat_messages` with `seed`, see `benchmark_message_handler`.
+        n_messages (int): The number of learned messages to delete, for both.
+        learned_messages (int): The number of messages the bot learned.
+        seed (int, optional): The seed for `generate_chat_messages`. Defaults to 0.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The number of unlearned messages per second, including committing them,
+            and the share of messages that were unlearned exactly, for both.
+    """
+    messages = list(generate_chat_messages(learned_messages, seed=seed))
+    first = max(learned_messages - n_messages, 0)
+    deletions = {
+        "unlearn_exact": [(str(first + i), message) for i, message in enumerate(messages[first:])],
+        "unlearn": [("", message) for message in messages[:n_messages]],
+    }
+    results = {}
+    for name, deleted in deletions.items():
+        stats = bot.db.learned_messages.stats()
+        deleted = [Message(f"@login=viewer;room-id=1;target-msg-id={message_id};tmi-sent-ts=0 :tmi.twitch.tv CLEARMSG #benchmark :{message}")
+                   for message_id, message in deleted]
+        start_t = time.perf_counter()
+        for m in deleted:
+            bot.message_handler(m)
+        bot.db.flush()
+        results[name] = {
+            "messages_per_s": len(deleted) / (time.perf_counter() - start_t),
+            "exact": (bot.db.learned_messages.stats()["hits"] - stats["hits"]) / len(deleted),
+        }
+    return results
+
+def create_version_2_database(channel: str, n_messages: int, seed: int = 0) -> int:
+    """Create a database of version 2, i.e. from before `Database.update_v3`, for `channel`.
+
+    The version 2 database stores the words of synthetic chat messages split on spaces,
+    in the 756 tables split up by first character.
+
+    Args:
+        channel (str): The channel of the database, e.g. "#benchmark_migration".
+        n_messages (int): The number of messages learned in the database.
+        seed (int, optional): The seed for `generate_chat_messages`. Defaults to 0.
+
+    Returns:
+        int: The number of rows in the database.
+    """
+    start_tables, grammar_tables, start_table, grammar_table = sharded_layout()
+    conn = connect_text_layout(f"MarkovChain_{channel.replace('#', '').lower()}.db")
+    create_text_layout(conn, start_tables, grammar_tables)
+    messages = generate_chat_messages(n_messages, seed=seed)
+    while True:
+        chunk = [message.split(" ") for message in islice(messages, 100000)]
+        if not chunk:
+            break
+        learn_text_layout(conn, [words for words in chunk if len(words) >= 3], start_table, grammar_table)
+    rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0] for table in start_tables + grammar_tables)
+    conn.close()
+    return rows
+
+def benchmark_migration(n_messages: int, seed: int = 0, processes: Optional[int] = None) -> Dict[str, float]:
+    """Measure updating a database from version 2, see `create_version_2_database`, to the current version.
+
+    Args:
+        n_messages (int): The number of messages learned in the version 2 database.
+        seed (int, optional): The seed for `generate_chat_messages`. Defaults to 0.
+        processes (Optional[int], optional): The maximum number of processes to re-tokenize with,
+            or None for one per CPU. Defaults to None.
+
+    Returns:
+        Dict[str, float]: The number of rows in the version 2 database, the duration and throughput of
+            updating, and the duration and number of processes of re-tokenizing, see `Migration.TableMigration`.
+    """
+    rows = create_version_2_database("#benchmark_migration", n_messages, seed)
+
+    start_t = time.perf_counter()
+    db = Database("#benchmark_migration", migration_processes=processes)
+    duration = time.perf_counter() - start_t
+    db.close()
+    return {
+        "rows": rows,
+        "seconds": duration,
+        "rows_per_s": rows / duration,
+        "retokenize_seconds": db.migration_stats["seconds"],
+        "processes": db.migration_stats["processes"],
+    }
+
+def benchmark_migrations(n_messages: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Measure updating a database from version 2 to the current version, re-tokenizing in this
+    process and across a process per CPU, if there are several. See `benchmark_migration`.
+
+    Args:
+        n_messages (int): The number of messages learned in the version 2 database, e.g. a million.
+        seed (int, optional): The seed for `generate_chat_messages`. Defaults to 0.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The results of each number of processes.
+    """
+    results = {}
+    for processes in sorted({1, os.cpu_count() or 1}):
+        results[f"processes_{processes}"] = benchmark_migration(n_messages, seed, processes)
+        for path in glob.glob("MarkovChain_benchmark_migration*"):
+            os.remove(path)
+    return results
+
+def benchmark_suite(n_messages: int, n_generations: int, n_migration_messages: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Measure the bot end to end on synthetic chat messages, see `generate_chat_messages`: learning through 
+    `MarkovChain.message_handler`, generating with and without parameters, unlearning deleted messages, 
+    and updating a database from version 2.
+
+    Args:
+        n_messages (int): The number of messages to learn, e.g. from 10 thousand to 10 million.
+        n_generations (int): The number of generations to measure, and messages to unlearn.
+        n_migration_messages (int): The number of messages learned in the version 2 database.
+        seed (int, optional): The seed for generating chat messages. Defaults to 0.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The results of each benchmark.
+    """
+    bot = create_bot()
+    results = {"learn": benchmark_message_handler(bot, n_messages, seed)}
+    results.update(benchmark_generate(bot, n_generations, seed))
+    results.update(benchmark_unlearn(bot, min(n_generations, n_messages), n_messages, seed))
+    bot.db.close()
+    results["migration"] = benchmark_migration(n_migration_messages, seed)
+    return results
+
+def benchmark_tokenizer(n_messages: int, seed: int = 0, path: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Verify that `fast_tokenize` gives exactly the same tokens as `tokenize`, and measure the throughput of both.
+
+    The tokenizers are compared on synthetic chat messages, on adversarial messages that combine the edge cases
+    of the tokenizer, see `generate_adversarial_messages`, and optionally on a chat log. Mismatches are printed.
+
+    Args:
+        n_messages (int): The number of synthetic and of adversarial messages.
+        seed (int, optional): The seed for generating messages. Defaults to 0.
+        path (Optional[str], optional): A chat log with one message per line to compare on as well. Defaults to None.
+
+    Returns:
+        Dict[str, Dict[str, float]]: For each corpus, the number of messages and mismatches, 
+            and the messages per second of both tokenizers.
+    """
+    corpora = {
+        "chat": list(generate_chat_messages(n_messages, seed=seed)),
+        "adversarial": list(generate_adversarial_messages(n_messages, seed=seed)),
+    }
+    if path is not None:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            corpora["log"] = [line.strip() for line in f]
+
+    results = {}
+    for name, messages in corpora.items():
+        timings = {}
+        outputs = {}
+        for tokenizer in (tokenize, fast_tokenize):
+            start_t = time.perf_counter()
+            outputs[tokenizer] = [tokenizer(message) for message in messages]
+            timings[tokenizer] = time.perf_counter() - start_t
+        mismatches = [(message, expected, actual) for message, expected, actual
+                      in zip(messages, outputs[tokenize], outputs[fast_tokenize]) if expected != actual]
+        for message, expected, actual in mismatches[:10]:
+            print(f"Mismatch for {message!r}:\n  tokenize:      {expected!r}\n  fast_tokenize: {actual!r}")
+        results[name] = {
+            "messages": len(messages),
+            "mismatches": len(mismatches),
+            "tokenize_per_s": len(messages) / timings[tokenize],
+            "fast_tokenize_per_s": len(messages) / timings[fast_tokenize],
+            "speedup": timings[tokenize] / timings[fast_tokenize],
+        }
+    return results
+
+def benchmark_blacklist(n_messages: int, n_entries: int = 10000, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Compare checking the tokens of synthetic chat messages against a blacklist of `n_entries` words and
+    phrases with `Blacklist`, and against the list of words that was used before, which cannot match phrases.
+
+    90% of the entries are words from the rarer half of the vocabulary of `generate_chat_messages`,
+    and 10% are phrases of two or three of the 100 most common words, so only some messages match.
+    Verifies that `Blacklist` gives the same result as the list for the words only.
+
+    Args:
+        n_messages (int): The number of messages to check.
+        n_entries (int, optional): The number of entries of the blacklist. Defaults to 10000.
+        seed (int, optional): The seed for generating messages and entries. Defaults to 0.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The messages per second and share of matching messages of each
+            matcher, and the duration of compiling and updating the `Blacklist`.
+    """
+    rng = random.Random(seed)
+    messages = [fast_tokenize(message) for message in generate_chat_messages(n_messages, seed=seed)]
+    words = [f"word{i}" for i in rng.sample(range(10000, 20000), n_entries - n_entries // 10)]
+    phrases = [" ".join(f"word{i}" for i in rng.sample(range(100), rng.randint(2, 3))) for _ in range(n_entries // 10)]
+
+    def check_list(tokens: List[str]) -> bool:
+        for word in tokens:
+            if word.lower() in words:
+                return True
+        return False
+
+    results = {}
+    matches = {}
+    blacklists = {
+        "blacklist_words": Blacklist(words, fast_tokenize),
+        "blacklist": Blacklist(words + phrases, fast_tokenize),
+    }
+    compile_t = {}
+    for name, blacklist in blacklists.items():
+        start_t = time.perf_counter()
+        blacklist.compile()
+        compile_t[name] = time.perf_counter() - start_t
+    for name, check in [("list", check_list)] + [(name, blacklist.matches) for name, blacklist in blacklists.items()]:
+        start_t = time.perf_counter()
+        matches[name] = [check(tokens) for tokens in messages]
+        duration = time.perf_counter() - start_t
+        results[name] = {"messages_per_s": n_messages / duration, "matched": sum(matches[name]) / n_messages}
+    results["blacklist_words"]["mismatches"] = sum(a != b for a, b in zip(matches["list"], matches["blacklist_words"]))
+
+    blacklist = blacklists["blacklist"]
+    start_t = time.perf_counter()
+    blacklist.add("newword")
+    add_word_t = time.perf_counter()
+    blacklist.add("new phrase")
+    add_phrase_t = time.perf_counter()
+    blacklist.wait_rebuilt()
+    rebuilt_t = time.perf_counter()
+    blacklist.remove("new phrase")
+    remove_t = time.perf_counter()
+    blacklist.wait_rebuilt()
+    results["updates"] = {
+        "compile_ms": compile_t["blacklist"] * 1000,
+        "add_word_us": (add_word_t - start_t) * 1e6,
+        "add_phrase_us": (add_phrase_t - add_word_t) * 1e6,
+        "remove_phrase_us": (remove_t - rebuilt_t) * 1e6,
+        "background_rebuild_ms": (rebuilt_t - add_phrase_t) * 1000,
+    }
+    return results
+
+def benchmark_purge(n_messages: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Compare purging blacklisted words from a database learned from `n_messages` synthetic chat messages
+    with `Database.purge_now`, and with a DELETE over all rows, as the WordIndex table made unnecessary.
+
+    Purges a common word, a rare word, an emote and a phrase, each from a fresh copy of the database.
+    Verifies that both remove the same number of rows for the words, as the DELETE cannot match phrases.
+
+    Args:
+        n_messages (int): The number of messages to learn before purging.
+        seed (int, optional): The seed for generating messages. Defaults to 0.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The removed rows and the duration of both ways of purging, per purged term.
+    """
+    db = Database("#purge", journal_sync_interval=None)
+    learn_corpus(db, [words for words in (fast_tokenize(message) for message in generate_chat_messages(n_messages, seed=seed))
+                      if len(words) >= 2])
+    db.close()
+
+    results = {}
+    for name, entry in [("common_word", "word5"), ("rare_word", "word5000"), ("emote", "Kappa"), ("phrase", "word0 word1")]:
+        terms = Blacklist([entry], fast_tokenize).terms(entry)
+        db_name = f"MarkovChain_purge_{name}.db"
+        source, target = sqlite3.connect("MarkovChain_purge.db"), sqlite3.connect(db_name)
+        source.backup(target)
+        source.close()
+        target.close()
+
+        db = Database(f"#purge_{name}", journal_sync_interval=None)
+        stats = db.purge_now(terms)
+        db.close()
+        results[name] = {"rows": stats["rows"], "purge_ms": stats["seconds"] * 1000}
+
+        if len(terms[0]) == len(terms) == 1:
+            conn = sqlite3.connect(db_name.replace(f"_{name}", ""))
+            start_t = time.perf_counter()
+            rows = conn.execute(f"""
+                DELETE FROM MarkovGrammar
+                WHERE word1 IN {FOLDED_IDS} OR word2 IN {FOLDED_IDS} OR word3 IN {FOLDED_IDS};""", (entry.lower(),) * 3).rowcount
+            rows += conn.execute(f"DELETE FROM MarkovStart WHERE word1 IN {FOLDED_IDS} OR word2 IN {FOLDED_IDS};", (entry.lower(),) * 2).rowcount
+            results[name]["scan_ms"] = (time.perf_counter() - start_t) * 1000
+            results[name]["mismatches"] = abs(rows - stats["rows"])
+            conn.rollback()
+            conn.close()
+    return results
+
+def benchmark_metrics(n_messages: int, n_generations: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Measure the overhead of recording metrics, by learning and generating with metrics disabled and enabled.
+
+    Args:
+        n_messages (int): The number of messages to learn.
+        n_generations (int): The number of generations to measure.
+        seed (int, optional): The seed for generating chat messages. Defaults to 0.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The learning throughput and generation latency with metrics disabled and enabled,
+            the relative overhead, and the time it takes to render the metrics.
+    """
+    results = {}
+    for enabled in (False, True):
+        name = "enabled" if enabled else "disabled"
+        bot = create_bot(f"#benchmark_metrics_{name}", metrics=enabled)
+        results[f"learn_{name}"] = benchmark_message_handler(bot, n_messages, seed)
+        results[f"generate_{name}"] = benchmark_generate(bot, n_generations, seed)["generate"]
+        if enabled:
+            results["render"] = measure(bot.metrics.render, 100)
+            results["render"]["bytes"] = len(bot.metrics.render())
+        bot.db.close()
+    results["overhead"] = {
+        "learn_pct": 100 * (results["learn_disabled"]["messages_per_s"] / results["learn_enabled"]["messages_per_s"] - 1),
+        "generate_p50_pct": 100 * (results["generate_enabled"]["p50_us"] / results["generate_disabled"]["p50_us"] - 1),
+    }
+    return results
+
+# Starts the bot up to connecting in a new process, and prints the seconds spent on each step as JSON
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start_t = time.perf_counter()
+import MarkovChainBot
+timings = {"import_bot": time.perf_counter() - start_t}
+start_t = time.perf_counter()
+import nltk
+timings["import_nltk"] = time.perf_counter() - start_t
+start_t = time.perf_counter()
+import Tokenizer
+Tokenizer.load()
+timings["load_word_tokenizer"] = time.perf_counter() - start_t
+import Punkt
+path = Punkt.model_path(Punkt.DEFAULT_PATH)
+if os.path.isfile(path):
+    start_t = time.perf_counter()
+    Punkt.load_model(path)
+    timings["load_punkt_model"] = time.perf_counter() - start_t
+try:
+    from nltk.tokenize.punkt import PunktTokenizer
+    start_t = time.perf_counter()
+    PunktTokenizer("english")
+    timings["load_nltk_punkt_tab"] = time.perf_counter() - start_t
+except (ImportError, LookupError):
+    pass
+print(json.dumps(timings))
+"""
+
+def benchmark_startup(runs: int = 5) -> Dict[str, Dict[str, float]]:
+    """Measure how long starting the bot takes, from importing `MarkovChainBot` to loading the tokenizers,
+    which the bot does in the background while connecting, and break the import down by module.
+
+    Every run uses a new Python process, so nothing was imported or cached in memory yet.
+    Loading the sentence splitting model is only measured if it exists, and loading nltk's own
+    Punkt data for comparison only if that is installed.
+
+    Args:
+        runs (int, optional): The number of processes to measure. Defaults to 5.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The median number of milliseconds of each step, and of importing
+            each module that `MarkovChainBot` imports directly, according to `python -X importtime`.
+    """
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+    steps: Dict[str, List[float]] = {}
+    imports: Dict[str, List[float]] = {}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], stdout=subprocess.PIPE,
+                                universal_newlines=True, env=env, check=True).stdout
+        for step, seconds in json.loads(output).items():
+            steps.setdefault(step, []).append(seconds * 1000)
+
+        # Lines are "import time: {self} | {cumulative} | {name}", with the name indented by 2 spaces per level
+        lines = subprocess.run([sys.executable, "-X", "importtime", "-c", "import MarkovChainBot"], stderr=subprocess.PIPE,
+                               universal_newlines=True, env=env, check=True).stderr.splitlines()
+        children = []
+        for line in lines:
+            if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+                continue
+            _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+            if depth == 0:
+                if name.strip() == "MarkovChainBot":
+                    break
+                children = []
+            elif depth == 1:
+                children.append((name.strip(), int(cumulative_us) / 1000))
+        for name, milliseconds in children:
+            imports.setdefault(name, []).append(milliseconds)
+
+    slowest = sorted(imports.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:10]
+    return {
+        "startup_ms": {step: statistics.median(values) for step, values in steps.items()},
+        "imports_ms": {name: statistics.median(values) for name, values in slowest},
+    }
+
+def write_json(path: str, benchmark: str, args: Dict[str, Any], results: Dict[str, Dict[str, float]]) -> None:
+    """Write `results` to `path` as JSON, alongside what is needed to compare them with results of other commits.
+
+    Args:
+        path (str): The path of the JSON file.
+        benchmark (str): The name of the benchmark.
+        args (Dict[str, Any]): The command line arguments.
+        results (Dict[str, Dict[str, float]]): The results of the benchmark.
+    """
+    try:
+        commit: Optional[str] = subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+                                               cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    with open(path, "w") as f:
+        json.dump({
+            "benchmark": benchmark,
+            "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "args": args,
+            "results": results,
+        }, f, indent=4)
+
+def print_results(name: str, results: Dict[str, Dict[str, float]]) -> None:
+    print(f"{name}:")
+    for variant, stats in results.items():
+        print(f"  {variant:<20} " + "  ".join(f"{key}={value:10.2f}" for key, value in stats.items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the TwitchMarkovChain Database.")
+    parser.add_argument("benchmark", choices=["get_next", "learn", "sampling", "layout", "size", "compiled", "raid", "statements", "suite", "metrics", "tokenizer", "startup", "migration", "blacklist", "purge"], help="The benchmark to run.")
+    parser.add_argument("--messages", type=int, default=10000, help="The number of synthetic messages to learn.")
+    parser.add_argument("--lookups", type=int, default=10000, help="The number of lookups to measure.")
+    parser.add_argument("--vocabulary", type=int, default=30, help="The number of distinct words when learning.")
+    parser.add_argument("--transitions", type=int, default=5000, help="The number of next words to sample from.")
+    parser.add_argument("--samples", type=int, default=100000, help="The number of samples to draw.")
+    parser.add_argument("--repeat", type=float, default=0.5, help="The probability that a message repeats a recent message.")
+    parser.add_argument("--corpus", default=None, help="A chat log with one message per line to learn, instead of synthetic messages. Only used by \"size\" and \"tokenizer\".")
+    parser.add_argument("--migration-messages", type=int, default=5000, help="The number of messages in the database to update. Only used by \"suite\" and \"migration\".")
+    parser.add_argument("--blacklist-entries", type=int, default=10000, help="The number of words and phrases in the blacklist. Only used by \"blacklist\".")
+    parser.add_argument("--seed", type=int, default=0, help="The seed for synthetic chat messages. Only used by \"suite\", \"metrics\", \"tokenizer\", \"migration\", \"blacklist\" and \"purge\".")
+    parser.add_argument("--json", default=None, help="A file to write the results to as JSON, to compare them between commits.")
+    args = parser.parse_args()
+
+    # All database files are created in a temporary directory, and removed afterwards
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            if args.benchmark == "get_next":
+                results = benchmark_get_next(args.messages, args.lookups)
+            elif args.benchmark == "learn":
+                results = benchmark_learn(args.messages, args.vocabulary, args.repeat)
+            elif args.benchmark == "sampling":
+                results = benchmark_sampling(args.transitions, args.samples)
+            elif args.benchmark == "layout":
+                results = benchmark_layout(args.messages, args.lookups)
+            elif args.benchmark == "size":
+                corpus = load_corpus(os.path.join(cwd, args.corpus)) if args.corpus else generate_corpus(args.messages)
+                results = benchmark_size(corpus)
+            elif args.benchmark == "compiled":
+                results = benchmark_compiled(args.messages, args.lookups)
+            elif args.benchmark == "raid":
+                results = benchmark_raid(args.messages, args.lookups)
+            elif args.benchmark == "statements":
+                results = benchmark_statements(args.messages, args.lookups)
+            elif args.benchmark == "suite":
+                results = benchmark_suite(args.messages, args.lookups, args.migration_messages, args.seed)
+            elif args.benchmark == "tokenizer":
+                results = benchmark_tokenizer(args.messages, args.seed, os.path.join(cwd, args.corpus) if args.corpus else None)
+            elif args.benchmark == "metrics":
+                results = benchmark_metrics(args.messages, args.lookups, args.seed)
+            elif args.benchmark == "startup":
+                results = benchmark_startup()
+            elif args.benchmark == "migration":
+                results = benchmark_migrations(args.migration_messages, args.seed)
+            elif args.benchmark == "blacklist":
+                results = benchmark_blacklist(args.messages, args.blacklist_entries, args.seed)
+            elif args.benchmark == "purge":
+                results = benchmark_purge(args.messages, args.seed)
+        finally:
+            os.chdir(cwd)
+
+    print_results(args.benchmark, results)
+    if args.json:
+        write_json(args.json, args.benchmark, vars(args), results)
@@ -0,0 +1,311 @@
+import logging
+import threading
+from collections import Counter
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over tokens, which finds whether any of a set of phrases occurs
+    in a sequence of tokens in a single pass, regardless of the number of phrases.
+
+    The automaton is immutable once built, so it can be used from any thread while a new one is built.
+    """
+    __slots__ = ("goto", "fail", "output")
+
+    def __init__(self, phrases: Iterable[Tuple[str, ...]]) -> None:
+        """Build the automaton.
+
+        Args:
+            phrases (Iterable[Tuple[str, ...]]): The phrases to find, as tuples of lowercase tokens.
+        """
+        # The transitions, failure links and whether a phrase ends, per node. Node 0 is the root.
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[bool] = [False]
+        for phrase in phrases:
+            node = 0
+            for token in phrase:
+                child = self.goto[node].get(token)
+                if child is None:
+                    child = self.goto[node][token] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(False)
+                node = child
+            self.output[node] = True
+
+        # Breadth first, so the failure link of every node points to a node that was already linked.
+        # The children of the root fail to the root.
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for token, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(token, 0)
+                # A phrase also ends wherever a phrase that it ends with ends
+                self.output[child] = self.output[child] or self.output[self.fail[child]]
+                queue.append(child)
+
+    def search(self, tokens: Iterable[str]) -> bool:
+        """Check whether any phrase occurs in `tokens`.
+
+        Args:
+            tokens (Iterable[str]): The lowercase tokens to search.
+
+        Returns:
+            bool: True if any phrase occurs in `tokens`.
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for token in tokens:
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            if output[node]:
+                return True
+        return False
+
+class Blacklist:
+    """
+    The banned words and phrases of blacklist.txt, matched against the tokens of messages case-insensitively.
+
+    Every entry is split into tokens exactly like messages, e.g. "can't stop" into ("ca", "n't", "stop").
+    Entries of one token are looked up in a set, and entries of several tokens are found with a
+    `PhraseMatcher`, so checking a message takes the same time for 10 entries as for 10 thousand.
+    An entry also matches a token that is equal to it as a whole, like before entries were tokenized,
+    e.g. "<start>".
+
+    Adding or removing an entry only tokenizes that entry, and takes the same time for any size of blacklist.
+    The words and phrases are counted per entry, so removing an entry keeps those that other entries share.
+    Whenever they change, the set of words and the `PhraseMatcher` are rebuilt on a background thread from 
+    the known tokens. Until then, the words and phrases of added entries are checked separately, and 
+    those of removed entries still match. The words, the `PhraseMatcher` and the added entries are 
+    replaced as one tuple, so every message is checked against one consistent version of the blacklist.
+    Entries are tokenized when the first message is checked, or when `compile` is called.
+    """
+
+    def __init__(self, entries: Iterable[str], tokenize: Callable[[str], List[str]]) -> None:
+        """Initialize the blacklist, without tokenizing the entries yet.
+
+        Args:
+            entries (Iterable[str]): The banned words and phrases, e.g. the lines of blacklist.txt.
+            tokenize (Callable[[str], List[str]]): Splits a message into tokens, e.g. `Tokenizer.fast_tokenize`.
+        """
+        self.tokenize = tokenize
+        # Maps the lowercase entries to the entries in their original order and case, to write them back
+        self._entries: Dict[str, str] = {}
+        for entry in entries:
+            if entry and entry.lower() not in self._entries:
+                self._entries[entry.lower()] = entry
+
+        self._lock = threading.Lock()
+        self._compiled = False
+        # Maps the lowercase entries to their words and phrase, so removing an entry does not tokenize it again
+        self._tokens: Dict[str, Tuple[FrozenSet[str], Optional[Tuple[str, ...]]]] = {}
+        # The number of entries with each word and phrase
+        self._word_counts: Counter = Counter()
+        self._phrase_counts: Counter = Counter()
+        # The lowercase entries and tokens of entries of one token, the `PhraseMatcher` of the phrases, and
+        # the version, new words and new phrase of every entry that was added since they started building
+        self._state: Tuple[FrozenSet[str], Optional[PhraseMatcher], Tuple[Tuple[int, FrozenSet[str], Optional[Tuple[str, ...]]], ...]] = (frozenset(), None, ())
+        # Incremented whenever the words or phrases change
+        self._version = 0
+        # The thread rebuilding the words and `PhraseMatcher`, if any
+        self._rebuilding: Optional[threading.Thread] = None
+
+    def __contains__(self, entry: str) -> bool:
+        return entry.lower() in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._entries.values()))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def entries(self) -> List[str]:
+        """The banned words and phrases, in their original order and case."""
+        return list(self._entries.values())
+
+    def compile(self) -> None:
+        """Tokenize all entries, and build the `PhraseMatcher`, if that was not done yet."""
+        with self._lock:
+            if self._compiled:
+                return
+            for key, entry in self._entries.items():
+                self._add_tokens(key, entry)
+            self._state = (frozenset(self._word_counts), PhraseMatcher(self._phrase_counts) if self._phrase_counts else None, ())
+            self._compiled = True
+            logger.debug(f"Compiled the blacklist of {len(self._word_counts)} words and {len(self._phrase_counts)} phrases.")
+
+    def _tokenize_entry(self, entry: str) -> Tuple[FrozenSet[str], Optional[Tuple[str, ...]]]:
+        """Get the words of `entry`, and its tokens if it is a phrase.
+
+        Args:
+            entry (str): The word or phrase.
+
+        Returns:
+            Tuple[FrozenSet[str], Optional[Tuple[str, ...]]]: The lowercase entry, and its token if it is one token,
+                and the lowercase tokens if it is a phrase, or None otherwise.
+        """
+        tokens = tuple(token.lower() for token in self.tokenize(entry))
+        if len(tokens) == 1:
+            return frozenset((entry.lower(), tokens[0])), None
+        return frozenset((entry.lower(),)), tokens or None
+
+    def _add_tokens(self, key: str, entry: str) -> Tuple[FrozenSet[str], Optional[Tuple[str, ...]]]:
+        """Tokenize `entry` and count its words and phrase. Must hold `self._lock`.
+
+        Args:
+            key (str): The lowercase entry.
+            entry (str): The entry to add.
+
+        Returns:
+            Tuple[FrozenSet[str], Optional[Tuple[str, ...]]]: The words and phrase that no other entry has.
+        """
+        words, phrase = self._tokens[key] = self._tokenize_entry(entry)
+        self._word_counts.update(words)
+        if phrase is not None:
+            self._phrase_counts[phrase] += 1
+        return (frozenset(word for word in words if self._word_counts[word] == 1),
+                phrase if phrase is not None and self._phrase_counts[phrase] == 1 else None)
+
+    def _remove_tokens(self, key: str) -> Tuple[FrozenSet[str], Optional[Tuple[str, ...]]]:
+        """Stop counting the words and phrase of the entry `key`. Must hold `self._lock`.
+
+        Args:
+            key (str): The lowercase entry.
+
+        Returns:
+            Tuple[FrozenSet[str], Optional[Tuple[str, ...]]]: The words and phrase that no other entry has.
+        """
+        words, phrase = self._tokens.pop(key)
+        self._word_counts.subtract(words)
+        removed_words = frozenset(word for word in words if self._word_counts[word] <= 0)
+        for word in removed_words:
+            del self._word_counts[word]
+        if phrase is not None:
+            self._phrase_counts[phrase] -= 1
+            if self._phrase_counts[phrase] <= 0:
+                del self._phrase_counts[phrase]
+                return removed_words, phrase
+        return removed_words, None
+
+    def _schedule_rebuild(self) -> None:
+        """Rebuild the words and `PhraseMatcher` on a background thread, unless one is already rebuilding them. Must hold `self._lock`."""
+        self._version += 1
+        if self._rebuilding is None:
+            self._rebuilding = threading.Thread(target=self._rebuild, name="BlacklistRebuild", daemon=True)
+            self._rebuilding.start()
+
+    def _rebuild(self) -> None:
+        """Build the words and `PhraseMatcher` of the current entries until they include every change, replacing them after each."""
+        while True:
+            with self._lock:
+                version = self._version
+                words = frozenset(self._word_counts)
+                phrases = list(self._phrase_counts)
+            matcher = PhraseMatcher(phrases) if phrases else None
+            with self._lock:
+                added = tuple(entry for entry in self._state[2] if entry[0] > version)
+                self._state = (words, matcher, added)
+                if self._version == version:
+                    self._rebuilding = None
+                    logger.debug(f"Rebuilt the blacklist of {len(words)} words and {len(phrases)} phrases.")
+                    return
+
+    def wait_rebuilt(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the words and `PhraseMatcher` are rebuilt after the entries changed, e.g. to measure how long that takes.
+
+        Args:
+            timeout (Optional[float], optional): The maximum number of seconds to wait. Defaults to None.
+
+        Returns:
+            bool: True if the words and `PhraseMatcher` include every change.
+        """
+        thread = self._rebuilding
+        if thread is not None:
+            thread.join(timeout)
+        return self._rebuilding is None
+
+    def add(self, entry: str) -> bool:
+        """Add a banned word or phrase.
+
+        Args:
+            entry (str): The word or phrase, e.g. "word" or "some phrase".
+
+        Returns:
+            bool: False if the entry was already in the blacklist, True otherwise.
+        """
+        if not entry or entry in self:
+            return False
+        with self._lock:
+            key = entry.lower()
+            self._entries[key] = entry
+            if self._compiled:
+                new_words, new_phrase = self._add_tokens(key, entry)
+                if new_words or new_phrase is not None:
+                    self._schedule_rebuild()
+                    words, matcher, added = self._state
+                    self._state = (words, matcher, added + ((self._version, new_words, new_phrase),))
+        return True
+
+    def remove(self, entry: str) -> None:
+        """Remove a banned word or phrase, ignoring case.
+
+        Args:
+            entry (str): The word or phrase.
+
+        Raises:
+            ValueError: If the entry is not in the blacklist.
+        """
+        if entry not in self:
+            raise ValueError(f"{entry!r} is not in the blacklist.")
+        with self._lock:
+            key = entry.lower()
+            del self._entries[key]
+            # The entry keeps matching until the words and `PhraseMatcher` are rebuilt
+            if self._compiled:
+                removed_words, removed_phrase = self._remove_tokens(key)
+                if removed_words or removed_phrase is not None:
+                    self._schedule_rebuild()
+
+    def terms(self, entry: str) -> List[Tuple[str, ...]]:
+        """Get the lowercase token sequences that `entry` matches, e.g. to remove them from the Database.
+
+        Args:
+            entry (str): The word or phrase, e.g. "Kappa" or "can't stop".
+
+        Returns:
+            List[Tuple[str, ...]]: The sequences, e.g. [("kappa",)] or [("can't stop",), ("ca", "n't", "stop")].
+        """
+        words, phrase = self._tokenize_entry(entry)
+        return [(word,) for word in sorted(words)] + ([phrase] if phrase is not None else [])
+
+    def matches(self, tokens: Sequence[str]) -> bool:
+        """Check whether any banned word or phrase occurs in `tokens`.
+
+        Args:
+            tokens (Sequence[str]): The tokens of a message, e.g. ('Hello', ',', 'Tom').
+
+        Returns:
+            bool: True if any banned word or phrase occurs in `tokens`.
+        """
+        if not self._compiled:
+            self.compile()
+        words, matcher, added = self._state
+        lowered = [token.lower() for token in tokens]
+        if not words.isdisjoint(lowered):
+            return True
+        if matcher is not None and matcher.search(lowered):
+            return True
+        # Entries that were added since the words and matcher started building
+        for _version, added_words, phrase in added:
+            if not added_words.isdisjoint(lowered):
+                return True
+            if phrase is not None and any(tuple(lowered[i:i + len(phrase)]) == phrase for i in range(len(lowered) - len(phrase) + 1)):
+                return True
+        return False
@@ -0,0 +1,110 @@
+import threading, logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """
+    Thread-safe Least Recently Used cache, bounded by both the number of entries
+    and the approximate number of bytes used by the cached values.
+
+    Invalidating keys increments `generation`. Values that were read from the database before
+    an invalidation are then refused by `put`, so a slow reader can never store outdated values.
+    """
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # Maps keys to (value, size) tuples, ordered from least to most recently used
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get the value for `key`, and mark it as most recently used.
+
+        Args:
+            key (Hashable): The key to look up.
+
+        Returns:
+            Optional[Any]: The cached value, or None if `key` is not cached.
+        """
+        with self._lock:
+            try:
+                value, _size = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: int, generation: int) -> None:
+        """Cache `value` for `key`, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (Hashable): The key to cache the value for.
+            value (Any): The value to cache. Must not be None.
+            size (int): The approximate size of `value` in bytes.
+            generation (int): The value of `self.generation` from before `value` was read.
+                If keys were invalidated since, `value` might be outdated, and is not cached.
+        """
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._data:
+                self.bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self.bytes += size
+            while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+                _key, (_value, evicted_size) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, keys: Iterable[Hashable]) -> None:
+        """Remove `keys` from the cache, as their values have changed.
+
+        Args:
+            keys (Iterable[Hashable]): The keys to remove.
+        """
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                entry = self._data.pop(key, None)
+                if entry is not None:
+                    self.bytes -= entry[1]
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Get the counters and current size of the cache.
+
+        Returns:
+            Dict[str, float]: The hits, misses, hit rate, evictions, invalidations, entries and bytes of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._data),
+                "bytes": self.bytes,
+            }
@@ -0,0 +1,458 @@
+import argparse
+import logging
+import mmap
+import os
+import random
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from Vocabulary import NOCASE_TABLE
+
+logger = logging.getLogger(__name__)
+
+# The file starts with this header: magic bytes, format version, a byte order marker and the ID of "<END>",
+# followed by the (offset, length) of every section, in the order of SECTIONS
+MAGIC = b"MKVMODEL"
+FORMAT_VERSION = 1
+BYTE_ORDER_MARK = 0x01020304
+NO_WORD = 0xFFFFFFFF
+
+# Every section is an array of unsigned integers with this typecode, i.e. "B" = 1, "I" = 4 and "Q" = 8 bytes
+SECTIONS: List[Tuple[str, str]] = [
+    # Words, in the order of their IDs, as UTF-8 in "words", where word i is words[word_offsets[i]:word_offsets[i + 1]]
+    ("word_offsets", "Q"),
+    ("words", "B"),
+    # Distinct case-folded words, sorted by their UTF-8 bytes. The index of a case-folded word is its "folded ID"
+    ("folded_offsets", "Q"),
+    ("folded", "B"),
+    # Starts of sentences, grouped by the folded ID of their first word. The starts with folded ID start_keys[i]
+    # are the entries start_offsets[i] up to start_offsets[i + 1] of start_word1, start_word2 and start_cumulative
+    ("start_keys", "I"),
+    ("start_offsets", "Q"),
+    ("start_word1", "I"),
+    ("start_word2", "I"),
+    ("start_cumulative", "Q"),
+    # For each folded ID of a first word in MarkovGrammar, the second words with their summed counts, excluding "<END>"
+    ("single_keys", "I"),
+    ("single_offsets", "Q"),
+    ("single_words", "I"),
+    ("single_cumulative", "Q"),
+    # For each (folded ID << 32 | folded ID) key of a first and second word in MarkovGrammar, the third words,
+    # ordered as in `TransitionSampler`: normal words up to grammar_initial[i], variants of "<END>", and "<END>" itself
+    ("grammar_keys", "Q"),
+    ("grammar_offsets", "Q"),
+    ("grammar_initial", "Q"),
+    ("grammar_words", "I"),
+    ("grammar_cumulative", "Q"),
+]
+HEADER = struct.Struct("=8sIII" + "QQ" * len(SECTIONS))
+
+def compile_model(db_path: str, model_path: str) -> Dict[str, int]:
+    """Compile the database at `db_path` into the binary model format read by `CompiledModel`.
+
+    All tables are read in one transaction, so the model is a consistent snapshot, even if the bot is
+    learning at the same time. The model is written to a temporary file first, which then atomically
+    replaces `model_path`. A `CompiledModel` reading `model_path` picks up the new file on its next reload,
+    while generations that are still using the old file continue unaffected.
+
+    Cumulative counts span each entire section, so the counts of one group of entries are a range
+    within them, and any weighted pick is a binary search. The cumulative counts for the next words
+    after a given first and second word are the same as in `TransitionSampler`.
+
+    Args:
+        db_path (str): The path of the database, e.g. "MarkovChain_cubiedev.db". Must be updated to version 7.
+        model_path (str): The path of the compiled model, e.g. "MarkovChain_cubiedev.model".
+
+    Returns:
+        Dict[str, int]: The number of words, starts, 3-gram keys and 3-grams, and the size of the model in bytes.
+    """
+    sections = {name: array(typecode) for name, typecode in SECTIONS}
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, isolation_level=None)
+    try:
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        conn.execute("begin")
+        version = conn.execute("SELECT version FROM Version;").fetchone()[0]
+        if version < 7:
+            raise ValueError(f"{db_path!r} has version {version}, while version 7 is required. Start the bot once to update it.")
+
+        # Compiled word IDs are assigned in order of the case-folded word, such that folded IDs increase alongside them
+        vocabulary = conn.execute("SELECT id, word, word_folded FROM Vocabulary ORDER BY word_folded, word;").fetchall()
+        mapping = []
+        end_id = NO_WORD
+        folded_id = -1
+        previous_folded = None
+        words = bytearray()
+        folded = bytearray()
+        for word_id, (db_id, word, word_folded) in enumerate(vocabulary):
+            if word_folded != previous_folded:
+                previous_folded = word_folded
+                folded_id += 1
+                sections["folded_offsets"].append(len(folded))
+                folded += word_folded.encode("utf-8")
+            sections["word_offsets"].append(len(words))
+            words += word.encode("utf-8")
+            # 0 for normal words, 1 for variants of "<END>" with different casing, and 2 for "<END>" itself
+            kind = 2 if word == "<END>" else 1 if word_folded == "<end>" else 0
+            if kind == 2:
+                end_id = word_id
+            mapping.append((db_id, word_id, folded_id, kind))
+        sections["word_offsets"].append(len(words))
+        sections["folded_offsets"].append(len(folded))
+        sections["words"].frombytes(words)
+        sections["folded"].frombytes(folded)
+        del vocabulary, words, folded
+
+        conn.execute("""CREATE TEMP TABLE CompiledWords (
+            id INTEGER PRIMARY KEY, word INTEGER, folded INTEGER, kind INTEGER);""")
+        conn.executemany("INSERT INTO temp.CompiledWords (id, word, folded, kind) VALUES (?, ?, ?, ?);", mapping)
+        del mapping
+
+        def add_grouped(prefix: str, rows, columns: Tuple[str, ...]) -> None:
+            # Append rows of (key, *columns, count), ordered by key, to the sections starting with `prefix`
+            keys, offsets, cumulative = sections[f"{prefix}_keys"], sections[f"{prefix}_offsets"], sections[f"{prefix}_cumulative"]
+            total = 0
+            for key, *values, count in rows:
+                if not keys or keys[-1] != key:
+                    keys.append(key)
+                    offsets.append(len(cumulative))
+                for column, value in zip(columns, values):
+                    sections[column].append(value)
+                total += count
+                cumulative.append(total)
+            offsets.append(len(cumulative))
+
+        add_grouped("start", conn.execute("""
+            SELECT c1.folded, c1.word, c2.word, s.count FROM MarkovStart s
+            JOIN temp.CompiledWords c1 ON c1.id = s.word1
+            JOIN temp.CompiledWords c2 ON c2.id = s.word2
+            WHERE s.count > 0
+            ORDER BY c1.folded, c1.word, c2.word;"""), ("start_word1", "start_word2"))
+
+        add_grouped("single", conn.execute("""
+            SELECT c1.folded, c2.word, SUM(g.count) FROM MarkovGrammar g
+            JOIN temp.CompiledWords c1 ON c1.id = g.word1
+            JOIN temp.CompiledWords c2 ON c2.id = g.word2
+            WHERE g.count > 0 AND c2.kind = 0
+            GROUP BY c1.folded, c2.word
+            ORDER BY c1.folded, c2.word;"""), ("single_words",))
+
+        keys, offsets, initial = sections["grammar_keys"], sections["grammar_offsets"], sections["grammar_initial"]
+        next_words, cumulative = sections["grammar_words"], sections["grammar_cumulative"]
+        total = 0
+        for key, word, kind, count in conn.execute("""
+                SELECT c1.folded << 32 | c2.folded, c3.word, c3.kind, g.count FROM MarkovGrammar g
+                JOIN temp.CompiledWords c1 ON c1.id = g.word1
+                JOIN temp.CompiledWords c2 ON c2.id = g.word2
+                JOIN temp.CompiledWords c3 ON c3.id = g.word3
+                WHERE g.count > 0
+                ORDER BY c1.folded, c2.folded, c3.kind, c3.word;"""):
+            if not keys or keys[-1] != key:
+                # The previous key only has normal words
+                if len(initial) < len(keys):
+                    initial.append(len(cumulative))
+                keys.append(key)
+                offsets.append(len(cumulative))
+            # The first variant of "<END>" marks the end of the normal words
+            if kind > 0 and len(initial) < len(keys):
+                initial.append(len(cumulative))
+            next_words.append(word)
+            total += count
+            cumulative.append(total)
+        if len(initial) < len(keys):
+            initial.append(len(cumulative))
+        offsets.append(len(cumulative))
+        conn.execute("commit")
+    finally:
+        conn.close()
+
+    # Write the header and the sections, each aligned to 8 bytes, to a temporary file that replaces the model at once
+    positions = []
+    position = HEADER.size
+    for name, _typecode in SECTIONS:
+        position += -position % 8
+        positions += [position, len(sections[name])]
+        position += len(sections[name]) * sections[name].itemsize
+
+    tmp_path = f"{model_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER_MARK, end_id, *positions))
+            for name, _typecode in SECTIONS:
+                f.write(b"\0" * (-f.tell() % 8))
+                sections[name].tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, model_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return {
+        "words": len(sections["word_offsets"]) - 1,
+        "starts": len(sections["start_cumulative"]),
+        "keys": len(sections["grammar_keys"]),
+        "ngrams": len(sections["grammar_cumulative"]),
+        "bytes": position,
+    }
+
+class CompiledModel:
+    """
+    Read-only model for generating, backed by a file created by `compile_model` that is memory-mapped.
+    Exposes the same methods for generating as `Database`, with the same case-insensitive behaviour.
+
+    Opening a model does not parse or load anything besides the header: all lookups are binary searches
+    directly on the mapped file. As a result, several bot or API processes reading the same model
+    share a single copy of it in the page cache of the operating system.
+
+    Every `reload_interval` seconds, the model file is checked for whether it was replaced by a new
+    compilation, in which case the new file is mapped. Generations that already started on the old
+    file finish using it. Note that replacing a file that is mapped requires POSIX semantics, so on
+    Windows, recompiling fails while the model is in use.
+
+    Unlike `Database`, the model does not reflect what was learned after it was compiled.
+    """
+    def __init__(self, path: str, reload_interval: float = 60) -> None:
+        """Map the model at `path`.
+
+        Args:
+            path (str): The path of the compiled model, e.g. "MarkovChain_cubiedev.model".
+            reload_interval (float, optional): The number of seconds between checks whether the model
+                was recompiled. Defaults to 60.
+
+        Raises:
+            ValueError: If `path` is not a compiled model that can be read on this machine.
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self._reload_lock = threading.Lock()
+        self._next_reload_t = time.monotonic() + reload_interval
+        self._load()
+
+    def _load(self) -> None:
+        """Map the file at `self.path`, and replace the sections in use with those of the mapped file."""
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, byte_order_mark, end_id, *positions = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{self.path!r} is not a compiled model with format version {FORMAT_VERSION}.")
+        if byte_order_mark != BYTE_ORDER_MARK:
+            raise ValueError(f"{self.path!r} was compiled on a machine with a different byte order than {sys.byteorder}.")
+
+        view = memoryview(mapped)
+        sections = {}
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, length = positions[2 * i], positions[2 * i + 1]
+            itemsize = array(typecode).itemsize
+            sections[name] = view[offset:offset + length * itemsize].cast(typecode)
+
+        # All state is replaced by a single assignment, so concurrent generations use either the old or the new file
+        self._stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self._model = (sections, end_id)
+        logger.info(f"Loaded the compiled model {self.path!r} with {len(sections['word_offsets']) - 1} words "
+                    f"and {len(sections['grammar_cumulative'])} 3-grams.")
+
+    def reload_if_changed(self) -> bool:
+        """Map the model again if the file was replaced by a new compilation.
+
+        Returns:
+            bool: True if the model was reloaded.
+        """
+        with self._reload_lock:
+            self._next_reload_t = time.monotonic() + self.reload_interval
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                logger.warning(f"The compiled model {self.path!r} no longer exists. Continuing with the previous version.")
+                return False
+            if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self._stat:
+                return False
+            self._load()
+            return True
+
+    def _sections(self) -> Tuple[Dict[str, memoryview], int]:
+        """Get the sections of the current model and the ID of "<END>", after reloading the model if it is due."""
+        if time.monotonic() >= self._next_reload_t:
+            try:
+                self.reload_if_changed()
+            except (OSError, ValueError) as error:
+                logger.warning(f"[{error.__class__.__name__}: {error}] upon reloading the compiled model. Continuing with the previous version.")
+        return self._model
+
+    @staticmethod
+    def _word(sections: Dict[str, memoryview], word_id: int) -> str:
+        offsets = sections["word_offsets"]
+        return sections["words"][offsets[word_id]:offsets[word_id + 1]].tobytes().decode("utf-8")
+
+    @staticmethod
+    def _folded_id(sections: Dict[str, memoryview], word: str) -> Optional[int]:
+        # Binary search over the sorted case-folded words, comparing their UTF-8 bytes
+        target = word.translate(NOCASE_TABLE).encode("utf-8")
+        offsets, folded = sections["folded_offsets"], sections["folded"]
+        low, high = 0, len(offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if folded[offsets[middle]:offsets[middle + 1]].tobytes() < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(offsets) - 1 and folded[offsets[low]:offsets[low + 1]].tobytes() == target:
+            return low
+        return None
+
+    @staticmethod
+    def _find(keys: memoryview, key: int) -> Optional[int]:
+        # The index of `key` in the sorted `keys`, if any
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return None
+        return i
+
+    @staticmethod
+    def _pick(cumulative: memoryview, low: int, high: int) -> Optional[int]:
+        # Pick an entry in [low, high) with its count as the weight
+        base = cumulative[low - 1] if low > 0 else 0
+        if high <= low or cumulative[high - 1] <= base:
+            return None
+        value = base + random.random() * (cumulative[high - 1] - base)
+        # Bounding the search protects against floating point rounding of `value`
+        return bisect_right(cumulative, value, low, high - 1)
+
+    def get_next(self, index: int, words: List[str]) -> Optional[str]:
+        """Generate the next word in the sentence using learned data, given the previous `key_length` words.
+
+        Args:
+            index (int): The index of this new word in the sentence.
+            words (List[str]): The previous 2 words.
+
+        Returns:
+            Optional[str]: The next word in the sentence, generated given the learned data.
+        """
+        return self._sample(index, words, initial=False)
+
+    def get_next_initial(self, index: int, words: List[str]) -> Optional[str]:
+        """Generate the next word in the sentence using learned data, given the previous `key_length` words.
+
+        Similar to `get_next`, with the exception that it cannot immediately generate "<END>"
+
+        Args:
+            index (int): The index of this new word in the sentence.
+            words (List[str]): The previous 2 words.
+
+        Returns:
+            Optional[str]: The next word in the sentence, generated given the learned data.
+        """
+        return self._sample(index, words, initial=True)
+
+    def _sample(self, index: int, words: List[str], initial: bool) -> Optional[str]:
+        """Sample the next word exactly like `TransitionSampler.sample`, on the mapped cumulative counts."""
+        sections, end_id = self._sections()
+        first, second = self._folded_id(sections, words[0]), self._folded_id(sections, words[1])
+        if first is None or second is None:
+            return None
+        i = self._find(sections["grammar_keys"], first << 32 | second)
+        if i is None:
+            return None
+        low, high = sections["grammar_offsets"][i], sections["grammar_offsets"][i + 1]
+        next_words, cumulative = sections["grammar_words"], sections["grammar_cumulative"]
+
+        if initial:
+            j = self._pick(cumulative, low, sections["grammar_initial"][i])
+            return None if j is None else self._word(sections, next_words[j])
+
+        # "<END>" itself is the last entry, and its weight depends on `index`
+        base = cumulative[low - 1] if low > 0 else 0
+        end = high - 1 if next_words[high - 1] == end_id else high
+        total = (cumulative[end - 1] if end > low else base) - base
+        end_weight = (cumulative[high - 1] - base - total) * ((index + 1) / 15)
+        if total + end_weight <= 0:
+            return None
+        value = random.random() * (total + end_weight)
+        if end < high and value >= total:
+            return "<END>"
+        return self._word(sections, next_words[bisect_right(cumulative, base + value, low, end - 1)])
+
+    def get_next_single_initial(self, index: int, word: str) -> Optional[List[str]]:
+        """Generate the next word in the sentence using learned data, given the previous word.
+
+        Args:
+            index (int): The index of this new word in the sentence.
+            word (str): The previous word.
+
+        Returns:
+            Optional[List[str]]: The previous and newly generated word in the sentence as a list, generated given the learned data.
+                So, the previous word is taken directly the input of this method, and the second word is generated.
+        """
+        sections, _end_id = self._sections()
+        folded_id = self._folded_id(sections, word)
+        i = None if folded_id is None else self._find(sections["single_keys"], folded_id)
+        if i is None:
+            return None
+        offsets = sections["single_offsets"]
+        j = self._pick(sections["single_cumulative"], offsets[i], offsets[i + 1])
+        return None if j is None else [word, self._word(sections, sections["single_words"][j])]
+
+    def get_next_single_start(self, word: str) -> Optional[List[str]]:
+        """Generate the second word in the sentence using learned data, given the very first word in the sentence.
+
+        Args:
+            word (str): The first word in the sentence.
+
+        Returns:
+            Optional[List[str]]: The first and second word in the sentence as a list, generated given the learned data.
+                So, the first word is taken directly the input of this method, and the second word is generated.
+        """
+        sections, _end_id = self._sections()
+        folded_id = self._folded_id(sections, word)
+        i = None if folded_id is None else self._find(sections["start_keys"], folded_id)
+        if i is None:
+            return None
+        offsets = sections["start_offsets"]
+        j = self._pick(sections["start_cumulative"], offsets[i], offsets[i + 1])
+        return None if j is None else [word, self._word(sections, sections["start_word2"][j])]
+
+    def get_start(self) -> List[str]:
+        """Get a list of two words that mark as the start of a sentence, with the counts of the starts as weights.
+
+        Returns:
+            List[str]: A list of two starting words, such as ["I", "am"].
+        """
+        sections, _end_id = self._sections()
+        i = self._pick(sections["start_cumulative"], 0, len(sections["start_cumulative"]))
+        if i is None:
+            return []
+        return [self._word(sections, sections["start_word1"][i]), self._word(sections, sections["start_word2"][i])]
+
+if __name__ == "__main__":
+    from Database import Database
+    from Settings import Settings
+    from Log import Log
+    Log(__file__)
+
+    parser = argparse.ArgumentParser(description="Compile the database of a channel into a read-only model that is memory-mapped for generating. "
+                                                 "See \"CompiledModelPath\" in settings.json.")
+    parser.add_argument("--channel", default=None, help="The channel to compile. Defaults to \"Channel\" from settings.json.")
+    parser.add_argument("--output", default=None, help="The path of the compiled model. Defaults to MarkovChain_{channel}.model.")
+    parser.add_argument("--interval", type=float, default=None, help="Recompile every this many seconds, instead of once.")
+    args = parser.parse_args()
+
+    channel = args.channel or Settings.get_channel()
+    # Ensures the database is updated to the newest version
+    db = Database(channel)
+    db.close()
+    output = args.output or db.db_name[:-len(".db")] + ".model"
+    while True:
+        start_t = time.perf_counter()
+        stats = compile_model(db.db_name, output)
+        logger.info(f"Compiled {db.db_name!r} into {output!r} in {time.perf_counter() - start_t:.2f}s: "
+                    f"{stats['words']} words, {stats['starts']} starts, {stats['ngrams']} 3-grams, {stats['bytes']} bytes.")
+        if args.interval is None:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,88 @@
+import random
+from itertools import accumulate
+from typing import Iterator, List
+
+# Emotes that chat messages are sprinkled with, and which are often spammed on their own
+EMOTES = ["Kappa", "PogChamp", "LUL", "KEKW", "monkaS", "OMEGALUL", "Pog", "PepeHands", "4Head", "BibleThump", "Kreygasm", "<3"]
+# Punctuation that chat messages are sprinkled with, attached to the preceding word
+PUNCTUATION = [",", ".", "!", "?", "...", "!!", "?!", ":)", "'s", "'m"]
+# Fragments that adversarial messages are built from, covering every rule of the tokenizer: quotes, clitics,
+# contractions, emoticons, punctuation, digits, unusual whitespace and characters that match others ignoring case
+TOKENIZER_FRAGMENTS = [
+    "a", "I", "T", "s", "m", "d", "t", "n", "x", "word", "Kappa", "LUL", "@user", "#tag", "_", "3", "3,36", "1:30", "$5", "3.88", "8",
+    "cannot", "CanNot", "gimme", "gonna", "GOTTA", "lemme", "wanna", "more'n", "d'ye", "'tis", "'Twas", "'twas", "'tİs", "'twaſ", "gİmme", "WANNA",
+    "don't", "DON'T", "Don'T", "can't", "it's", "IT'S", "I'm", "we'll", "WE'LL", "you're", "I've", "he'd", "rock'n'roll", "'em", "y'all", "o'",
+    "'", "''", "'''", '"', "`", "``", "’", "‘", "“", "”", "„", "«", "»", "(", ")", "[", "]", "{", "}", "<", ">",
+    ".", "..", "...", ",", ",,", ":", ";", "#", "$", "%", "&", "?", "!", "*", "-", "--", "—", "–",
+    ":)", ":-(", ";p", "<3", "8D", "D:", "xD", ":P", ">:(", "=]", "ſ", "K", "İ", "ı", "é", "ß", "ﬁ",
+    " ", "  ", "\t", "\n", "\r", "\x0b", "\x1c", "\u00a0", "\u2009", "\u3000",
+]
+
+def generate_corpus(n_messages: int, vocabulary_size: int = 5000, repeat_probability: float = 0, seed: int = 0) -> List[List[str]]:
+    """Generate a synthetic corpus of tokenized chat messages, with Zipf-distributed words.
+
+    Args:
+        n_messages (int): The number of messages to generate.
+        vocabulary_size (int, optional): The number of distinct words. Defaults to 5000.
+        repeat_probability (float, optional): The probability that a message repeats one of the 
+            previous 50 messages, like copypastas and emote spam. Defaults to 0.
+        seed (int, optional): The seed for the random generator. Defaults to 0.
+
+    Returns:
+        List[List[str]]: The list of tokenized messages.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(vocabulary_size)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    corpus = []
+    for _ in range(n_messages):
+        if corpus and rng.random() < repeat_probability:
+            corpus.append(rng.choice(corpus[-50:]))
+        else:
+            corpus.append(rng.choices(vocabulary, weights=weights, k=rng.randint(3, 15)))
+    return corpus
+
+def generate_chat_messages(n_messages: int, vocabulary_size: int = 20000, seed: int = 0) -> Iterator[str]:
+    """Generate synthetic raw chat messages, with Zipf-distributed words, emotes, punctuation and links.
+
+    Messages are generated lazily, so even 10 million messages do not have to fit in memory.
+    About 10% of messages are emote spam, and 2% contain a link, which the bot does not learn from.
+
+    Args:
+        n_messages (int): The number of messages to generate.
+        vocabulary_size (int, optional): The number of distinct words. Defaults to 20000.
+        seed (int, optional): The seed for the random generator. Defaults to 0.
+
+    Yields:
+        Iterator[str]: The messages, e.g. "word3 word17, word0 KEKW".
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(vocabulary_size)] + EMOTES
+    # Emotes are about as common as the most common words
+    cum_weights = list(accumulate([1 / (rank + 1) for rank in range(vocabulary_size)] + [0.5] * len(EMOTES)))
+    for _ in range(n_messages):
+        kind = rng.random()
+        if kind < 0.1:
+            yield " ".join([rng.choice(EMOTES)] * rng.randint(1, 8))
+            continue
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 20))
+        for i in range(len(words)):
+            if rng.random() < 0.1:
+                words[i] += rng.choice(PUNCTUATION)
+        if kind > 0.98:
+            words.insert(rng.randrange(len(words) + 1), f"https://example{rng.randrange(100)}.com/clip")
+        yield " ".join(words)
+
+def generate_adversarial_messages(n_messages: int, seed: int = 0) -> Iterator[str]:
+    """Generate random messages from `TOKENIZER_FRAGMENTS`, to compare tokenizers on every edge case they have.
+
+    Args:
+        n_messages (int): The number of messages to generate.
+        seed (int, optional): The seed for the random generator. Defaults to 0.
+
+    Yields:
+        Iterator[str]: The messages, e.g. "I'm( gonna:)".
+    """
+    rng = random.Random(seed)
+    for _ in range(n_messages):
+        yield "".join(rng.choice(TOKENIZER_FRAGMENTS) + rng.choice(["", " "]) for _ in range(rng.randint(1, 16)))
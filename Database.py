@@ -1,51 +1,46 @@
 
+import itertools
 import sqlite3
 import logging
 import random
 import string
+import threading
+import time
 import os
-from typing import Any, List, Optional, Tuple
+from collections import Counter, defaultdict
+from typing import Any, Callable, DefaultDict, Dict, List, Optional, Set, Tuple, Union
+
+from Cache import LRUCache
+from DeltaTier import DeltaCounts, DeltaTier
+from Journal import Journal
+from LearnedMessages import LearnedMessages, LearnedNgrams
+from Metrics import Metrics
+from Sampler import TransitionSampler
+from Statements import Statements
+from Vocabulary import NOCASE_TABLE, Vocabulary
+from Writer import DatabaseWriter
+
 logger = logging.getLogger(__name__)
 
+# Selects the IDs of all words that are equal to the parameter, ignoring case like SQLite's NOCASE collation.
+# The parameter must already be case-folded with `Database.nocase`.
+FOLDED_IDS = "(SELECT id FROM Vocabulary WHERE word_folded = ?)"
+
 
 class Database:
 
     """
-    The database created is called `MarkovChain_{channel}.db`, 
-    and populated with 27 + 27^2 = 756 tables. Firstly, 27 tables with the structure of
-    "MarkovStart{char}", i.e. called:
-    > MarkovStartA
-    > MarkovStartB
-    > ...
-    > MarkovStartZ
-    > MarkovStart_
-    These tables store the first two words of a sentence, alongside a "count" frequency. 
-    The suffix of the table name is the first character of the first word in the entry.
+    The database created is called `MarkovChain_{channel}.db`, and holds two main tables.
+    Firstly, the "MarkovStart" table stores the first two words of a sentence, alongside a "count" frequency.
 
     For example, from a sentence "I am the developer of this bot", "I am" is learned by creating
-    or updating an entry in MarkovStartI where the first word is "I", the second word is "am",
+    or updating an entry in MarkovStart where the first word is "I", the second word is "am",
     and the "count" value increments every time the sequence "I am" was learned.
 
-    If instead we learn, "[he said hello]", then "[he said" is learned by creating or updating
-    an entry in MarkovStart_.
-
 
 
-    Alongside the MarkovStart... tables, there are 729 tables called "MarkovGrammar{char}{char}",
-    i.e. called:
-    > MarkovGrammarAA
-    > MarkovGrammarAB
-    > ...
-    > MarkovGrammarAZ
-    > MarkovGrammarA_
-    > MarkovGrammarBA
-    > MarkovGrammarBB
-    > ...
-    > MarkovGrammar_Z
-    > MarkovGrammar__
-    These tables store 3-grams, alongside a "count" frequency of this 3-gram. The suffix of the 
-    table name is the first character of the first word in the 3-gram, with the first character
-    of the second word in the 3-gram.
+    Alongside the MarkovStart table, there is the "MarkovGrammar" table.
+    This table stores 3-grams, alongside a "count" frequency of this 3-gram.
 
     If we revisit the example of "I am the developer of this bot", we learn the following 3-grams:
     > "I am the"
@@ -54,15 +49,26 @@ class Database:
     > "developer of this"
     > "of this bot"
     > "this bot <END>"
-    The 3-gram "am the developer" will be placed in MarkovGrammarAT, by creating or updating an entry
+    The 3-gram "am the developer" will be stored by creating or updating an entry in MarkovGrammar
     where the first word is "am", the second is "the", and the third "developer", while the "count"
     frequency is incremented every time the 3-gram "am the developer" is learned.
 
+    Words are not stored in these tables directly. Instead, every word is stored once in the "Vocabulary"
+    table, alongside an integer ID and its case-folded version, and the tables store these IDs.
+    Both tables use their words as PRIMARY KEY, which doubles as the index for looking up all entries
+    with a given first and second word. Case-insensitive lookups first find the IDs of all words 
+    with the same case-folded version, e.g. "Kappa" and "kappa". See `Vocabulary.py`.
 
+    Before version 6, these tables were split up into 27 "MarkovStart{char}" and 27^2 = 729
+    "MarkovGrammar{char}{char}" tables, using the first character of the first (and second) word,
+    where all non-letters were grouped as "_". See `self.update_v6`. These characters are still
+    used to group the starts of sentences in the StartIndex and StartTotals tables, as "suffixes".
 
-    The core of the knowledge base are the MarkovGrammar tables, which can be used to create 
+
+
+    The core of the knowledge base is the MarkovGrammar table, which can be used to create 
     functions that take a certain number of words as input, and then generate a new word. For example:
-    Given "I am", we can use the MarkovGrammarIA table to look for entries that have "I" as the first word,
+    Given "I am", we can use the MarkovGrammar table to look for entries that have "I" as the first word,
     and "am" as the second word. If there are multiple options, we can use the "count" frequency as
     weights to pick an appropriate "next word".
 
@@ -85,60 +91,370 @@ class Database:
       However, this is not entirely desirable. In a perfect world, we would like to learn "hello," 
       and "hello" differently, just like "HELLO" and "hello", but allow generating from "hello"
       to both get results from "hello" and "hello,".
+
+    - Connections are long-lived. A single writer connection is owned by the `DatabaseWriter` thread,
+      which executes all unlearning and other mutations, in order. Every thread that 
+      generates gets its own read-only connection. With WAL journaling, these readers never wait
+      for a learning commit to finish, and the thread handling chat never waits for SQLite.
+
+    - Learned n-grams are first counted in an in-memory delta tier, which generation reads alongside
+      the database, and which the writer thread compacts into the database in bulk. See `DeltaTier.py`.
+
+    - SQL statements that are executed repeatedly are built once, and registered per table and operation
+      in `self.statements`, so every connection keeps all of them prepared. See `Statements.py`.
+
+    - The version of the Database structure is stored in the "Version" table. Opening a Database that
+      is at `Database.VERSION` only reads the version, and only the updates in `self.migrations` for
+      newer versions are applied to older Databases.
+
+    - The "WordIndex" table maps every word to the first words of the rows that contain it as a later word,
+      so all rows containing a word are found through PRIMARY KEY lookups, e.g. to purge newly blacklisted words.
+      See `self.purge`. Words to purge are found through the lowercase words in the Vocabulary, which 
+      are lowercased with `str.lower`, exactly like the `Blacklist` matches them, including non-ASCII letters.
     """
 
-    def __init__(self, channel: str):
+    # The version of the Database structure, which must be the version of the last update in `self.migrations`
+    VERSION = 10
+
+    # The maximum number of first words whose rows are purged per transaction, see `self.purge_now`
+    PURGE_BATCH_SIZE = 500
+
+    # The maximum number of seconds that changing whether a user is whispered waits for the writer thread
+    WHISPER_IGNORE_TIMEOUT = 5
+
+    # Connection-level PRAGMAs applied to every connection, overridable via "DatabasePragmas" in settings.json
+    DEFAULT_PRAGMAS: Dict[str, Union[str, int]] = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,  # 256 MiB
+        "cache_size": -16000,  # Negative values are in KiB, so ~16 MB
+        "temp_store": "MEMORY",
+    }
+
+    def __init__(self,
+                 channel: str,
+                 pragmas: Optional[Dict[str, Union[str, int]]] = None,
+                 learn_flush_size: int = 10000,
+                 learn_flush_interval: float = 30,
+                 transition_cache_entries: int = 10000,
+                 transition_cache_bytes: int = 32 * 1024 * 1024,
+                 write_queue_size: int = 10000,
+                 vocabulary_cache_entries: int = 100000,
+                 journal_sync_interval: Optional[float] = 1,
+                 statement_cache_size: Optional[int] = None,
+                 metrics: Optional[Metrics] = None,
+                 migration_processes: Optional[int] = None,
+                 learned_message_entries: int = 10000):
         self.db_name = f"MarkovChain_{channel.replace('#', '').lower()}.db"
         self._execute_queue = []
+        # Records the durations of commits and of unlearning on the writer thread
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+
+        # The SQL statements executed repeatedly, which every connection keeps prepared in a cache of
+        # `statement_cache_size` statements, or of a size that fits all of them if it is None
+        self.statements = Statements()
+        self.register_statements()
+        self.statement_cache_size = self.statements.cache_size if statement_cache_size is None else statement_cache_size
+
+        # Learned n-grams are counted in an in-memory tier that generation reads alongside the database,
+        # which is compacted into the database in bulk once it holds `learn_flush_size` distinct n-grams,
+        # or once it is `learn_flush_interval` seconds old. Learned n-grams and unlearned messages are 
+        # recorded in a journal, which is synced to disk every `journal_sync_interval` seconds, unless it is None.
+        self.journal: Optional[Journal] = None
+        if journal_sync_interval is not None:
+            self.journal = Journal(f"MarkovChain_{channel.replace('#', '').lower()}_delta", journal_sync_interval)
+        self.delta = DeltaTier(self.journal)
+        self.learn_flush_size = learn_flush_size
+        self.learn_flush_interval = learn_flush_interval
+        # Number of learned n-grams, and the number of rows written to store them
+        self.learned_ngrams = 0
+        self.written_rows = 0
+        # Number of rows removed by purging blacklisted words
+        self.purged_rows = 0
+        # Suffixes of MarkovStart tables whose StartIndex ranges changed in the current transaction
+        self._dirty_start_suffixes = set()
+        # The n-grams learned from the last `learned_message_entries` messages, to unlearn exactly those once a message is deleted,
+        # and the n-grams of deleted messages that are unlearned in the next transaction, see `self.write_unlearned_ngrams`
+        self.learned_messages = LearnedMessages(learned_message_entries)
+        self._unlearned_ngrams: List[LearnedNgrams] = []
+
+        # Maps case-folded (word1, word2) keys to samplers over their (word3, count) transitions, for generating.
+        # Keys that are changed by learning or unlearning are invalidated once the change is committed.
+        self.transition_cache = LRUCache(transition_cache_entries, transition_cache_bytes)
+        self._invalidated_keys: Set[Tuple[str, str]] = set()
+        # Maps words to their IDs in the Vocabulary table, and back
+        self.vocabulary = Vocabulary(vocabulary_cache_entries, self.statements)
+
+        # All mutations are executed in order by this thread, which is started once the database is set up
+        self.write_thread = DatabaseWriter(self, write_queue_size)
+
+        self.pragmas = {**Database.DEFAULT_PRAGMAS, **(pragmas or {})}
+        for pragma, value in self.pragmas.items():
+            if not pragma.isidentifier() or not str(value).replace("-", "", 1).isalnum():
+                raise ValueError(f"Invalid value for \"DatabasePragmas\": {pragma!r} = {value!r}.")
+
+        # The writer connection is shared between threads, so all access goes through this lock
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.RLock()
+        # Read connections are opened lazily, one per thread
+        self._local = threading.local()
+        self._read_conns: List[sqlite3.Connection] = []
+        self._read_conns_lock = threading.Lock()
+
+        # Whether an update replaced the database file with an updated copy, keeping a backup of the original
+        self._backup_created = False
+        # The maximum number of processes that updates run across, or None for one per CPU
+        self.migration_processes = migration_processes
+        # The statistics of the last update that was run with `Migration.TableMigration`, if any
+        self.migration_stats: Optional[Dict[str, float]] = None
+        start_t = time.perf_counter()
+        version = self.get_version()
+        # A new Database has no tables at all, and is created at the current version right away
+        created = version == 0 and not self.execute("SELECT 1 FROM sqlite_master LIMIT 1;", fetch=True)
+        if version < Database.VERSION:
+            if not created:
+                for migration_version, migrate in self.migrations(channel):
+                    if migration_version > version:
+                        migrate()
+            self.create_tables()
+        elif version > Database.VERSION:
+            logger.warning(f"\"{self.db_name}\" has version {version}, which is newer than version {Database.VERSION} of this bot.")
+        update_t = time.perf_counter()
+
+        # Recover what was learned or unlearned, but not committed, before a crash. 
+        # Everything is applied in one transaction, so a crash while recovering does not apply anything twice.
+        compacted, unlearned = self.query("SELECT segment, unlearned FROM DeltaLog;")[0]
+        replayed, unlearns = self.delta.replay(compacted, unlearned)
+        if replayed or unlearns:
+            logger.info(f"Recovered {replayed} learned n-grams and {len(unlearns)} unlearned messages from the journal.")
+            for number, message in unlearns:
+                if isinstance(message, str):
+                    self.unlearn_now(message, number, commit=False)
+                else:
+                    self.unlearn_ngrams_now(message, number, commit=False)
+            self.execute_commit()
 
-        if os.path.isfile(self.db_name):
-            # Ensure the database is updated to the newest version
-            self.update_v1(channel)
-            self.update_v2()
-            self.update_v3(channel)
+        self.write_thread.start()
+        if created:
+            action = "creating it"
+        elif version < Database.VERSION:
+            action = f"updating it from version {version}"
+        else:
+            action = "checking its version"
+        logger.info(f"Opened \"{self.db_name}\" in {(time.perf_counter() - start_t) * 1000:.1f} ms: "
+                    f"{action} took {(update_t - start_t) * 1000:.1f} ms, recovering from the journal {(time.perf_counter() - update_t) * 1000:.1f} ms.")
 
-        # Create database tables.
-        for first_char in list(string.ascii_uppercase) + ["_"]:
-            self.add_execute_queue(f"""
-            CREATE TABLE IF NOT EXISTS MarkovStart{first_char} (
-                word1 TEXT COLLATE NOCASE, 
-                word2 TEXT COLLATE NOCASE, 
-                count INTEGER, 
-                PRIMARY KEY (word1 COLLATE BINARY, word2 COLLATE BINARY)
-            );
-            """, auto_commit=False)
-            for second_char in list(string.ascii_uppercase) + ["_"]:
-                self.add_execute_queue(f"""
-                CREATE TABLE IF NOT EXISTS MarkovGrammar{first_char}{second_char} (
-                    word1 TEXT COLLATE NOCASE,
-                    word2 TEXT COLLATE NOCASE,
-                    word3 TEXT COLLATE NOCASE,
-                    count INTEGER,
-                    PRIMARY KEY (word1 COLLATE BINARY, word2 COLLATE BINARY, word3 COLLATE BINARY)
-                );
-                """, auto_commit=False)
-        sql = """
+    def migrations(self, channel: str) -> List[Tuple[int, Callable[[], None]]]:
+        """Get the updates of the Database structure, in the order in which they must be applied.
+
+        Each update is only applied if the Database is older than the version it updates to.
+        Versions 1 and 2 predate the "Version" table, so they are applied to Databases without one,
+        but check whether they are needed themselves.
+
+        Args:
+            channel (str): The name of the Twitch channel on which the bot is running.
+
+        Returns:
+            List[Tuple[int, Callable[[], None]]]: The version that each update brings the Database to, and the update.
+        """
+        return [
+            (1, lambda: self.update_v1(channel)),
+            (2, self.update_v2),
+            (3, lambda: self.update_v3(channel)),
+            (4, self.update_v4),
+            (5, self.update_v5),
+            (6, lambda: self.update_v6(channel)),
+            (7, lambda: self.update_v7(channel)),
+            (8, self.update_v8),
+            (9, self.update_v9),
+            (10, self.update_v10),
+        ]
+
+    def create_tables(self) -> None:
+        """Create all tables that do not exist yet, and set the version to `Database.VERSION`, all in one transaction."""
+        self.add_tables_queue()
+        self.add_execute_queue("""
         CREATE TABLE IF NOT EXISTS WhisperIgnore (
             username TEXT,
             PRIMARY KEY (username)
         );
-        """
-        self.add_execute_queue(sql)
-        # Add a version entry
-        sql = """
+        """, auto_commit=False)
+        self.add_start_index_tables_queue()
+        self.add_word_index_table_queue()
+        self.add_execute_queue("""
         CREATE TABLE IF NOT EXISTS Version (
             version INTEGER
         );
-        """
-        self.add_execute_queue(sql)
-        self.add_execute_queue("DELETE FROM Version;")
-        self.add_execute_queue("INSERT INTO Version (version) VALUES (3);")
+        """, auto_commit=False)
+        self.add_execute_queue("DELETE FROM Version;", auto_commit=False)
+        self.add_execute_queue("INSERT INTO Version (version) VALUES (?);", values=(Database.VERSION,), auto_commit=False)
+        # The last journal segment that was compacted into the database, and the last unlearned message that was applied
+        self.add_execute_queue(
+            "CREATE TABLE IF NOT EXISTS DeltaLog (segment INTEGER, unlearned INTEGER NOT NULL DEFAULT 0);", auto_commit=False)
+        self.add_execute_queue(
+            "INSERT INTO DeltaLog (segment) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM DeltaLog);", auto_commit=False)
         self.execute_commit()
 
-        # Used for randomly picking a Markov Grammar if only one word is given
-        # Index 0 is for "A", 1 for "B", etc. Then, 26 is for "_"
-        self.word_frequency = [11.6, 4.4, 5.2, 3.1, 2.8, 4, 1.6, 4.2, 7.3, 0.5, 0.8, 2.4,
-                               3.8, 2.2, 7.6, 4.3, 0.2, 2.8, 6.6, 15.9, 1.1, 0.8, 5.5, 0.1, 0.7, 0.1, 0.5]
+    def register_statements(self) -> None:
+        """Register the SQL statements that are executed repeatedly in `self.statements`, per table and operation.
+
+        Statements that are only executed once, like those creating tables or updating 
+        the database to a newer version, are not registered.
+        """
+        self.statements.register_all(Vocabulary.statements())
+        self.statements.register_all([
+            ("MarkovGrammar", "upsert", """
+                INSERT INTO MarkovGrammar (word1, word2, word3, count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (word1, word2, word3)
+                DO UPDATE SET count = count + excluded.count;"""),
+            ("MarkovGrammar", "transitions", f"""
+                SELECT word3, count FROM MarkovGrammar
+                WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS};"""),
+            ("MarkovGrammar", "singles", f"""
+                SELECT word2, SUM(count) FROM MarkovGrammar
+                WHERE word1 IN {FOLDED_IDS} AND word2 NOT IN {FOLDED_IDS}
+                GROUP BY word2;"""),
+            # Unlearning reduces "count" by 5, and deletes the row if "count" is then less than 0
+            ("MarkovGrammar", "unlearn", f"""
+                UPDATE MarkovGrammar
+                SET count = count - 5
+                WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS} AND word3 IN {FOLDED_IDS};"""),
+            ("MarkovGrammar", "delete_unlearned", f"""
+                DELETE FROM MarkovGrammar
+                WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS} AND word3 IN {FOLDED_IDS} AND count <= 0;"""),
+            # Rows containing a word, with the first word given, for purging, see `self.purge_now`
+            ("MarkovGrammar", "rows", "SELECT word2, word3 FROM MarkovGrammar WHERE word1 = ?;"),
+            ("MarkovGrammar", "thirds", "SELECT word3 FROM MarkovGrammar WHERE word1 = ? AND word2 = ?;"),
+            ("MarkovGrammar", "seconds", "SELECT word2 FROM MarkovGrammar WHERE word1 = ? AND word3 = ?;"),
+            ("MarkovGrammar", "delete", "DELETE FROM MarkovGrammar WHERE word1 = ? AND word2 = ? AND word3 = ?;"),
+            # Unlearning the exact 3-grams learned from a message, see `self.write_unlearned_ngrams`
+            ("MarkovGrammar", "decrement", "UPDATE MarkovGrammar SET count = count - ? WHERE word1 = ? AND word2 = ? AND word3 = ?;"),
+            ("MarkovGrammar", "prune", "DELETE FROM MarkovGrammar WHERE word1 = ? AND word2 = ? AND word3 = ? AND count <= 0;"),
+
+            ("MarkovStart", "upsert", """
+                INSERT INTO MarkovStart (word1, word2, count)
+                VALUES (?, ?, ?)
+                ON CONFLICT (word1, word2)
+                DO UPDATE SET count = count + excluded.count;"""),
+            ("MarkovStart", "seconds", f"""
+                SELECT word2, count FROM MarkovStart
+                WHERE word1 IN {FOLDED_IDS};"""),
+            ("MarkovStart", "unlearn", f"""
+                UPDATE MarkovStart
+                SET count = count - 5
+                WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS};"""),
+            ("MarkovStart", "delete_unlearned", f"""
+                DELETE FROM MarkovStart
+                WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS} AND count <= 0;"""),
+            ("MarkovStart", "rows", "SELECT word2, count FROM MarkovStart WHERE word1 = ?;"),
+            ("MarkovStart", "count", "SELECT word2, count FROM MarkovStart WHERE word1 = ? AND word2 = ?;"),
+            ("MarkovStart", "delete", "DELETE FROM MarkovStart WHERE word1 = ? AND word2 = ?;"),
+            ("MarkovStart", "set", "UPDATE MarkovStart SET count = ? WHERE word1 = ? AND word2 = ?;"),
+
+            ("StartIndex", "insert", "INSERT INTO StartIndex (suffix, low, high, word1, word2) VALUES (?, ?, ?, ?, ?);"),
+            ("StartIndex", "find", """
+                SELECT word1, word2, high FROM StartIndex
+                WHERE suffix = ? AND low <= ?
+                ORDER BY low DESC
+                LIMIT 1;"""),
+            ("StartIndex", "ranges", "SELECT word1, word2, high - low FROM StartIndex WHERE suffix = ?;"),
+            ("StartIndex", "delete", "DELETE FROM StartIndex WHERE suffix = ?;"),
+            ("StartIndex", "delete_start", "DELETE FROM StartIndex WHERE suffix = ? AND word1 = ? AND word2 = ?;"),
+            ("StartIndex", "delete_unlearned", f"""
+                DELETE FROM StartIndex
+                WHERE suffix = ? AND word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS};"""),
+            # Appends new ranges for what remains of an unlearned start
+            ("StartIndex", "append_unlearned", f"""
+                INSERT INTO StartIndex (suffix, low, high, word1, word2)
+                SELECT suffix, extent + cumulative - count, extent + cumulative, word1, word2
+                FROM (
+                    SELECT word1, word2, count, SUM(count) OVER (ORDER BY word1, word2) AS cumulative
+                    FROM MarkovStart
+                    WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS}
+                ), StartTotals
+                WHERE suffix = ?;"""),
+
+            ("StartTotals", "totals", "SELECT suffix, total, extent FROM StartTotals WHERE total > 0;"),
+            ("StartTotals", "extent", "SELECT extent FROM StartTotals WHERE suffix = ?;"),
+            ("StartTotals", "fragmentation", "SELECT total, extent, ranges, rebuilt_ranges FROM StartTotals WHERE suffix = ?;"),
+            ("StartTotals", "add", "UPDATE StartTotals SET total = total + ?, extent = ?, ranges = ranges + ? WHERE suffix = ?;"),
+            ("StartTotals", "subtract", "UPDATE StartTotals SET total = total - ?, ranges = ranges - ? WHERE suffix = ?;"),
+            # Removes the ranges of an unlearned start, and subtracts what will be unlearned from the total
+            ("StartTotals", "subtract_unlearned", f"""
+                UPDATE StartTotals
+                SET total = total - (
+                        SELECT coalesce(SUM(min(count, 5)), 0) FROM MarkovStart
+                        WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS}
+                    ),
+                    ranges = ranges - (
+                        SELECT COUNT(*) FROM StartIndex
+                        WHERE suffix = ? AND word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS}
+                    )
+                WHERE suffix = ?;"""),
+            ("StartTotals", "extend_unlearned", f"""
+                UPDATE StartTotals
+                SET extent = extent + (
+                        SELECT coalesce(SUM(count), 0) FROM MarkovStart
+                        WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS}
+                    ),
+                    ranges = ranges + (
+                        SELECT COUNT(*) FROM MarkovStart
+                        WHERE word1 IN {FOLDED_IDS} AND word2 IN {FOLDED_IDS}
+                    )
+                WHERE suffix = ?;"""),
+
+            ("Vocabulary", "lowered", "SELECT id FROM Vocabulary WHERE word_lower = ?;"),
+
+            # Pairs of a word and the first word of a row that contains it as a later word, see `self.add_word_index_table_queue`
+            ("WordIndex", "insert", "INSERT OR IGNORE INTO WordIndex (word, word1) VALUES (?, ?);"),
+            ("WordIndex", "first_words", "SELECT word1 FROM WordIndex WHERE word = ?;"),
+            ("WordIndex", "delete", "DELETE FROM WordIndex WHERE word = ?;"),
+
+            ("DeltaLog", "compacted", "UPDATE DeltaLog SET segment = ?;"),
+            ("DeltaLog", "unlearned", "UPDATE DeltaLog SET unlearned = max(unlearned, ?);"),
+
+            ("WhisperIgnore", "add", """
+                INSERT OR IGNORE INTO WhisperIgnore(username)
+                SELECT ?;"""),
+            ("WhisperIgnore", "check", """
+                SELECT username FROM WhisperIgnore
+                WHERE username = ?;"""),
+            ("WhisperIgnore", "remove", """
+                DELETE FROM WhisperIgnore
+                WHERE username = ?;"""),
+        ])
+        # The StartIndex is rebuilt from the starts whose first word has a given suffix, see `self.rebuild_start_index`
+        for suffix, condition in [("letter", "word_folded >= ? AND word_folded < ?"),
+                                  # Case-folded words starting with a letter lie between "a" and "{"
+                                  ("other", "NOT (word_folded >= 'a' AND word_folded < '{')")]:
+            starts = f"""
+                SELECT word1, word2, count, SUM(count) OVER (ORDER BY word1, word2) AS cumulative
+                FROM MarkovStart
+                WHERE count > 0 AND word1 IN (SELECT id FROM Vocabulary WHERE {condition})"""
+            self.statements.register_all([
+                ("StartIndex", f"rebuild_{suffix}", f"""
+                    INSERT INTO StartIndex (suffix, low, high, word1, word2)
+                    SELECT ?, cumulative - count, cumulative, word1, word2
+                    FROM ({starts});"""),
+                ("StartTotals", f"rebuild_{suffix}", f"""
+                    INSERT OR REPLACE INTO StartTotals (suffix, total, extent, ranges, rebuilt_ranges)
+                    SELECT ?, coalesce(SUM(count), 0), coalesce(SUM(count), 0), COUNT(*), COUNT(*)
+                    FROM ({starts});"""),
+            ])
+
+    def statement_timings(self) -> Dict[str, float]:
+        """Measure how long parsing and preparing each registered statement takes, which is what every
+        cache miss in the statement cache of a connection costs.
+
+        Returns:
+            Dict[str, float]: Maps "{table}.{operation}" to the mean time to prepare it, in microseconds.
+        """
+        conn = sqlite3.connect(self.db_name, cached_statements=0)
+        try:
+            return self.statements.measure(conn)
+        finally:
+            conn.close()
 
     def update_v1(self, channel: str):
         """Update the Database structure from a deprecated version to a newer one.
@@ -266,14 +582,16 @@ class Database:
         This allows people to generate "!g hello", and have the bot generate "hello, how are you?",
         or have "!g it" result in "it's a wonderful day".
 
-        This first copies `MarkovChain_{channel}.db` to `MarkovChain_{channel}_modified.db`.
-        This new copy is then modified. The original is never changed, to avoid issues when the
-        update is interrupted. As a result, running the program again will just re-attempt the
-        update. 
+        The re-tokenized data is written to a new `MarkovChain_{channel}_modified.db`. The original
+        is only read, and never changed, to avoid issues when the update is interrupted.
+
+        Every table is re-tokenized as a separate unit of work, in parallel across `self.migration_processes`
+        processes, and committed together with a checkpoint. See `Migration.TableMigration`.
+        As a result, running the program again after the update was interrupted continues
+        with the tables that were not updated yet.
 
-        Upon completing the update, the original database is renamed to 
-        `MarkovChain_{channel}_backup.db`, while the newly modified `MarkovChain_{channel}_modified.db`
-        is renamed to `MarkovChain_{channel}.db`.
+        Upon completing the update, the original database is kept as `MarkovChain_{channel}_backup.db`,
+        while the modified database is renamed to `MarkovChain_{channel}.db`.
 
         *This `MarkovChain_{channel}_backup.db` file can safely be deleted, as it is NOT used*
 
@@ -283,37 +601,22 @@ class Database:
             channel (str): The name of the Twitch channel on which the bot is running.
         """
 
-        # Get Database version. Throws OperationalError if the Version table does not exist,
-        # in which case we definitely want to upgrade.
-        try:
-            version = self.execute(
-                "SELECT version FROM Version ORDER BY version DESC LIMIT 1;", fetch=True)
-        except sqlite3.OperationalError:
-            version = []
-
         # Whether to upgrade
-        if not version or version[0][0] < 3:
+        if self.get_version() < 3:
             logger.info(
                 "Updating Database to new version - supports better punctuation handling.")
+            from Migration import TableMigration, retokenize_table, write_retokenized
 
-            from shutil import copyfile
-            import os
-            from Tokenizer import tokenize
-            from nltk import ngrams
             channel = channel.replace('#', '').lower()
-            copyfile(f"MarkovChain_{channel}.db",
-                     f"MarkovChain_{channel}_modified.db")
-            logger.info(
-                f"Created a copy of the database called \"MarkovChain_{channel}_modified.db\". The update will modify this file.")
-
-            # Temporarily set self.db_name to the modified one
-            self.db_name = f"MarkovChain_{channel.replace('#', '').lower()}_modified.db"
+            self.create_modified(channel)
 
             # Create database tables.
+            tables = []
             for first_char in list(string.ascii_uppercase) + ["_"]:
                 table = f"MarkovStart{first_char}"
+                tables.append(table)
                 self.add_execute_queue(f"""
-                CREATE TABLE IF NOT EXISTS {table}_modified (
+                CREATE TABLE IF NOT EXISTS {table} (
                     word1 TEXT COLLATE NOCASE, 
                     word2 TEXT COLLATE NOCASE, 
                     count INTEGER, 
@@ -322,8 +625,9 @@ class Database:
                 """, auto_commit=False)
                 for second_char in list(string.ascii_uppercase) + ["_"]:
                     table = f"MarkovGrammar{first_char}{second_char}"
+                    tables.append(table)
                     self.add_execute_queue(f"""
-                    CREATE TABLE IF NOT EXISTS {table}_modified (
+                    CREATE TABLE IF NOT EXISTS {table} (
                         word1 TEXT COLLATE NOCASE,
                         word2 TEXT COLLATE NOCASE,
                         word3 TEXT COLLATE NOCASE,
@@ -332,139 +636,528 @@ class Database:
                     );
                     """, auto_commit=False)
             self.execute_commit()
+            # The migration writes on its own connection
+            self.close()
+
+            self.migration_stats = TableMigration(f"MarkovChain_{channel}.db", self.db_name, 3, "Re-tokenizing",
+                                                  retokenize_table, write_retokenized,
+                                                  processes=self.migration_processes).run(tables)
+
+            # Copy all other tables from the original with their indices, e.g. WhisperIgnore, and add a version entry
+            self.execute("ATTACH DATABASE ? AS original;", (f"MarkovChain_{channel}.db",))
+            schema = self.execute("""
+                SELECT type, name, tbl_name, sql FROM original.sqlite_master
+                WHERE sql IS NOT NULL ORDER BY type = 'index';""", fetch=True)
+            migrated = set(tables)
+            for kind, name, table, sql in schema:
+                if table in migrated or table.startswith("sqlite_"):
+                    continue
+                self.add_execute_queue(sql, auto_commit=False)
+                if kind == "table":
+                    self.add_execute_queue(f"INSERT INTO main.{name} SELECT * FROM original.{name};", auto_commit=False)
+            self.add_execute_queue("DROP TABLE MigrationCheckpoint;", auto_commit=False)
+            self.add_execute_queue("""CREATE TABLE IF NOT EXISTS Version (
+                    version INTEGER
+                );""", auto_commit=False)
+            # The version is set before the files are swapped, so the swap is the final step of the update
+            self.add_execute_queue("DELETE FROM Version;", auto_commit=False)
+            self.add_execute_queue("INSERT INTO Version (version) VALUES (3);", auto_commit=False)
+            self.execute_commit()
+            self.execute("DETACH DATABASE original;")
+            self.replace_with_modified(channel)
 
-            def modify_start(table: str) -> None:
-                """Read all data from `table`, re-tokenize it, distribute the new first 2 tokens to _modified tables, and drop `table`.
-
-                Args:
-                    table (str): The name of the table to work on.
-                """
-                data = self.execute(f"SELECT * FROM {table};", fetch=True)
-                for tup in data:
-                    # Remove "count" from tup for now
-                    count = tup[-1]
-                    tup = tup[:-1]
-
-                    raw_string = " ".join(tup)
-                    tokenized = tokenize(raw_string)
-                    two_gram = tokenized[:2]
-                    # In case there was some issue in the previous Database 
-                    if len(two_gram) < 2:
-                        continue
-                    self.add_execute_queue(f'''
-                        INSERT OR REPLACE INTO MarkovStart{self.get_suffix(two_gram[0][0])}_modified (word1, word2, count)
-                        VALUES (?, ?, coalesce (
-                                (
-                                    SELECT count + {count} FROM MarkovStart{self.get_suffix(two_gram[0][0])}_modified
-                                    WHERE word1 = ? COLLATE BINARY
-                                    AND word2 = ? COLLATE BINARY
-                                ),
-                                1
-                            )
-                        )''',
-                                           values=two_gram + two_gram,
-                                           auto_commit=False)
-
-                self.execute(f"DROP TABLE {table};")
-
-            def modify_grammar(table: str) -> None:
-                """Read all data from `table`, re-tokenize it, distribute the new 3-grams to _modified tables, and drop `table`.
-
-                Args:
-                    table (str): The name of the table to work on.
-                """
-                data = self.execute(f"SELECT * FROM {table};", fetch=True)
-                for tup in data:
-                    # Remove "count" from tup for now
-                    count = tup[-1]
-                    tup = tup[:-1]
-
-                    # If ends on "<END>", ignore that in in the tuple, as we don't want it to get
-                    # tokenized.
-                    end = False
-                    if tup[-1] == "<END>":
-                        end = True
-                        tup = tup[:-1]
-
-                    raw_string = " ".join(tup)
-                    tokenized = tokenize(raw_string)
-
-                    # Re-add "<END>"
-                    if end:
-                        tokenized.append("<END>")
-
-                    for ngram in ngrams(tokenized, 3):
-                        # Filter out recursive case.
-                        if self.check_equal(ngram):
-                            continue
-                        self.add_execute_queue(f'''
-                        INSERT OR REPLACE INTO MarkovGrammar{self.get_suffix(ngram[0][0])}{self.get_suffix(ngram[1][0])}_modified (word1, word2, word3, count)
-                        VALUES (?, ?, ?, coalesce (
-                                (
-                                    SELECT count + {count} FROM MarkovGrammar{self.get_suffix(ngram[0][0])}{self.get_suffix(ngram[1][0])}_modified
-                                    WHERE word1 = ? COLLATE BINARY
-                                    AND word2 = ? COLLATE BINARY
-                                    AND word3 = ? COLLATE BINARY
-                                ),
-                                1
-                            )
-                        )''',
-                                               values=ngram + ngram,
-                                               auto_commit=False)
-
-                self.execute(f"DROP TABLE {table};")
-
-            # Modify all tables
-            i = 0
-            total = 27 * 27 + 27  # The number of tables to convert
-            for first_char in list(string.ascii_uppercase) + ["_"]:
-                table = f"MarkovStart{first_char}"
-                modify_start(table)
-                i += 1
-                for second_char in list(string.ascii_uppercase) + ["_"]:
-                    table = f"MarkovGrammar{first_char}{second_char}"
-                    modify_grammar(table)
-                    i += 1
-                logger.debug(
-                    f"[{i / total * 100:.2f}%] Scheduled updates for the tables for words starting in {first_char}.")
-            logger.info("Starting executing table update...")
+    def update_v4(self) -> None:
+        """Update the Database structure to version 4, which added case-insensitive lookup indices to all tables.
+
+        The PRIMARY KEY of each table uses `COLLATE BINARY`, so case-sensitive learning works,
+        but the lookups used for generating compare with `COLLATE NOCASE`, which cannot use that index.
+        These indices are no longer built, as `self.update_v6` and `self.update_v7` always replace all 
+        756 tables in the same run, before anything is generated, and the final tables are looked up 
+        through their PRIMARY KEY and the Vocabulary instead. Building them would only be thrown away.
+
+        This function only sets the version to 4.
+        """
+        if self.get_version() < 4:
+            self.add_execute_queue("DELETE FROM Version;", auto_commit=False)
+            self.add_execute_queue("INSERT INTO Version (version) VALUES (4);", auto_commit=False)
+            self.execute_commit()
+
+    def update_v5(self) -> None:
+        """Update the Database structure to add the StartIndex and StartTotals tables.
+
+        These tables allow a weighted start of a sentence to be picked with a single indexed query, 
+        instead of loading an entire MarkovStart table. See `self.get_start`.
+
+        This function builds these tables from the existing MarkovStart tables, and sets the version to 5.
+        """
+        if self.get_version() < 5:
+            logger.info("Updating Database to new version - adds an index for picking starts of sentences.")
+            self.add_start_index_tables_queue()
             self.execute_commit()
-            logger.info("Finished executing table update.")
+            with self._write_lock:
+                cur = self.writer.cursor()
+                cur.execute("begin")
+                for first_char in list(string.ascii_uppercase) + ["_"]:
+                    self.rebuild_start_index(cur, first_char, table=f"MarkovStart{first_char}")
+                cur.execute("DELETE FROM Version;")
+                cur.execute("INSERT INTO Version (version) VALUES (5);")
+                cur.execute("commit")
+            logger.info("Finished Updating Database to new version.")
+
+    def update_v6(self, channel: str) -> None:
+        """Update the Database structure to store all starts of sentences in one MarkovStart table,
+        and all 3-grams in one MarkovGrammar table, instead of 756 tables split up by first character.
+
+        Like `self.update_v3`, this first copies `MarkovChain_{channel}.db` to `MarkovChain_{channel}_modified.db`,
+        and only modifies this copy. If the update is interrupted, running the program again will re-attempt it.
 
-            # Rename the _modified tables to normal tables again
+        Upon completing the update, the original database is renamed to `MarkovChain_{channel}_backup.db`,
+        while the modified database is renamed to `MarkovChain_{channel}.db`.
+
+        *This `MarkovChain_{channel}_backup.db` file can safely be deleted, as it is NOT used*
+
+        This function also sets the version to 6.
+
+        Args:
+            channel (str): The name of the Twitch channel on which the bot is running.
+        """
+        if self.get_version() < 6:
+            logger.info("Updating Database to new version - stores all data in one table for starts and one for 3-grams.")
+
+            self.copy_to_modified(channel)
+
+            # Create the new tables, without lookup indices
+            self.add_execute_queue("""
+            CREATE TABLE IF NOT EXISTS MarkovStart (
+                word1 TEXT COLLATE NOCASE, 
+                word2 TEXT COLLATE NOCASE, 
+                count INTEGER, 
+                PRIMARY KEY (word1 COLLATE BINARY, word2 COLLATE BINARY)
+            );
+            """, auto_commit=False)
+            self.add_execute_queue("""
+            CREATE TABLE IF NOT EXISTS MarkovGrammar (
+                word1 TEXT COLLATE NOCASE,
+                word2 TEXT COLLATE NOCASE,
+                word3 TEXT COLLATE NOCASE,
+                count INTEGER,
+                PRIMARY KEY (word1 COLLATE BINARY, word2 COLLATE BINARY, word3 COLLATE BINARY)
+            );
+            """, auto_commit=False)
+            self.execute_commit()
+
+            # Move the data table by table, so each transaction stays small
             for first_char in list(string.ascii_uppercase) + ["_"]:
-                table = f"MarkovStart{first_char}"
-                self.add_execute_queue(
-                    f"ALTER TABLE {table}_modified RENAME TO {table};", auto_commit=False)
+                self.add_execute_queue(f"""
+                    INSERT INTO MarkovStart (word1, word2, count)
+                    SELECT word1, word2, count FROM MarkovStart{first_char} WHERE true
+                    ON CONFLICT (word1 COLLATE BINARY, word2 COLLATE BINARY)
+                    DO UPDATE SET count = count + excluded.count;""", auto_commit=False)
+                self.add_execute_queue(f"DROP TABLE MarkovStart{first_char};", auto_commit=False)
                 for second_char in list(string.ascii_uppercase) + ["_"]:
-                    table = f"MarkovGrammar{first_char}{second_char}"
-                    self.add_execute_queue(
-                        f"ALTER TABLE {table}_modified RENAME TO {table};", auto_commit=False)
+                    self.add_execute_queue(f"""
+                        INSERT INTO MarkovGrammar (word1, word2, word3, count)
+                        SELECT word1, word2, word3, count FROM MarkovGrammar{first_char}{second_char} WHERE true
+                        ON CONFLICT (word1 COLLATE BINARY, word2 COLLATE BINARY, word3 COLLATE BINARY)
+                        DO UPDATE SET count = count + excluded.count;""", auto_commit=False)
+                    self.add_execute_queue(f"DROP TABLE MarkovGrammar{first_char}{second_char};", auto_commit=False)
+                self.execute_commit()
+                logger.debug(f"Moved the data of the tables for words starting in {first_char}.")
+
+            # No lookup indices are created, as `self.update_v7` always replaces these tables in the same run.
+            # The StartIndex stays valid, as it refers to the starts by their words.
+            # The version is set before the files are swapped, so the swap is the final step of the update
+            self.add_execute_queue("DELETE FROM Version;", auto_commit=False)
+            self.add_execute_queue("INSERT INTO Version (version) VALUES (6);", auto_commit=False)
             self.execute_commit()
+            self.replace_with_modified(channel)
 
-            # Turn the non-modified, old version of the Database into a "_backup.db" file,
-            # and turn the modified file into the new main file.
-            os.rename(f"MarkovChain_{channel}.db",
-                      f"MarkovChain_{channel}_backup.db")
-            os.rename(f"MarkovChain_{channel}_modified.db",
-                      f"MarkovChain_{channel}.db")
+    def update_v7(self, channel: str) -> None:
+        """Update the Database structure to store integer IDs of words in the MarkovStart, MarkovGrammar
+        and StartIndex tables, instead of repeating the words themselves. The words are stored once, in
+        the new Vocabulary table.
 
-            # Revert to using .db instead of _modified.db
-            self.db_name = f"MarkovChain_{channel.replace('#', '').lower()}.db"
+        Like `self.update_v6`, this modifies a copy of the database, which then replaces the original,
+        which is kept as `MarkovChain_{channel}_backup.db`. *This file can safely be deleted, as it is NOT used*
 
-            # Add a version entry
-            self.execute("""CREATE TABLE IF NOT EXISTS Version (
-                    version INTEGER
-                );""")
-            self.execute("DELETE FROM Version;")
-            self.execute("INSERT INTO Version (version) VALUES (3);")
+        This function also sets the version to 7.
 
-            logger.info(
-                f"Renamed original database file \"MarkovChain_{channel}.db\" to \"MarkovChain_{channel}_backup.db\". This file is *not* used, and can safely be deleted.")
-            logger.info(
-                f"Renamed updated database file \"MarkovChain_{channel}_modified.db\" to \"MarkovChain_{channel}.db\".")
-            logger.info(
-                f"This updated \"MarkovChain_{channel}.db\" will be used to drive the Twitch bot.")
+        Args:
+            channel (str): The name of the Twitch channel on which the bot is running.
+        """
+        if self.get_version() < 7:
+            logger.info("Updating Database to new version - stores words as integer IDs to reduce the database size.")
+            self.copy_to_modified(channel)
+
+            self.add_tables_queue(suffix="_modified")
+            self.execute_commit()
+
+            logger.info("Creating the Vocabulary...")
+            with self._write_lock:
+                self.writer.create_function("nocase", 1, self.nocase, deterministic=True)
+            self.add_execute_queue("""
+                INSERT OR IGNORE INTO Vocabulary (word, word_folded)
+                SELECT word, '' FROM (
+                    SELECT word1 AS word FROM MarkovStart UNION ALL SELECT word2 FROM MarkovStart UNION ALL
+                    SELECT word1 FROM MarkovGrammar UNION ALL SELECT word2 FROM MarkovGrammar UNION ALL SELECT word3 FROM MarkovGrammar
+                );""", auto_commit=False)
+            # Case-fold each distinct word once, exactly like `self.nocase`
+            self.add_execute_queue("UPDATE Vocabulary SET word_folded = nocase(word);", auto_commit=False)
+            self.execute_commit()
+
+            logger.info("Converting words to IDs...")
+            self.add_execute_queue("""
+                INSERT INTO MarkovStart_modified (word1, word2, count)
+                SELECT v1.id, v2.id, s.count
+                FROM MarkovStart AS s
+                JOIN Vocabulary AS v1 ON v1.word = s.word1
+                JOIN Vocabulary AS v2 ON v2.word = s.word2
+                ORDER BY 1, 2;""", auto_commit=False)
+            self.add_execute_queue("""
+                INSERT INTO MarkovGrammar_modified (word1, word2, word3, count)
+                SELECT v1.id, v2.id, v3.id, g.count
+                FROM MarkovGrammar AS g
+                JOIN Vocabulary AS v1 ON v1.word = g.word1
+                JOIN Vocabulary AS v2 ON v2.word = g.word2
+                JOIN Vocabulary AS v3 ON v3.word = g.word3
+                ORDER BY 1, 2, 3;""", auto_commit=False)
+            self.add_execute_queue("DROP TABLE MarkovStart;", auto_commit=False)
+            self.add_execute_queue("DROP TABLE MarkovGrammar;", auto_commit=False)
+            self.add_execute_queue("ALTER TABLE MarkovStart_modified RENAME TO MarkovStart;", auto_commit=False)
+            self.add_execute_queue("ALTER TABLE MarkovGrammar_modified RENAME TO MarkovGrammar;", auto_commit=False)
+            # Recreate the StartIndex with IDs
+            self.add_execute_queue("DROP TABLE StartIndex;", auto_commit=False)
+            self.add_start_index_tables_queue()
+            self.execute_commit()
+
+            with self._write_lock:
+                cur = self.writer.cursor()
+                cur.execute("begin")
+                for first_char in list(string.ascii_uppercase) + ["_"]:
+                    self.rebuild_start_index(cur, first_char)
+                # The version is set before the files are swapped, so the swap is the final step of the update
+                cur.execute("DELETE FROM Version;")
+                cur.execute("INSERT INTO Version (version) VALUES (7);")
+                cur.execute("commit")
+            self.replace_with_modified(channel)
+
+    def update_v8(self) -> None:
+        """Update the Database structure to add the "unlearned" column to the DeltaLog table, which
+        holds the number of the last unlearned message of the journal that was applied to the Database.
+
+        The DeltaLog table itself is created by `self.create_tables` if it does not exist yet.
+
+        This function also sets the version to 8.
+        """
+        if self.get_version() < 8:
+            columns = [column[1] for column in self.execute("PRAGMA table_info(DeltaLog);", fetch=True)]
+            if columns and "unlearned" not in columns:
+                self.add_execute_queue("ALTER TABLE DeltaLog ADD COLUMN unlearned INTEGER NOT NULL DEFAULT 0;", auto_commit=False)
+            self.add_execute_queue("DELETE FROM Version;", auto_commit=False)
+            self.add_execute_queue("INSERT INTO Version (version) VALUES (8);", auto_commit=False)
+            self.execute_commit()
+
+    def update_v9(self) -> None:
+        """Update the Database structure to add the WordIndex table, which maps every word to the first
+        words of the rows that contain it as a later word, and fill it from all rows of MarkovStart and MarkovGrammar.
+
+        This function also sets the version to 9.
+        """
+        if self.get_version() < 9:
+            logger.info("Updating Database to new version - indexes which rows contain each word, to purge blacklisted words.")
+            self.add_word_index_table_queue()
+            self.add_execute_queue("""
+                INSERT OR IGNORE INTO WordIndex (word, word1)
+                SELECT word2, word1 FROM MarkovGrammar UNION
+                SELECT word3, word1 FROM MarkovGrammar UNION
+                SELECT word2, word1 FROM MarkovStart
+                ORDER BY 1, 2;""", auto_commit=False)
+            self.add_execute_queue("DELETE FROM Version;", auto_commit=False)
+            self.add_execute_queue("INSERT INTO Version (version) VALUES (9);", auto_commit=False)
+            self.execute_commit()
+
+    def update_v10(self) -> None:
+        """Update the Database structure to add the "word_lower" column to the Vocabulary table, which holds
+        every word lowercased with `str.lower`, like the `Blacklist` does, to find the words to purge.
+        Unlike "word_folded", this also lowercases non-ASCII letters, e.g. "ÉCOLE" to "école".
+
+        The column and its index are also created by `self.add_tables_queue` if the Vocabulary does not exist yet.
+
+        This function also sets the version to 10.
+        """
+        if self.get_version() < 10:
+            logger.info("Updating Database to new version - stores lowercase words, to purge blacklisted words in any case.")
+            columns = [column[1] for column in self.execute("PRAGMA table_info(Vocabulary);", fetch=True)]
+            if "word_lower" not in columns:
+                self.add_execute_queue("ALTER TABLE Vocabulary ADD COLUMN word_lower TEXT NOT NULL DEFAULT '';", auto_commit=False)
+            with self._write_lock:
+                self.writer.create_function("lower_unicode", 1, str.lower, deterministic=True)
+            self.add_execute_queue("UPDATE Vocabulary SET word_lower = lower_unicode(word);", auto_commit=False)
+            self.add_execute_queue(
+                "CREATE INDEX IF NOT EXISTS Vocabulary_lower ON Vocabulary (word_lower);", auto_commit=False)
+            self.add_execute_queue("DELETE FROM Version;", auto_commit=False)
+            self.add_execute_queue("INSERT INTO Version (version) VALUES (10);", auto_commit=False)
+            self.execute_commit()
+
+    def copy_to_modified(self, channel: str) -> None:
+        """Copy `MarkovChain_{channel}.db` to `MarkovChain_{channel}_modified.db`, and use that copy
+        until `self.replace_with_modified` is called. Used for updates that must not modify the original.
+
+        Args:
+            channel (str): The name of the Twitch channel on which the bot is running.
+        """
+        from shutil import copyfile
+        channel = channel.replace('#', '').lower()
+        # Closing the connections checkpoints the WAL into the database file before we copy it
+        self.close()
+        # Remove what is left of a previously interrupted update, as an old WAL file would be applied to the new copy
+        for extension in ("", "-wal", "-shm"):
+            if os.path.isfile(f"MarkovChain_{channel}_modified.db{extension}"):
+                os.remove(f"MarkovChain_{channel}_modified.db{extension}")
+        copyfile(f"MarkovChain_{channel}.db",
+                 f"MarkovChain_{channel}_modified.db")
+        logger.info(
+            f"Created a copy of the database called \"MarkovChain_{channel}_modified.db\". The update will modify this file.")
+
+        # Temporarily set self.db_name to the modified one
+        self.set_db_name(f"MarkovChain_{channel}_modified.db")
+
+    def create_modified(self, channel: str) -> None:
+        """Create an empty `MarkovChain_{channel}_modified.db`, and use it until `self.replace_with_modified`
+        is called. Used for updates that rebuild the database from the original, which they only read.
+
+        If an earlier attempt at the update was interrupted after recording its progress in a MigrationCheckpoint
+        table, see `Migration.TableMigration`, its `MarkovChain_{channel}_modified.db` is used again instead.
+
+        Args:
+            channel (str): The name of the Twitch channel on which the bot is running.
+        """
+        channel = channel.replace('#', '').lower()
+        self.close()
+        if os.path.isfile(f"MarkovChain_{channel}_modified.db"):
+            conn = sqlite3.connect(f"MarkovChain_{channel}_modified.db")
+            try:
+                resumable = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'MigrationCheckpoint';").fetchall()
+            except sqlite3.DatabaseError:
+                resumable = False
+            finally:
+                conn.close()
+            if resumable:
+                logger.info(f"Continuing the interrupted update in \"MarkovChain_{channel}_modified.db\".")
+                self.set_db_name(f"MarkovChain_{channel}_modified.db")
+                return
+            # Remove what is left of an update that was interrupted before recording any progress
+            for extension in ("", "-wal", "-shm"):
+                if os.path.isfile(f"MarkovChain_{channel}_modified.db{extension}"):
+                    os.remove(f"MarkovChain_{channel}_modified.db{extension}")
+        logger.info(
+            f"Created a new database called \"MarkovChain_{channel}_modified.db\". The update will fill this file.")
+        self.set_db_name(f"MarkovChain_{channel}_modified.db")
+
+    def replace_with_modified(self, channel: str) -> None:
+        """Keep `MarkovChain_{channel}.db` as `MarkovChain_{channel}_backup.db`, and then replace it
+        with the copy made by `self.copy_to_modified`, and use that again.
+
+        If the original was already kept by an earlier update while starting up, it is not overwritten,
+        so the backup is always the database from before all updates.
+
+        Args:
+            channel (str): The name of the Twitch channel on which the bot is running.
+        """
+        channel = channel.replace('#', '').lower()
+        # Reclaim the space of everything that was dropped from the copy
+        self.execute("VACUUM;")
+
+        # Keep the non-modified, old version of the Database as a "_backup.db" file, unless it is the result
+        # of an earlier update in this run, and then atomically turn the modified file into the new main file.
+        self.close()
+        if not self._backup_created:
+            from shutil import copyfile
+            if os.path.isfile(f"MarkovChain_{channel}_backup.db"):
+                os.remove(f"MarkovChain_{channel}_backup.db")
+            try:
+                os.link(f"MarkovChain_{channel}.db",
+                        f"MarkovChain_{channel}_backup.db")
+            except OSError:
+                copyfile(f"MarkovChain_{channel}.db",
+                         f"MarkovChain_{channel}_backup.db")
+            self._backup_created = True
+        os.replace(f"MarkovChain_{channel}_modified.db",
+                   f"MarkovChain_{channel}.db")
+
+        # Revert to using .db instead of _modified.db
+        self.set_db_name(f"MarkovChain_{channel}.db")
+
+        logger.info(
+            f"Kept original database file \"MarkovChain_{channel}.db\" as \"MarkovChain_{channel}_backup.db\". This file is *not* used, and can safely be deleted.")
+        logger.info(
+            f"Renamed updated database file \"MarkovChain_{channel}_modified.db\" to \"MarkovChain_{channel}.db\".")
+
+    def get_version(self) -> int:
+        """Get the version of the Database structure, or 0 if the Database has no Version table.
+
+        Returns:
+            int: The version of the Database structure.
+        """
+        # Throws OperationalError if the Version table does not exist,
+        # in which case we definitely want to upgrade.
+        try:
+            version = self.execute(
+                "SELECT version FROM Version ORDER BY version DESC LIMIT 1;", fetch=True)
+        except sqlite3.OperationalError:
+            version = []
+        return version[0][0] if version else 0
+
+    def add_tables_queue(self, suffix: str = "") -> None:
+        """Add the creation of the Vocabulary, MarkovStart and MarkovGrammar tables to the queue.
+
+        Vocabulary maps every learned word to an integer ID. It has an index on the case-folded words,
+        for case-insensitive lookups, and one on the lowercase words, for purging blacklisted words.
+        MarkovStart and MarkovGrammar store the IDs of the words.
+        They are WITHOUT ROWID tables, so the PRIMARY KEY is the table itself, and doubles as the
+        index for looking up all rows with a given first (and second) word.
+
+        Args:
+            suffix (str, optional): A suffix for the names of the MarkovStart and MarkovGrammar tables, 
+                e.g. "_modified" while updating the Database. Defaults to "".
+        """
+        self.add_execute_queue("""
+        CREATE TABLE IF NOT EXISTS Vocabulary (
+            id INTEGER PRIMARY KEY,
+            word TEXT NOT NULL UNIQUE,
+            word_folded TEXT NOT NULL,
+            word_lower TEXT NOT NULL DEFAULT ''
+        );
+        """, auto_commit=False)
+        self.add_execute_queue(
+            "CREATE INDEX IF NOT EXISTS Vocabulary_folded ON Vocabulary (word_folded);", auto_commit=False)
+        self.add_execute_queue(
+            "CREATE INDEX IF NOT EXISTS Vocabulary_lower ON Vocabulary (word_lower);", auto_commit=False)
+        self.add_execute_queue(f"""
+        CREATE TABLE IF NOT EXISTS MarkovStart{suffix} (
+            word1 INTEGER,
+            word2 INTEGER,
+            count INTEGER,
+            PRIMARY KEY (word1, word2)
+        ) WITHOUT ROWID;
+        """, auto_commit=False)
+        self.add_execute_queue(f"""
+        CREATE TABLE IF NOT EXISTS MarkovGrammar{suffix} (
+            word1 INTEGER,
+            word2 INTEGER,
+            word3 INTEGER,
+            count INTEGER,
+            PRIMARY KEY (word1, word2, word3)
+        ) WITHOUT ROWID;
+        """, auto_commit=False)
+
+    def add_start_index_tables_queue(self) -> None:
+        """Add the creation of the StartIndex and StartTotals tables to the queue.
+
+        StartIndex stores the cumulative count ranges of the starts of sentences, grouped by
+        the suffix of their first word, see `self.get_suffix`. A start with 
+        a count of 3 may e.g. own the range [10, 13), so drawing a random integer between 0 and the
+        extent of all ranges, and looking up the range that contains it, picks a weighted start.
+
+        Learning appends new ranges, and unlearning replaces the ranges of the unlearned start,
+        so ranges are never shifted. This leaves unused gaps, which are skipped when drawing, 
+        and removed by `self.rebuild_start_index` once they make up half of the extent.
+
+        StartTotals stores, per suffix, the sum of all counts, the extent of the ranges, the number
+        of ranges, and the number of ranges right after the last rebuild.
+        """
+        self.add_execute_queue("""
+        CREATE TABLE IF NOT EXISTS StartIndex (
+            suffix TEXT,
+            low INTEGER,
+            high INTEGER,
+            word1 INTEGER,
+            word2 INTEGER,
+            PRIMARY KEY (suffix, low)
+        ) WITHOUT ROWID;
+        """, auto_commit=False)
+        self.add_execute_queue(
+            "CREATE INDEX IF NOT EXISTS StartIndex_words ON StartIndex (suffix, word1, word2);", auto_commit=False)
+        self.add_execute_queue("""
+        CREATE TABLE IF NOT EXISTS StartTotals (
+            suffix TEXT,
+            total INTEGER,
+            extent INTEGER,
+            ranges INTEGER,
+            rebuilt_ranges INTEGER,
+            PRIMARY KEY (suffix)
+        );
+        """, auto_commit=False)
+        for first_char in list(string.ascii_uppercase) + ["_"]:
+            self.add_execute_queue(
+                "INSERT OR IGNORE INTO StartTotals (suffix, total, extent, ranges, rebuilt_ranges) VALUES (?, 0, 0, 0, 0);",
+                values=(first_char,),
+                auto_commit=False)
+
+    def add_word_index_table_queue(self) -> None:
+        """Add the creation of the WordIndex table to the queue.
+
+        WordIndex holds a (word, word1) pair for every word that is the second or third word of a row in
+        MarkovStart or MarkovGrammar, where word1 is the first word of that row. Rows with a given first word
+        are found through the PRIMARY KEY of those tables, so together they find every row containing a word.
+
+        Pairs are added whenever rows are learned, but not removed when unlearning removes rows, 
+        so the pairs may point to first words that no longer have a row with the word.
+        """
+        self.add_execute_queue("""
+        CREATE TABLE IF NOT EXISTS WordIndex (
+            word INTEGER,
+            word1 INTEGER,
+            PRIMARY KEY (word, word1)
+        ) WITHOUT ROWID;
+        """, auto_commit=False)
+
+    def rebuild_start_index(self, cur: sqlite3.Cursor, suffix: str, table: Optional[str] = None) -> None:
+        """Rebuild the StartIndex ranges and StartTotals for `suffix` from the starts in MarkovStart whose first word has that suffix.
+
+        Must be called within a transaction on the writer connection.
+
+        Args:
+            cur (sqlite3.Cursor): A cursor of the writer connection.
+            suffix (str): The suffix of the starts, e.g. "A" or "_". See `self.get_suffix`.
+            table (Optional[str], optional): The table to read all starts from instead, i.e. the
+                MarkovStart{suffix} tables with words stored as text, from before version 6. Defaults to None.
+        """
+        cur.execute(self.statements["StartIndex", "delete"], (suffix,))
+        if table is not None:
+            starts = f"SELECT word1, word2, count, SUM(count) OVER (ORDER BY rowid) AS cumulative FROM {table} WHERE count > 0"
+            cur.execute(f"""
+                INSERT INTO StartIndex (suffix, low, high, word1, word2)
+                SELECT ?, cumulative - count, cumulative, word1, word2
+                FROM ({starts});""", (suffix,))
+            cur.execute(f"""
+                INSERT OR REPLACE INTO StartTotals (suffix, total, extent, ranges, rebuilt_ranges)
+                SELECT ?, coalesce(SUM(count), 0), coalesce(SUM(count), 0), COUNT(*), COUNT(*)
+                FROM ({starts});""", (suffix,))
+            return
+
+        if suffix == "_":
+            operation, values = "rebuild_other", ()
+        else:
+            operation, values = "rebuild_letter", (suffix.lower(), chr(ord(suffix.lower()) + 1))
+        cur.execute(self.statements["StartIndex", operation], (suffix, *values))
+        cur.execute(self.statements["StartTotals", operation], (suffix, *values))
+
+    def write_start_index(self, cur: sqlite3.Cursor) -> None:
+        """Rebuild the StartIndex ranges for the suffixes changed in this transaction, if they have become too fragmented.
+
+        Must be called within a transaction on the writer connection.
+
+        Args:
+            cur (sqlite3.Cursor): A cursor of the writer connection.
+        """
+        for suffix in self._dirty_start_suffixes:
+            total, extent, ranges, rebuilt_ranges = cur.execute(
+                self.statements["StartTotals", "fragmentation"], (suffix,)).fetchone()
+            # Rebuild if over half of the extent are gaps, or if learning split starts into too many ranges
+            if extent - total > max(total, 100) or ranges > 2 * rebuilt_ranges + 100:
+                self.rebuild_start_index(cur, suffix)
+        self._dirty_start_suffixes.clear()
 
     def add_execute_queue(self, sql: str, values: Tuple[Any] = None, auto_commit: bool = True) -> None:
         """Add query and corresponding values to a queue, to be executed all at once.
@@ -478,17 +1171,22 @@ class Database:
             values ([Tuple[Any]], optional): Optional tuple of values to replace "?" in SQL queries.
                 Defaults to None.
         """
-        if values is not None:
-            self._execute_queue.append([sql, values])
-        else:
-            self._execute_queue.append([sql])
-        # Commit these executes if there are more than 25 queries
-        if auto_commit and len(self._execute_queue) > 25:
-            self.execute_commit()
+        with self._write_lock:
+            if values is not None:
+                self._execute_queue.append([sql, values])
+            else:
+                self._execute_queue.append([sql])
+            # Commit these executes if there are more than 25 queries
+            if auto_commit and len(self._execute_queue) > 25:
+                self.execute_commit()
 
     def execute_commit(self, fetch: bool = False) -> Any:
         """Execute the SQL queries added to the queue with `self.add_execute_queue`.
 
+        The delta tier of learned n-grams is compacted first, after which the n-grams of deleted messages are
+        unlearned, the queued queries are executed, and the StartIndex is maintained, all in one transaction 
+        on the writer connection.
+
         Args:
             fetch (bool, optional): Whether to return the fetchall() of the SQL queries.
                 Defaults to False.
@@ -496,20 +1194,166 @@ class Database:
         Returns:
             Any: The returned values from the SQL queries if `fetch` is true, otherwise None.
         """
-        if self._execute_queue:
-            with sqlite3.connect(self.db_name) as conn:
-                cur = conn.cursor()
+        with self._write_lock:
+            if self._execute_queue or self._unlearned_ngrams or self.delta.size:
+                start_t = time.perf_counter()
+                cur = self.writer.cursor()
                 cur.execute("begin")
-                for sql in self._execute_queue:
-                    cur.execute(*sql)
+                try:
+                    compacted = self.write_learn_buffer(cur)
+                    self.write_unlearned_ngrams(cur)
+                    for sql in self._execute_queue:
+                        cur.execute(*sql)
+                    self.write_start_index(cur)
+                except Exception:
+                    cur.execute("rollback")
+                    # Words may have been assigned IDs that no longer exist
+                    self.vocabulary.clear()
+                    raise
                 self._execute_queue.clear()
-                cur.execute("commit")
+                self._unlearned_ngrams.clear()
+                # Readers merging the delta tier with the database must not see the compacted counts in both
+                with self.delta.merge_lock.exclusive:
+                    cur.execute("commit")
+                    if compacted is not None:
+                        self.delta.drop(compacted)
+                    if self._invalidated_keys:
+                        self.transition_cache.invalidate(self._invalidated_keys)
+                        self._invalidated_keys.clear()
+                self.metrics.observe("database", "commit", start_t)
+                if compacted is not None:
+                    self.delta.release(compacted, time.perf_counter() - start_t)
                 if fetch:
                     return cur.fetchall()
 
+    def write_learn_buffer(self, cur: sqlite3.Cursor) -> Optional[DeltaCounts]:
+        """Compact the delta tier of learned n-grams into the database, using one `executemany` UPSERT per table.
+
+        The delta tier is frozen, and its words are translated to their IDs, adding new words to the Vocabulary table.
+        The rows are written sorted by their primary key, so they are inserted in order.
+        Must be called within a transaction on the writer connection. The frozen tier must be dropped
+        with `self.delta.drop` while committing, and released with `self.delta.release` once committed.
+
+        Args:
+            cur (sqlite3.Cursor): A cursor of the writer connection.
+
+        Returns:
+            Optional[DeltaCounts]: The frozen tier that was written, or None if nothing was learned.
+        """
+        frozen = self.delta.freeze()
+        if frozen is None:
+            return None
+        ids = self.vocabulary.get_ids(cur, (word for counter in frozen.tables.values() for ngram in counter for word in ngram))
+        # The (word, word1) pairs of the WordIndex, for the later words of every row
+        word_index: Set[Tuple[int, int]] = set()
+        for table, counter in frozen.tables.items():
+            word_index.update((ids[word], ids[ngram[0]]) for ngram in counter for word in ngram[1:])
+            if table == "MarkovStart":
+                cur.executemany(self.statements["MarkovStart", "upsert"],
+                                sorted((ids[ngram[0]], ids[ngram[1]], count) for ngram, count in counter.items()))
+                # Append a cumulative count range for each learned start, grouped by suffix
+                suffix_counters: DefaultDict[str, List[Tuple[Tuple[str, ...], int]]] = defaultdict(list)
+                for ngram, count in counter.items():
+                    suffix_counters[self.get_suffix(ngram[0][0])].append((ngram, count))
+                for suffix, items in suffix_counters.items():
+                    low = extent = cur.execute(self.statements["StartTotals", "extent"], (suffix,)).fetchone()[0]
+                    ranges = []
+                    for ngram, count in items:
+                        ranges.append((suffix, extent, extent + count, ids[ngram[0]], ids[ngram[1]]))
+                        extent += count
+                    cur.executemany(self.statements["StartIndex", "insert"], ranges)
+                    cur.execute(self.statements["StartTotals", "add"], (extent - low, extent, len(ranges), suffix))
+                    self._dirty_start_suffixes.add(suffix)
+            else:
+                self._invalidated_keys.update((self.nocase(ngram[0]), self.nocase(ngram[1])) for ngram in counter)
+                cur.executemany(self.statements["MarkovGrammar", "upsert"],
+                                sorted((ids[ngram[0]], ids[ngram[1]], ids[ngram[2]], count) for ngram, count in counter.items()))
+        cur.executemany(self.statements["WordIndex", "insert"], sorted(word_index))
+        if frozen.segments:
+            cur.execute(self.statements["DeltaLog", "compacted"], (max(frozen.segments),))
+        logger.debug(f"Wrote {frozen.size} rows for the delta tier of learned n-grams.")
+        self.written_rows += frozen.size
+        return frozen
+
+    def write_unlearned_ngrams(self, cur: sqlite3.Cursor) -> None:
+        """Unlearn the exact n-grams learned from deleted messages, queued by `self.unlearn_ngrams_now`.
+
+        Like `self.unlearn_now`, the count of every n-gram is reduced by 5 for every time it was learned
+        from the messages, and rows whose count is then 0 or less are removed. The 3-grams are updated
+        with one `executemany` that decrements the rows, and one that prunes them, sorted by their primary key.
+        Must be called within a transaction on the writer connection, after `self.write_learn_buffer`,
+        so everything learned from the messages is in the database.
+
+        Args:
+            cur (sqlite3.Cursor): A cursor of the writer connection.
+        """
+        if not self._unlearned_ngrams:
+            return
+        starts: Counter = Counter()
+        rules: Counter = Counter()
+        for learned_starts, learned_rules in self._unlearned_ngrams:
+            starts.update(map(tuple, learned_starts))
+            rules.update(map(tuple, learned_rules))
+        ids = self.vocabulary.get_ids(cur, (word for counter in (starts, rules) for ngram in counter for word in ngram))
+
+        keys = sorted(((ids[ngram[0]], ids[ngram[1]], ids[ngram[2]]), count) for ngram, count in rules.items())
+        cur.executemany(self.statements["MarkovGrammar", "decrement"], [(5 * count, *key) for key, count in keys])
+        cur.executemany(self.statements["MarkovGrammar", "prune"], [key for key, _count in keys])
+        self._invalidated_keys.update((self.nocase(ngram[0]), self.nocase(ngram[1])) for ngram in rules)
+
+        for (word1, word2), count in starts.items():
+            suffix = self.get_suffix(word1[0])
+            word1, word2 = ids[word1], ids[word2]
+            row = cur.execute(self.statements["MarkovStart", "count"], (word1, word2)).fetchone()
+            if row is None:
+                continue
+            # Replace the ranges of this start with one range for what remains of it, if anything
+            ranges = cur.execute(self.statements["StartIndex", "delete_start"], (suffix, word1, word2)).rowcount
+            cur.execute(self.statements["StartTotals", "subtract"], (row[1], ranges, suffix))
+            remaining = row[1] - 5 * count
+            if remaining > 0:
+                cur.execute(self.statements["MarkovStart", "set"], (remaining, word1, word2))
+                extent = cur.execute(self.statements["StartTotals", "extent"], (suffix,)).fetchone()[0]
+                cur.execute(self.statements["StartIndex", "insert"], (suffix, extent, extent + remaining, word1, word2))
+                cur.execute(self.statements["StartTotals", "add"], (remaining, extent + remaining, 1, suffix))
+            else:
+                cur.execute(self.statements["MarkovStart", "delete"], (word1, word2))
+            self._dirty_start_suffixes.add(suffix)
+
+    def add_learn_buffer(self, table: str, ngram: Tuple[str, ...], count: int = 1) -> None:
+        """Count `ngram` as learned for `table` in the delta tier, where it can immediately be generated from.
+
+        The delta tier is compacted into the database by the writer thread once it is full or old enough,
+        or directly if the writer thread is not running.
+
+        Args:
+            table (str): The name of the table in which `ngram` is stored.
+            ngram (Tuple[str, ...]): The learned 2-gram or 3-gram.
+            count (int, optional): The number of times `ngram` was learned. Defaults to 1.
+        """
+        self.delta.add(table, ngram, count)
+        self.learned_ngrams += count
+        if not self.write_thread.is_alive():
+            self.commit_if_due()
+
+    def commit_if_due(self) -> None:
+        """Execute `self.execute_commit` if the delta tier is full, or older than `self.learn_flush_interval` seconds.
+
+        Is called periodically by the writer thread, so learned n-grams are compacted even if nothing new is learned.
+        Also syncs the journal to disk if that is due.
+        """
+        if self.journal is not None:
+            self.journal.sync_if_due()
+        with self._write_lock:
+            age = self.delta.age()
+            if self.delta.size >= self.learn_flush_size or (age is not None and age >= self.learn_flush_interval):
+                self.execute_commit()
+
     def execute(self, sql: str, values: Tuple[Any] = None, fetch: bool = False):
         """Execute the SQL query with the corresponding values, potentially returning a result.
 
+        The query is executed on the writer connection, and committed immediately.
+
         Args:
             sql (str): The SQL query to add, potentially with "?" for where 
                 a value ought to be filled in.
@@ -521,18 +1365,136 @@ class Database:
         Returns:
             Any: The returned values from the SQL queries if `fetch` is true, otherwise None.
         """
-        with sqlite3.connect(self.db_name) as conn:
-            cur = conn.cursor()
+        with self._write_lock:
+            cur = self.writer.cursor()
             if values is None:
                 cur.execute(sql)
             else:
                 cur.execute(sql, values)
-            conn.commit()
             if fetch:
                 return cur.fetchall()
 
+    def query(self, sql: str, values: Tuple[Any] = None) -> List[Tuple[Any]]:
+        """Execute the read-only SQL query on this thread's read connection, and return the result.
+
+        Unlike `self.execute`, this never waits for the writer connection, 
+        so generating is not blocked by learning.
+
+        Args:
+            sql (str): The SQL query to execute, potentially with "?" for where 
+                a value ought to be filled in.
+            values ([Tuple[Any]], optional): Optional tuple of values to replace "?" in SQL queries.
+                Defaults to None.
+
+        Returns:
+            List[Tuple[Any]]: The fetchall() of the SQL query.
+        """
+        if values is None:
+            return self.reader.execute(sql).fetchall()
+        return self.reader.execute(sql, values).fetchall()
+
+    def connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """Open a new connection to `self.db_name`, with the PRAGMAs from `self.pragmas` applied.
+
+        Transactions are managed explicitly, so the connection is opened in autocommit mode.
+        The connection caches up to `self.statement_cache_size` prepared statements.
+
+        Args:
+            read_only (bool, optional): Whether the connection may only be used for reading.
+                Defaults to False.
+
+        Returns:
+            sqlite3.Connection: The newly opened connection.
+        """
+        conn = sqlite3.connect(self.db_name, isolation_level=None, check_same_thread=False,
+                               cached_statements=self.statement_cache_size)
+        for pragma, value in self.pragmas.items():
+            # The journal mode is persistent in the database file, and is set by the writer
+            if read_only and pragma == "journal_mode":
+                continue
+            conn.execute(f"PRAGMA {pragma} = {value};")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON;")
+        return conn
+
+    @property
+    def writer(self) -> sqlite3.Connection:
+        """The connection used for all writes. Only use while holding `self._write_lock`."""
+        if self._write_conn is None:
+            self._write_conn = self.connect()
+        return self._write_conn
+
+    @property
+    def reader(self) -> sqlite3.Connection:
+        """The read-only connection belonging to the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.connect(read_only=True)
+            self._local.conn = conn
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+        return conn
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all submitted mutations are executed, and all queued and buffered data is committed.
+
+        Args:
+            timeout (Optional[float], optional): The maximum number of seconds to wait. Defaults to None.
+
+        Returns:
+            bool: True if everything was committed within `timeout`.
+        """
+        return self.write_thread.flush(timeout)
+
+    def close(self) -> None:
+        """Stop the writer thread after it committed all submitted mutations, and close all open connections.
+
+        Connections are reopened lazily whenever the Database is used again, 
+        after which mutations are executed directly on the calling thread.
+        """
+        self.write_thread.stop()
+        with self._write_lock:
+            self.execute_commit()
+            self.delta.close()
+            if self._write_conn is not None:
+                self._write_conn.close()
+                self._write_conn = None
+        with self._read_conns_lock:
+            for conn in self._read_conns:
+                conn.close()
+            self._read_conns.clear()
+        # Make every thread open a fresh read connection the next time it reads
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the counters of learning.
+
+        Returns:
+            Dict[str, int]: The number of learned n-grams, the number of rows written to store them,
+                the number of rows removed by purging blacklisted words, and the number of queued queries
+                that are not executed yet.
+        """
+        # Read without the writer lock, so collecting metrics never waits for a commit
+        return {
+            "learned_ngrams": self.learned_ngrams,
+            "written_rows": self.written_rows,
+            "purged_rows": self.purged_rows,
+            "queued_queries": len(self._execute_queue),
+        }
+
+    def set_db_name(self, db_name: str) -> None:
+        """Close all connections, and point the Database to the `db_name` file instead.
+
+        Args:
+            db_name (str): The filename of the database to use.
+        """
+        self.close()
+        self.db_name = db_name
+
     def get_suffix(self, character: str) -> str:
-        """Transform a character into a member of string.ascii_lowercase or "_".
+        """Transform a character into a member of string.ascii_uppercase or "_".
+
+        Used to group the starts of sentences in StartIndex and StartTotals.
 
         Args:
             character (str): The character to normalize.
@@ -540,21 +1502,34 @@ class Database:
         Returns:
             str: The normalized character
         """
-        if character.lower() in string.ascii_lowercase:
+        if character in string.ascii_letters:
             return character.upper()
         return "_"
 
-    def add_whisper_ignore(self, username: str) -> None:
+    def nocase(self, word: str) -> str:
+        """Case-fold `word` exactly like the NOCASE collation of the tables, i.e. only lowercase A-Z.
+
+        Args:
+            word (str): The word to case-fold.
+
+        Returns:
+            str: The case-folded word.
+        """
+        return word.translate(NOCASE_TABLE)
+
+    def add_whisper_ignore(self, username: str) -> bool:
         """Add `username` to the WhisperIgnore table, indicating that they do not wish to be whispered.
 
+        Waits until the writer thread committed the change, so `self.check_whisper_ignore` reflects it
+        once this returns True.
+
         Args:
             username (str): The username of the user who no longer wants to be whispered.
+
+        Returns:
+            bool: False if the writer thread was too busy, and the change was not made.
         """
-        self.execute("""
-            INSERT OR IGNORE INTO WhisperIgnore(username)
-            SELECT ?;""",
-                     values=(username,)
-                     )
+        return self.write_whisper_ignore("add", username)
 
     def check_whisper_ignore(self, username: str) -> List[Tuple[str]]:
         """Returns a non-empty list only if `username` is in the WhisperIgnore table.
@@ -569,22 +1544,40 @@ class Database:
             List[Tuple[str]]: Either an empty list, or [('test_user',)]. 
                 Allows the use of `if not check_whisper_ignore(user): whisper(user)`
         """
-        return self.execute("""
-            SELECT username FROM WhisperIgnore
-            WHERE username = ?;""",
-                            values=(username,),
-                            fetch=True)
+        return self.query(self.statements["WhisperIgnore", "check"], values=(username,))
 
-    def remove_whisper_ignore(self, username: str) -> None:
+    def remove_whisper_ignore(self, username: str) -> bool:
         """Remove `username` from the WhisperIgnore table, indicating that they want to be whispered again.
 
+        Like `self.add_whisper_ignore`, waits until the writer thread committed the change.
+
         Args:
             username (str): The username of the user who wants to be whispered again.
+
+        Returns:
+            bool: False if the writer thread was too busy, and the change was not made.
         """
-        self.execute("""
-            DELETE FROM WhisperIgnore
-            WHERE username = ?;""",
-                     values=(username,))
+        return self.write_whisper_ignore("remove", username)
+
+    def write_whisper_ignore(self, operation: str, username: str) -> bool:
+        """Execute the "add" or "remove" WhisperIgnore statement for `username` on the writer thread, and wait until it is committed.
+
+        If the writer thread does not get to it within `Database.WHISPER_IGNORE_TIMEOUT` seconds, the change 
+        is cancelled and counted as failed in the metrics, so the user can be told to try again.
+
+        Args:
+            operation (str): Either "add" or "remove".
+            username (str): The username of the user.
+
+        Returns:
+            bool: True if the change was committed.
+        """
+        if self.write_thread.submit_wait(self.execute, self.statements["WhisperIgnore", operation], (username,),
+                                         timeout=Database.WHISPER_IGNORE_TIMEOUT):
+            return True
+        self.metrics.count("database_writes", "failed")
+        logger.warning(f"Failed to {operation} {username!r} for WhisperIgnore, as the database writer is too busy.")
+        return False
 
     def check_equal(self, l: List[Any]) -> bool:
         """True if `l` consists of items that are all identical
@@ -600,6 +1593,33 @@ class Database:
         """
         return l[0] * len(l) == l
 
+    def get_sampler(self, words: List[str]) -> TransitionSampler:
+        """Get a sampler over all learned next words with their counts, given the previous `key_length` words.
+
+        Samplers over the counts in the database are cached in `self.transition_cache`, which is invalidated
+        whenever compacting or unlearning changes the transitions for `words`. If the delta tier holds
+        counts for `words`, a sampler over both is built instead.
+
+        Args:
+            words (List[str]): The previous 2 words.
+
+        Returns:
+            TransitionSampler: The sampler over the next words. Has a length of 0 if there are none.
+        """
+        key = (self.nocase(words[0]), self.nocase(words[1]))
+        with self.delta.merge_lock.shared:
+            sampler = self.transition_cache.get(key)
+            if sampler is None:
+                generation = self.transition_cache.generation
+                data = self.query(self.statements["MarkovGrammar", "transitions"], values=key)
+                words = self.vocabulary.get_words(self.reader, (word_id for word_id, _count in data))
+                sampler = TransitionSampler([(words[word_id], count) for word_id, count in data])
+                self.transition_cache.put(key, sampler, sampler.size(), generation)
+            delta = self.delta.get_transitions(key)
+        if delta:
+            sampler = TransitionSampler(sampler.items() + delta)
+        return sampler
+
     def get_next(self, index: int, words: List[str]) -> Optional[str]:
         """Generate the next word in the sentence using learned data, given the previous `key_length` words.
 
@@ -612,14 +1632,8 @@ class Database:
         Returns:
             Optional[str]: The next word in the sentence, generated given the learned data.
         """
-        # Get all items
-        data = self.execute(f"""
-            SELECT word3, count FROM MarkovGrammar{self.get_suffix(words[0][0])}{self.get_suffix(words[1][0])}
-            WHERE word1 = ? AND word2 = ?;""",
-                            values=words,
-                            fetch=True)
         # Return a word picked from the data, using count as a weighting factor
-        return None if len(data) == 0 else self.pick_word(data, index)
+        return self.get_sampler(words).sample(index)
 
     def get_next_initial(self, index: int, words) -> Optional[str]:
         """Generate the next word in the sentence using learned data, given the previous `key_length` words.
@@ -634,20 +1648,12 @@ class Database:
         Returns:
             Optional[str]: The next word in the sentence, generated given the learned data.
         """
-        # Get all items
-        data = self.execute(f"""
-            SELECT word3, count FROM MarkovGrammar{self.get_suffix(words[0][0])}{self.get_suffix(words[1][0])}
-            WHERE word1 = ? AND word2 = ? AND word3 != '<END>';""",
-                            values=words,
-                            fetch=True)
-        # Return a word picked from the data, using count as a weighting factor
-        return None if len(data) == 0 else self.pick_word(data, index)
+        # Return a word picked from the data, excluding "<END>", using count as a weighting factor
+        return self.get_sampler(words).sample(index, initial=True)
 
     def get_next_single_initial(self, index: int, word: str) -> Optional[List[str]]:
         """Generate the next word in the sentence using learned data, given the previous word.
 
-        Randomly picks a start character for the second word by weighing all uppercase letters and "_" with their word frequency.
-
         Args:
             index (int): The index of this new word in the sentence.
             word (str): The previous word.
@@ -656,17 +1662,12 @@ class Database:
             Optional[List[str]]: The previous and newly generated word in the sentence as a list, generated given the learned data.
                 So, the previous word is taken directly the input of this method, and the second word is generated.
         """
-        # Randomly pick first character for the second word
-        char_two = random.choices(string.ascii_uppercase + '_',
-                                  weights=self.word_frequency)[0]
         # Get all items
-        data = self.execute(f"""
-            SELECT word2, count FROM MarkovGrammar{self.get_suffix(word[0])}{char_two}
-            WHERE word1 = ? AND word2 != '<END>';""",
-                            values=(word,),
-                            fetch=True)
+        with self.delta.merge_lock.shared:
+            data = self.query(self.statements["MarkovGrammar", "singles"], values=(self.nocase(word), "<end>"))
+            delta = self.delta.get_singles(self.nocase(word))
         # Return a word picked from the data, using count as a weighting factor
-        return None if len(data) == 0 else [word] + [self.pick_word(data, index)]
+        return None if len(data) + len(delta) == 0 else [word, self.pick_merged_word(data, delta, index)]
 
     def get_next_single_start(self, word: str) -> Optional[List[str]]:
         """Generate the second word in the sentence using learned data, given the very first word in the sentence.
@@ -679,13 +1680,28 @@ class Database:
                 So, the first word is taken directly the input of this method, and the second word is generated.
         """
         # Get all items
-        data = self.execute(f"""
-            SELECT word2, count FROM MarkovStart{self.get_suffix(word[0])}
-            WHERE word1 = ?;""",
-                            values=(word,),
-                            fetch=True)
+        with self.delta.merge_lock.shared:
+            data = self.query(self.statements["MarkovStart", "seconds"], values=(self.nocase(word),))
+            delta = self.delta.get_starts(self.nocase(word))
         # Return a word picked from the data, using count as a weighting factor
-        return None if len(data) == 0 else [word] + [self.pick_word(data)]
+        return None if len(data) + len(delta) == 0 else [word, self.pick_merged_word(data, delta)]
+
+    def pick_merged_word(self, data: List[Tuple[int, int]], delta: List[Tuple[str, int]], index: int = 0) -> str:
+        """Randomly pick a word from both `data` and `delta` with word frequency as the weight, like `self.pick_word`.
+
+        Args:
+            data (List[Tuple[int, int]]): A list of word ID - frequency pairs from the database.
+            delta (List[Tuple[str, int]]): A list of word - frequency pairs from the delta tier.
+            index (int, optional): The index of the newly generated word in the sentence. Defaults to 0.
+
+        Returns:
+            str: The pseudo-randomly picked word.
+        """
+        if not delta:
+            # Only the picked word has to be translated
+            return self.vocabulary.get_word_list(self.reader, [self.pick_word(data, index)])[0]
+        words = self.vocabulary.get_words(self.reader, (word_id for word_id, _count in data))
+        return self.pick_word([(words[word_id], count) for word_id, count in data] + delta, index)
 
     def pick_word(self, data: List[Tuple[str, int]], index: int = 0) -> str:
         """Randomly pick a word from `data` with word frequency as the weight.
@@ -714,36 +1730,51 @@ class Database:
     def get_start(self) -> List[str]:
         """Get a list of two words that mark as the start of a sentence.
 
-        This is randomly gathered from MarkovStart{character}.
+        The delta tier is picked from with its total count as weight. Otherwise, 
+        a suffix is picked using the total counts in StartTotals as weights, 
+        after which a random integer is drawn within the extent of the cumulative count ranges in 
+        StartIndex for that table. The range containing this integer determines the start. 
+        Draws that land in a gap between ranges are retried.
 
         Returns:
             List[str]: A list of two starting words, such as ["I", "am"].
         """
-        # Find one character start from
-        character = random.choices(list(string.ascii_lowercase) + ["_"],
-                                   weights=self.word_frequency,
-                                   k=1)[0]
-
-        # Get all first word, second word, frequency triples,
-        # e.g. [("I", "am", 3), ("You", "are", 2), ...]
-        data = self.execute(
-            f"SELECT * FROM MarkovStart{character};",
-            fetch=True)
-
-        # If nothing has ever been said
-        if len(data) == 0:
-            return []
-
-        # Return a (weighted) randomly chosen 2-gram
-        return list(random.choices(data,
-                                   weights=[tup[-1] for tup in data],
-                                   k=1)[0][:-1])
+        # The delta tier and the database must not both hold the compacted starts while they are merged
+        with self.delta.merge_lock.shared:
+            # Get the suffix, total count and range extent for the starts with each suffix,
+            # e.g. [("A", 1532, 1712), ("B", 403, 403), ...]
+            totals = self.query(self.statements["StartTotals", "totals"])
+
+            delta_total = self.delta.get_start_total()
+            if delta_total and random.random() * (delta_total + sum(tup[1] for tup in totals)) < delta_total:
+                start = self.delta.pick_start()
+                if start:
+                    return start
+
+            # If nothing has ever been said
+            if len(totals) == 0:
+                return []
+
+            # Find one character start from
+            suffix, _total, extent = random.choices(totals, weights=[tup[1] for tup in totals])[0]
+
+            for _ in range(10):
+                value = random.randrange(extent)
+                data = self.query(self.statements["StartIndex", "find"], values=(suffix, value))
+                if data and value < data[0][2]:
+                    return self.vocabulary.get_word_list(self.reader, list(data[0][:2]))
+
+            # Only reached if the drawn values repeatedly landed in gaps, fall back to the ranges themselves
+            data = self.query(self.statements["StartIndex", "ranges"], values=(suffix,))
+            if len(data) == 0:
+                return []
+            return self.vocabulary.get_word_list(self.reader, list(random.choices(data, weights=[tup[-1] for tup in data])[0][:-1]))
 
     def add_rule_queue(self, item: List[str]) -> None:
         """Adds a rule to the queue, ready to be entered into the knowledge base, given a 3-gram `item`.
 
-        The rules on the queue are added with `self.add_execute_queue`, 
-        which automatically executes the queries in the queue when there are enough queries waiting.
+        The rule is counted in the delta tier with `self.add_learn_buffer`, which is compacted
+        into the database in bulk when it is full or old enough.
 
         Whenever `item` consists of three identical words, e.g. ["Kappa", "Kappa", "Kappa"], then 
         we perform no learning. If we did, this could cause infinite recursion in generation.
@@ -762,38 +1793,107 @@ class Database:
             logger.warning(
                 f"Failed to add item to rules. Item contains empty string: {item!r}")
             return
-        self.add_execute_queue(f'''
-            INSERT OR REPLACE INTO MarkovGrammar{self.get_suffix(item[0][0])}{self.get_suffix(item[1][0])} (word1, word2, word3, count)
-            VALUES (?, ?, ?, coalesce(
-                (
-                    SELECT count + 1 FROM MarkovGrammar{self.get_suffix(item[0][0])}{self.get_suffix(item[1][0])}
-                    WHERE word1 = ? COLLATE BINARY AND word2 = ? COLLATE BINARY AND word3 = ? COLLATE BINARY
-                ),
-                1)
-            )''',
-                               values=item + item)
+        self.add_learn_buffer("MarkovGrammar", tuple(item))
 
     def add_start_queue(self, item: List[str]) -> None:
         """Adds a rule to the queue, ready to be entered into the knowledge base, given a 2-gram `item`.
 
-        The rules on the queue are added with `self.add_execute_queue`, 
-        which automatically executes the queries in the queue when there are enough queries waiting.
+        The rule is counted in the delta tier with `self.add_learn_buffer`, which is compacted
+        into the database in bulk when it is full or old enough.
 
         Args:
             item (List[str]): A 2-gram, e.g. ['How', 'are']. This is learned by placing this
                 in the MarkovStartH table, where it can be randomly (with frequency as weight)
                 picked as a start of a sentence.
         """
-        self.add_execute_queue(f'''
-            INSERT OR REPLACE INTO MarkovStart{self.get_suffix(item[0][0])} (word1, word2, count)
-            VALUES (?, ?, coalesce(
-                (
-                    SELECT count + 1 FROM MarkovStart{self.get_suffix(item[0][0])}
-                    WHERE word1 = ? COLLATE BINARY AND word2 = ? COLLATE BINARY
-                ),
-                1)
-            )''',
-                               values=item + item)
+        self.add_learn_buffer("MarkovStart", tuple(item))
+
+    def learn_counts(self, starts: Dict[Tuple[str, ...], int], rules: Dict[Tuple[str, ...], int]) -> None:
+        """Count many learned starts and rules at once in the delta tier, and compact it on the calling thread if it is due.
+
+        Equivalent to calling `self.add_start_queue` and `self.add_rule_queue` for every learned
+        n-gram, but for learning in bulk. See `Train.py`.
+
+        Args:
+            starts (Dict[Tuple[str, ...], int]): Maps learned 2-grams to the number of times they were learned.
+            rules (Dict[Tuple[str, ...], int]): Maps learned 3-grams to the number of times they were learned.
+        """
+        ngrams = [("MarkovStart", item, count) for item, count in starts.items()]
+        # Filter out the recursive case, and invalid rules, like `self.add_rule_queue`
+        ngrams += [("MarkovGrammar", item, count) for item, count in rules.items() if not self.check_equal(item) and "" not in item]
+        self.delta.add_many(ngrams)
+        self.learned_ngrams += sum(count for _table, _item, count in ngrams)
+        self.commit_if_due()
+
+    def learn(self, starts: List[Tuple[str, ...]], rules: List[Tuple[str, ...]], message_id: str = "") -> None:
+        """Learn the starts and 3-grams of one message, like `self.add_start_queue` and `self.add_rule_queue`.
+
+        All n-grams are recorded in the journal as one record, so learning a message writes to the journal once.
+        With `message_id`, the learned n-grams are remembered, so `self.unlearn_message` can unlearn exactly those.
+
+        Args:
+            starts (List[Tuple[str, ...]]): The 2-grams that start the sentences of the message, e.g. [('How', 'are')].
+            rules (List[Tuple[str, ...]]): The 3-grams of the message, e.g. [('How', 'are', 'you'), ('are', 'you', '<END>')].
+            message_id (str, optional): The `id` tag of the message. Defaults to "", i.e. not remembered.
+        """
+        learned_rules = []
+        for rule in rules:
+            # Filter out the recursive case, and invalid rules, like `self.add_rule_queue`
+            if self.check_equal(rule):
+                continue
+            if "" in rule:
+                logger.warning(f"Failed to add item to rules. Item contains empty string: {rule!r}")
+                continue
+            learned_rules.append(tuple(rule))
+        ngrams = [("MarkovStart", tuple(start), 1) for start in starts] + [("MarkovGrammar", rule, 1) for rule in learned_rules]
+        self.delta.add_many(ngrams)
+        self.learned_ngrams += len(ngrams)
+        self.learned_messages.add(message_id, starts, learned_rules)
+        if not self.write_thread.is_alive():
+            self.commit_if_due()
+
+    def unlearn_message(self, message_id: str) -> bool:
+        """Remove frequency of exactly the n-grams learned from the message with `message_id` from the knowledge base,
+        if it is one of the messages remembered by `self.learn`.
+
+        Like `self.unlearn`, the unlearned n-grams are recorded in the journal, after which the unlearning 
+        is executed on the writer thread by `self.unlearn_ngrams_now`, which is never dropped.
+        A repeated CLEARMSG of a message that was already unlearned, either exactly or with `self.unlearn`, is ignored.
+
+        Args:
+            message_id (str): The `id` tag of the deleted message, i.e. the `target-msg-id` tag of a CLEARMSG.
+
+        Returns:
+            bool: False if the message is not remembered, and must be unlearned with `self.unlearn` instead.
+        """
+        if self.learned_messages.was_unlearned(message_id):
+            return True
+        learned = self.learned_messages.pop(message_id)
+        if learned is None:
+            return False
+        number = self.delta.add_unlearn(learned)
+        self.write_thread.submit_required(self.unlearn_ngrams_now, learned, number)
+        return True
+
+    def unlearn_ngrams_now(self, learned: LearnedNgrams, number: Optional[int] = None, commit: bool = True) -> None:
+        """Remove frequency of the exact `learned` n-grams of a deleted message from the knowledge base, on the calling thread.
+
+        Args:
+            learned (LearnedNgrams): The starts and 3-grams learned from the message, see `LearnedMessages`.
+            number (Optional[int], optional): The number of this unlearned message in the journal, 
+                which is stored in the same transaction. Defaults to None.
+            commit (bool, optional): Whether to commit, or only queue the n-grams. Defaults to True.
+        """
+        unlearn_t = self.metrics.clock()
+        with self._write_lock:
+            self._unlearned_ngrams.append(learned)
+            if number is not None:
+                self.add_execute_queue(self.statements["DeltaLog", "unlearned"], values=(number,), auto_commit=False)
+        if commit:
+            self.execute_commit()
+            if number is not None:
+                self.delta.applied_unlearn(number)
+        self.metrics.observe("database", "unlearn", unlearn_t)
 
     def unlearn(self, message: str) -> None:
         """Remove frequency of 3-grams from `message` from the knowledge base.
@@ -802,43 +1902,222 @@ class Database:
         The frequency count for each of the 3-grams is reduced by 5, i.e. the message is unlearned by 5
         times the rate that a message is learned.
 
+        The 3-grams are taken from the words of `message` split on spaces, so 3-grams with punctuation do 
+        not match. Recent messages are unlearned exactly with `self.unlearn_message` instead.
+
         If this means the frequency for the 3-gram becomes negative,
         we delete the 3-gram from the knowledge base entirely.
 
+        The message is recorded in the journal, after which the unlearning is executed on the 
+        writer thread by `self.unlearn_now`, which is never dropped.
+
+        Args:
+            message (str): The message to unlearn.
+        """
+        number = self.delta.add_unlearn(message)
+        self.write_thread.submit_required(self.unlearn_now, message, number)
+
+    def unlearn_now(self, message: str, number: Optional[int] = None, commit: bool = True) -> None:
+        """Remove frequency of 3-grams from `message` from the knowledge base, on the calling thread.
+
         Args:
             message (str): The message to unlearn.
+            number (Optional[int], optional): The number of this unlearned message in the journal, 
+                which is stored in the same transaction. Defaults to None.
+            commit (bool, optional): Whether to commit, or only queue the queries. Defaults to True.
         """
+        unlearn_t = self.metrics.clock()
         words = message.split(" ")
         # Construct 3-grams
         tuples = [(words[i], words[i+1], words[i+2])
                   for i in range(0, len(words) - 2)]
+        # Words are matched case-insensitively through their case-folded versions in the Vocabulary
+        folded = [self.nocase(word) for word in words]
 
         # Unlearn start of sentence from MarkovStart
         if len(words) > 1:
-            # Reduce "count" by 5
-            self.add_execute_queue(f'''
-                UPDATE MarkovStart{self.get_suffix(words[0][0])}
-                SET count = count - 5
-                WHERE word1 = ? AND word2 = ?;''',
-                                   values=(words[0], words[1],))
-            # Delete if count is now less than 0.
-            self.add_execute_queue(f'''
-                DELETE FROM MarkovStart{self.get_suffix(words[0][0])}
-                WHERE word1 = ? AND word2 = ? AND count <= 0;''',
-                                   values=(words[0], words[1],))
+            suffix = self.get_suffix(words[0][0])
+            # Remove the ranges of this start from StartIndex, and subtract what will be unlearned from the total
+            self.add_execute_queue(self.statements["StartTotals", "subtract_unlearned"],
+                                   values=(folded[0], folded[1], suffix, folded[0], folded[1], suffix), auto_commit=False)
+            self.add_execute_queue(self.statements["StartIndex", "delete_unlearned"],
+                                   values=(suffix, folded[0], folded[1]), auto_commit=False)
+            # Reduce "count" by 5, and delete if "count" is now less than 0
+            self.add_execute_queue(self.statements["MarkovStart", "unlearn"], values=(folded[0], folded[1]), auto_commit=False)
+            self.add_execute_queue(self.statements["MarkovStart", "delete_unlearned"], values=(folded[0], folded[1]), auto_commit=False)
+            # Append new ranges for what remains of this start
+            self.add_execute_queue(self.statements["StartIndex", "append_unlearned"],
+                                   values=(folded[0], folded[1], suffix), auto_commit=False)
+            self.add_execute_queue(self.statements["StartTotals", "extend_unlearned"],
+                                   values=(folded[0], folded[1], folded[0], folded[1], suffix), auto_commit=False)
+            with self._write_lock:
+                self._dirty_start_suffixes.add(suffix)
 
         # Unlearn all 3 word sections from Grammar
         for (word1, word2, word3) in tuples:
-            # Reduce "count" by 5
-            self.add_execute_queue(f'''
-                UPDATE MarkovGrammar{self.get_suffix(word1[0])}{self.get_suffix(word2[0])}
-                SET count = count - 5
-                WHERE word1 = ? AND word2 = ? AND word3 = ?;''',
-                                   values=(word1, word2, word3,))
-            # Delete if count is now less than 0.
-            self.add_execute_queue(f'''
-                DELETE FROM MarkovGrammar{self.get_suffix(word1[0])}{self.get_suffix(word2[0])}
-                WHERE word1 = ? AND word2 = ? AND word3 = ? AND count <= 0;''',
-                                   values=(word1, word2, word3, ))
+            word1, word2, word3 = self.nocase(word1), self.nocase(word2), self.nocase(word3)
+            with self._write_lock:
+                self._invalidated_keys.add((word1, word2))
+            # Reduce "count" by 5, and delete if "count" is now less than 0
+            self.add_execute_queue(self.statements["MarkovGrammar", "unlearn"], values=(word1, word2, word3), auto_commit=False)
+            self.add_execute_queue(self.statements["MarkovGrammar", "delete_unlearned"], values=(word1, word2, word3), auto_commit=False)
+
+        # All queries are committed in one transaction, alongside the number of this unlearned message
+        if number is not None:
+            self.add_execute_queue(self.statements["DeltaLog", "unlearned"], values=(number,), auto_commit=False)
+        if commit:
+            self.execute_commit()
+            if number is not None:
+                self.delta.applied_unlearn(number)
+        self.metrics.observe("database", "unlearn", unlearn_t)
 
-        self.execute_commit()
+    def purge(self, terms: List[Tuple[str, ...]], done: Optional[Callable[[Dict[str, float]], None]] = None) -> None:
+        """Remove every row containing any of `terms` from the knowledge base, e.g. because they were blacklisted.
+
+        The purge is executed on the writer thread by `self.purge_now`, in transactions of at most
+        `Database.PURGE_BATCH_SIZE` first words each, so learning and generating continue in between.
+        The purge is never dropped, even if the write queue is full.
+
+        Args:
+            terms (List[Tuple[str, ...]]): The words and phrases to remove as sequences of tokens, 
+                e.g. [("kappa",), ("ca", "n't", "stop")]. See `Blacklist.terms`.
+            done (Optional[Callable[[Dict[str, float]], None]], optional): Called on the writer thread with 
+                the statistics of `self.purge_now` once the purge is complete. Defaults to None.
+        """
+        self.write_thread.submit_required(self.purge_now, terms, done)
+
+    def purge_now(self, terms: List[Tuple[str, ...]], done: Optional[Callable[[Dict[str, float]], None]] = None) -> Dict[str, float]:
+        """Remove every row containing any of `terms` from the knowledge base, on the calling thread.
+
+        A row is removed if any of its words is a term of one word, or if a term of several words occurs in it,
+        ignoring case like the `Blacklist`, so also of non-ASCII letters. Terms of more than 3 words never fit in one row, and are skipped.
+
+        Rows are only read through their PRIMARY KEY, per first word: all rows of a purged word, and for
+        each first word that the WordIndex table lists for a purged word, the rows with that second or 
+        third word. A term of several words is looked up with its first word(s) as the key.
+
+        Args:
+            terms (List[Tuple[str, ...]]): The words and phrases to remove as sequences of tokens.
+            done (Optional[Callable[[Dict[str, float]], None]], optional): Called with the statistics once
+                the purge is complete. Defaults to None.
+
+        Returns:
+            Dict[str, float]: The number of removed MarkovGrammar and MarkovStart rows and their sum, the number of
+                visited first words, skipped terms and transactions, and the duration in seconds.
+        """
+        start_t = time.perf_counter()
+        purge_t = self.metrics.clock()
+        # The IDs of the purged words, which are removed wherever they occur
+        words: Set[int] = set()
+        # Per first word, the purged words that may occur later in its rows, and the purged ID sequences 
+        # that may occur in its rows, after as many words as the offset
+        later_words: DefaultDict[int, Set[int]] = defaultdict(set)
+        phrases: DefaultDict[int, Set[Tuple[int, Tuple[int, ...]]]] = defaultdict(set)
+        skipped = 0
+        with self._write_lock:
+            # Rows learned before the terms were blacklisted may still be in the delta tier
+            self.execute_commit()
+            cur = self.writer.cursor()
+
+            def first_words(word_id: int) -> List[int]:
+                return [row[0] for row in cur.execute(self.statements["WordIndex", "first_words"], (word_id,))]
+
+            for term in terms:
+                if len(term) > 3:
+                    skipped += 1
+                    continue
+                # The IDs of all words equal to each token, ignoring case exactly like the Blacklist, i.e. with `str.lower`
+                variants = [[row[0] for row in cur.execute(self.statements["Vocabulary", "lowered"], (token.lower(),))]
+                            for token in term]
+                if len(term) == 1:
+                    for word_id in variants[0]:
+                        words.add(word_id)
+                        for word1 in first_words(word_id):
+                            later_words[word1].add(word_id)
+                    continue
+                for phrase in itertools.product(*variants):
+                    phrases[phrase[0]].add((0, phrase))
+                    # A phrase of two words also fits after the first word of a MarkovGrammar row
+                    if len(phrase) == 2:
+                        for word1 in first_words(phrase[0]):
+                            phrases[word1].add((1, phrase))
+
+        ordered = sorted(words.union(later_words, phrases))
+        grammar_rows = start_rows = transactions = 0
+        for i in range(0, len(ordered), Database.PURGE_BATCH_SIZE):
+            with self._write_lock:
+                cur = self.writer.cursor()
+                cur.execute("begin")
+                try:
+                    # The keys of the MarkovGrammar rows to remove, and the (word2, count) of the MarkovStart rows to remove
+                    rows: Set[Tuple[int, int, int]] = set()
+                    for word1 in ordered[i:i + Database.PURGE_BATCH_SIZE]:
+                        starts: Set[Tuple[int, int]] = set()
+                        if word1 in words:
+                            rows.update((word1, word2, word3) for word2, word3 in cur.execute(self.statements["MarkovGrammar", "rows"], (word1,)))
+                            starts.update(cur.execute(self.statements["MarkovStart", "rows"], (word1,)))
+                        else:
+                            for word_id in later_words.get(word1, ()):
+                                rows.update((word1, word_id, word3) for word3, in cur.execute(self.statements["MarkovGrammar", "thirds"], (word1, word_id)))
+                                rows.update((word1, word2, word_id) for word2, in cur.execute(self.statements["MarkovGrammar", "seconds"], (word1, word_id)))
+                                starts.update(cur.execute(self.statements["MarkovStart", "count"], (word1, word_id)))
+                            for offset, phrase in phrases.get(word1, ()):
+                                if offset == 1:
+                                    rows.add((word1, *phrase))
+                                elif len(phrase) == 3:
+                                    rows.add(phrase)
+                                else:
+                                    rows.update((word1, phrase[1], word3) for word3, in cur.execute(self.statements["MarkovGrammar", "thirds"], phrase))
+                                    starts.update(cur.execute(self.statements["MarkovStart", "count"], phrase))
+
+                        if starts:
+                            # Remove the ranges of each start from StartIndex, and subtract its count from the total
+                            suffix = self.get_suffix(self.vocabulary.get_words(self.writer, [word1])[word1][0])
+                            for word2, count in starts:
+                                ranges = cur.execute(self.statements["StartIndex", "delete_start"], (suffix, word1, word2)).rowcount
+                                cur.execute(self.statements["StartTotals", "subtract"], (count, ranges, suffix))
+                                cur.execute(self.statements["MarkovStart", "delete"], (word1, word2))
+                            self._dirty_start_suffixes.add(suffix)
+                            start_rows += len(starts)
+
+                    # Phrases of three words were not looked up, so only count the rows that existed
+                    cur.executemany(self.statements["MarkovGrammar", "delete"], sorted(rows))
+                    grammar_rows += cur.rowcount
+                    self.write_start_index(cur)
+                    keys = {row[:2] for row in rows}
+                    words_by_id = self.vocabulary.get_words(self.writer, (word_id for key in keys for word_id in key))
+                    self._invalidated_keys.update((self.nocase(words_by_id[word1]), self.nocase(words_by_id[word2])) for word1, word2 in keys)
+                except Exception:
+                    cur.execute("rollback")
+                    raise
+                cur.execute("commit")
+                transactions += 1
+                if self._invalidated_keys:
+                    self.transition_cache.invalidate(self._invalidated_keys)
+                    self._invalidated_keys.clear()
+            # Compact what was learned meanwhile, just like when the writer thread is idle
+            self.commit_if_due()
+
+        # None of the rows listed for the purged words remain
+        with self._write_lock:
+            cur = self.writer.cursor()
+            cur.execute("begin")
+            cur.executemany(self.statements["WordIndex", "delete"], [(word_id,) for word_id in sorted(words)])
+            cur.execute("commit")
+        self.purged_rows += grammar_rows + start_rows
+        self.metrics.observe("database", "purge", purge_t)
+
+        stats = {
+            "grammar_rows": grammar_rows,
+            "start_rows": start_rows,
+            "rows": grammar_rows + start_rows,
+            "first_words": len(ordered),
+            "skipped_terms": skipped,
+            "transactions": transactions,
+            "seconds": time.perf_counter() - start_t,
+        }
+        logger.info(f"Purged {stats['rows']} rows containing any of {terms} in {stats['seconds']:.2f}s, "
+                    f"visiting {len(ordered)} first words in {transactions} transactions.")
+        if done is not None:
+            done(stats)
+        return stats
@@ -0,0 +1,352 @@
+import logging, random, threading, time
+from collections import Counter, defaultdict
+from typing import Any, DefaultDict, Dict, List, Optional, Tuple, Union
+
+from Journal import Journal
+from LearnedMessages import LearnedNgrams
+from Vocabulary import NOCASE_TABLE
+
+logger = logging.getLogger(__name__)
+
+class DeltaCounts:
+    """
+    Counts of learned n-grams that are not written to the database yet, alongside indices
+    on their case-folded words for generating.
+    """
+    def __init__(self) -> None:
+        # Maps "MarkovStart" and "MarkovGrammar" to the counts of their n-grams, as written to the database
+        self.tables: DefaultDict[str, Counter] = defaultdict(Counter)
+        # Maps case-folded (word1, word2) keys to the counts of the next words
+        self.transitions: DefaultDict[Tuple[str, str], Counter] = defaultdict(Counter)
+        # Maps case-folded first words of 3-grams to the counts of their second words, excluding "<END>"
+        self.singles: DefaultDict[str, Counter] = defaultdict(Counter)
+        # Maps case-folded first words of starts to the counts of their second words
+        self.starts: DefaultDict[str, Counter] = defaultdict(Counter)
+        self.start_total = 0
+        # The number of distinct n-grams
+        self.size = 0
+        # The time the first n-gram was learned
+        self.created: Optional[float] = None
+        # The journal segments holding these counts
+        self.segments: List[int] = []
+
+    def add(self, table: str, ngram: Tuple[str, ...], count: int) -> None:
+        if self.created is None:
+            self.created = time.monotonic()
+        counter = self.tables[table]
+        if ngram not in counter:
+            self.size += 1
+        counter[ngram] += count
+        first, second = ngram[0].translate(NOCASE_TABLE), ngram[1].translate(NOCASE_TABLE)
+        if table == "MarkovStart":
+            self.starts[first][ngram[1]] += count
+            self.start_total += count
+        else:
+            self.transitions[(first, second)][ngram[2]] += count
+            if second != "<end>":
+                self.singles[first][ngram[1]] += count
+
+class MergeLock:
+    """
+    Lock that any number of readers share while they merge the delta tier with the database, and that
+    the writer holds exclusively while it commits a compacted tier and drops it.
+
+    So a reader sees the compacted counts either only in the frozen tier, or only in the database,
+    and never counts them twice. Waiting writers go before new readers, so generating never delays compacting.
+    Use `with merge_lock.shared:` to read, and `with merge_lock.exclusive:` to commit.
+    """
+    def __init__(self) -> None:
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+        self.shared = _SharedMergeLock(self)
+        self.exclusive = _ExclusiveMergeLock(self)
+
+class _SharedMergeLock:
+    def __init__(self, lock: MergeLock) -> None:
+        self.lock = lock
+
+    def __enter__(self) -> None:
+        lock = self.lock
+        with lock._condition:
+            while lock._writing or lock._waiting_writers:
+                lock._condition.wait()
+            lock._readers += 1
+
+    def __exit__(self, *exc_info: Any) -> None:
+        lock = self.lock
+        with lock._condition:
+            lock._readers -= 1
+            if not lock._readers and lock._waiting_writers:
+                lock._condition.notify_all()
+
+class _ExclusiveMergeLock:
+    def __init__(self, lock: MergeLock) -> None:
+        self.lock = lock
+
+    def __enter__(self) -> None:
+        lock = self.lock
+        with lock._condition:
+            lock._waiting_writers += 1
+            while lock._writing or lock._readers:
+                lock._condition.wait()
+            lock._waiting_writers -= 1
+            lock._writing = True
+
+    def __exit__(self, *exc_info: Any) -> None:
+        lock = self.lock
+        with lock._condition:
+            lock._writing = False
+            lock._condition.notify_all()
+
+class DeltaTier:
+    """
+    In-memory tier of learned n-gram counts, which generation reads merged with the counts in the database.
+
+    Learning only updates this tier, so it never waits for SQLite, even while the database is busy.
+    The writer thread of the `Database` periodically compacts this tier into the database: the tier
+    is frozen, a fresh tier takes new learned n-grams, and the frozen tier is written in one transaction
+    of sorted batches. Generation keeps reading the frozen tier until that transaction is committed.
+    Readers merge the tiers with the database while sharing `self.merge_lock`, which the writer holds 
+    exclusively to commit the transaction and drop the frozen tier, see `self.drop`.
+
+    The n-grams learned from every message, and every unlearned message, are recorded in a `Journal` 
+    as one record before they are counted, so a crash does not lose what was not committed yet. The journal rotates to a new segment 
+    whenever the tier is frozen, and the database stores the number of the last compacted segment 
+    in the same transaction as its counts. Unlearned messages are numbered, and the database stores
+    the number of the last one that was applied. Everything after these numbers is replayed when 
+    the database is opened, see `self.replay`.
+    """
+    def __init__(self, journal: Optional[Journal]) -> None:
+        """Initialize the empty tier.
+
+        Args:
+            journal (Optional[Journal]): The journal to record learned n-grams and unlearned messages in.
+                None to disable the journal.
+        """
+        self.journal = journal
+        self.active = DeltaCounts()
+        self.frozen: Optional[DeltaCounts] = None
+        # Maps the numbers of unlearned messages that are not applied yet to the messages, or the n-grams learned from them
+        self.pending_unlearns: Dict[int, Union[str, LearnedNgrams]] = {}
+        self.next_unlearn = 1
+        self._lock = threading.Lock()
+        self.merge_lock = MergeLock()
+
+        self.compactions = 0
+        self.compacted_ngrams = 0
+        self.last_merge_s = 0.0
+        self.max_merge_s = 0.0
+        self.total_merge_s = 0.0
+
+    def replay(self, compacted: int, unlearned: int) -> Tuple[int, List[Tuple[int, Union[str, LearnedNgrams]]]]:
+        """Count the n-grams from all journal segments after `compacted`, and find the unlearned messages after `unlearned`.
+
+        Unlearned messages are found in all segments, as an older segment may be the only one containing 
+        an unlearned message that was not applied yet. The replayed segments are removed once the tier 
+        is compacted, and older segments are removed immediately.
+
+        Args:
+            compacted (int): The number of the last segment that was compacted into the database.
+            unlearned (int): The number of the last unlearned message that was applied to the database.
+
+        Returns:
+            Tuple[int, List[Tuple[int, Union[str, LearnedNgrams]]]]: The number of replayed n-grams, and the numbers
+                and messages, or the n-grams learned from them, of the unlearned messages that must still be applied, in order.
+        """
+        if self.journal is None:
+            return 0, []
+        segments = self.journal.existing_segments()
+        replayed = 0
+        unlearns: Dict[int, Union[str, LearnedNgrams]] = {}
+        with self._lock:
+            for segment in segments:
+                for record in self.journal.read(segment):
+                    if record[0] == "unlearn":
+                        _kind, message, number = record
+                        if number > unlearned:
+                            unlearns[number] = message
+                        self.next_unlearn = max(self.next_unlearn, number + 1)
+                    elif segment > compacted:
+                        # Journals from before n-grams were recorded per message hold one n-gram per record
+                        for table, ngram, count in (record[1] if record[0] == "learn" else [record]):
+                            self.active.add(table, tuple(ngram), count)
+                            replayed += count
+                if segment > compacted:
+                    self.active.segments.append(segment)
+            self.next_unlearn = max(self.next_unlearn, unlearned + 1)
+            self.journal.segment = max(segments + [compacted]) + 1
+        self.journal.remove([segment for segment in segments if segment <= compacted])
+        return replayed, sorted(unlearns.items())
+
+    def add(self, table: str, ngram: Tuple[str, ...], count: int = 1) -> None:
+        """Record and count `ngram` as learned for `table`.
+
+        Args:
+            table (str): The name of the table in which `ngram` is stored.
+            ngram (Tuple[str, ...]): The learned 2-gram or 3-gram.
+            count (int, optional): The number of times `ngram` was learned. Defaults to 1.
+        """
+        self.add_many([(table, ngram, count)])
+
+    def add_many(self, ngrams: List[Tuple[str, Tuple[str, ...], int]]) -> None:
+        """Record all `ngrams` as one journal record, e.g. all n-grams learned from one message, and count them as learned.
+
+        Args:
+            ngrams (List[Tuple[str, Tuple[str, ...], int]]): The name of the table in which each n-gram is stored,
+                the learned 2-gram or 3-gram, and the number of times it was learned.
+        """
+        if not ngrams:
+            return
+        with self._lock:
+            if self.journal is not None:
+                self._add_segment(self.journal.append(["learn", ngrams]))
+            for table, ngram, count in ngrams:
+                self.active.add(table, ngram, count)
+
+    def add_unlearn(self, message: Union[str, LearnedNgrams]) -> int:
+        """Record `message` as unlearned, until it is applied to the database.
+
+        Args:
+            message (Union[str, LearnedNgrams]): The unlearned message, or the n-grams that were learned from it.
+
+        Returns:
+            int: The number of this unlearned message, see `self.applied_unlearn`.
+        """
+        with self._lock:
+            number = self.next_unlearn
+            self.next_unlearn += 1
+            if self.journal is not None:
+                self.pending_unlearns[number] = message
+                self._add_segment(self.journal.append(["unlearn", message, number]))
+            return number
+
+    def applied_unlearn(self, number: int) -> None:
+        """Stop tracking the unlearned message `number`, as it was committed to the database, or dropped."""
+        with self._lock:
+            self.pending_unlearns.pop(number, None)
+
+    def _add_segment(self, segment: int) -> None:
+        if segment not in self.active.segments:
+            self.active.segments.append(segment)
+
+    @property
+    def size(self) -> int:
+        """The number of distinct n-grams in the active and frozen tier."""
+        return self.active.size + (self.frozen.size if self.frozen is not None else 0)
+
+    def age(self) -> Optional[float]:
+        """The number of seconds since the oldest n-gram that was not compacted was learned, or None if there are none."""
+        tier = self.frozen or self.active
+        return None if tier.created is None else time.monotonic() - tier.created
+
+    def freeze(self) -> Optional[DeltaCounts]:
+        """Freeze the active tier to compact it, and start a fresh tier and journal segment for newly learned n-grams.
+
+        If the previous compaction failed, its frozen tier is returned again instead.
+
+        Returns:
+            Optional[DeltaCounts]: The tier to compact, or None if there is nothing to compact.
+        """
+        with self._lock:
+            if self.frozen is None and self.active.size:
+                self.frozen = self.active
+                self.active = DeltaCounts()
+                if self.journal is not None:
+                    self.journal.rotate()
+                    # The segments of the frozen tier are removed once it is compacted, 
+                    # so unlearned messages that are not applied yet are carried over
+                    for number, message in self.pending_unlearns.items():
+                        self._add_segment(self.journal.append(["unlearn", message, number]))
+            return self.frozen
+
+    def drop(self, frozen: DeltaCounts) -> None:
+        """Stop reading `frozen`, now that it is committed to the database.
+
+        Must be called while holding `self.merge_lock` exclusively, together with the commit.
+
+        Args:
+            frozen (DeltaCounts): The compacted tier.
+        """
+        with self._lock:
+            if self.frozen is frozen:
+                self.frozen = None
+
+    def release(self, frozen: DeltaCounts, merge_s: float) -> None:
+        """Drop `frozen` if it was not dropped yet, and remove its journal segments, now that it is committed to the database.
+
+        Args:
+            frozen (DeltaCounts): The compacted tier.
+            merge_s (float): The number of seconds it took to compact the tier.
+        """
+        self.drop(frozen)
+        with self._lock:
+            self.compactions += 1
+            self.compacted_ngrams += frozen.size
+            self.last_merge_s = merge_s
+            self.max_merge_s = max(self.max_merge_s, merge_s)
+            self.total_merge_s += merge_s
+        if self.journal is not None:
+            # Carried over unlearned messages must be on disk before the segments they were carried from are removed
+            self.journal.sync()
+            self.journal.remove(frozen.segments)
+
+    def _tiers(self) -> List[DeltaCounts]:
+        return [self.active] if self.frozen is None else [self.frozen, self.active]
+
+    def get_transitions(self, key: Tuple[str, str]) -> List[Tuple[str, int]]:
+        """Get the next words with their counts, for the case-folded (word1, word2) `key`."""
+        with self._lock:
+            return [item for tier in self._tiers() if key in tier.transitions for item in tier.transitions[key].items()]
+
+    def get_singles(self, word: str) -> List[Tuple[str, int]]:
+        """Get the second words of 3-grams with their counts, for the case-folded first `word`."""
+        with self._lock:
+            return [item for tier in self._tiers() if word in tier.singles for item in tier.singles[word].items()]
+
+    def get_starts(self, word: str) -> List[Tuple[str, int]]:
+        """Get the second words of starts with their counts, for the case-folded first `word`."""
+        with self._lock:
+            return [item for tier in self._tiers() if word in tier.starts for item in tier.starts[word].items()]
+
+    def get_start_total(self) -> int:
+        """Get the total count of all starts."""
+        with self._lock:
+            return sum(tier.start_total for tier in self._tiers())
+
+    def pick_start(self) -> Optional[List[str]]:
+        """Randomly pick a start, with the counts as weights.
+
+        Returns:
+            Optional[List[str]]: A list of two starting words, or None if there are no starts.
+        """
+        with self._lock:
+            items = [item for tier in self._tiers() for item in tier.tables["MarkovStart"].items()]
+        if not items:
+            return None
+        return list(random.choices(items, weights=[count for _ngram, count in items])[0][0])
+
+    def close(self) -> None:
+        """Sync and close the current journal segment. It is reopened when something is recorded."""
+        if self.journal is not None:
+            self.journal.close()
+
+    def stats(self) -> Dict[str, float]:
+        """Get the size of the tiers, and the counters and durations of compactions.
+
+        Returns:
+            Dict[str, float]: The number of distinct n-grams in the active and frozen tier, the number of
+                unlearned messages that are not applied yet, and the number, size and durations of compactions.
+        """
+        with self._lock:
+            return {
+                "active_ngrams": self.active.size,
+                "frozen_ngrams": self.frozen.size if self.frozen is not None else 0,
+                "pending_unlearns": len(self.pending_unlearns),
+                "compactions": self.compactions,
+                "compacted_ngrams": self.compacted_ngrams,
+                "last_merge_ms": self.last_merge_s * 1000,
+                "max_merge_ms": self.max_merge_s * 1000,
+                "total_merge_ms": self.total_merge_s * 1000,
+            }
@@ -0,0 +1,148 @@
+import json, logging, os, re, threading, time
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+logger = logging.getLogger(__name__)
+
+class Journal:
+    """
+    Append-only journal of learned and unlearned messages that are not committed to the database yet.
+
+    Every record is one line of JSON, written to the operating system immediately, so it survives
+    the bot crashing. Records are flushed to disk with `fsync` in batches, at most every `sync_interval`
+    seconds, so they also survive the machine crashing, without a disk write per record.
+
+    The journal is split into numbered segments. The Database rotates to a new segment whenever it
+    starts to commit what was journaled so far, and removes the old segments once that commit succeeded.
+    """
+    def __init__(self, prefix: str, sync_interval: float = 1) -> None:
+        """Initialize the journal. Segments are created once something is appended.
+
+        Args:
+            prefix (str): The path of the segments without "_{segment}.log", e.g. "MarkovChain_cubiedev_delta".
+            sync_interval (float, optional): The maximum number of seconds between `fsync` calls while
+                there are unsynced records. 0 to `fsync` after every record. Defaults to 1.
+        """
+        self.prefix = prefix
+        self.sync_interval = sync_interval
+        self.segment = 1
+        self._file: Optional[TextIO] = None
+        self._lock = threading.Lock()
+        self._unsynced = False
+        self._last_sync_t = time.monotonic()
+
+        self.records = 0
+        self.bytes_written = 0
+        self.syncs = 0
+        self.max_sync_s = 0.0
+
+    def segment_path(self, segment: int) -> str:
+        return f"{self.prefix}_{segment}.log"
+
+    def existing_segments(self) -> List[int]:
+        """Get the numbers of all segments on disk, in ascending order."""
+        directory = os.path.dirname(self.prefix) or "."
+        pattern = re.compile(re.escape(os.path.basename(self.prefix)) + r"_(\d+)\.log")
+        return sorted(int(match.group(1)) for match in map(pattern.fullmatch, os.listdir(directory)) if match)
+
+    def read(self, segment: int) -> Iterator[List[Any]]:
+        """Read the records of `segment`, in order.
+
+        Args:
+            segment (int): The number of the segment.
+
+        Yields:
+            Iterator[List[Any]]: The records. A line that was only partially written before a crash is skipped.
+        """
+        with open(self.segment_path(segment), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipped an incomplete record in {self.segment_path(segment)!r}.")
+
+    def append(self, record: List[Any]) -> int:
+        """Append `record` to the current segment.
+
+        Args:
+            record (List[Any]): The record, which must be serializable as JSON.
+
+        Returns:
+            int: The number of the segment the record was appended to.
+        """
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.segment_path(self.segment), "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced = True
+            self.records += 1
+            self.bytes_written += len(line)
+            if self.sync_interval <= 0:
+                self._sync()
+            return self.segment
+
+    def rotate(self) -> None:
+        """Sync and close the current segment, so the next record is appended to a new segment."""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+            self.segment += 1
+
+    def sync_if_due(self) -> None:
+        """`fsync` the current segment if it has unsynced records that are older than `self.sync_interval` seconds."""
+        with self._lock:
+            if self._unsynced and time.monotonic() - self._last_sync_t >= self.sync_interval:
+                self._sync()
+
+    def sync(self) -> None:
+        """`fsync` the current segment if it has unsynced records."""
+        with self._lock:
+            self._sync()
+
+    def _sync(self) -> None:
+        if self._unsynced and self._file is not None:
+            start_t = time.perf_counter()
+            os.fsync(self._file.fileno())
+            duration = time.perf_counter() - start_t
+            self.syncs += 1
+            self.max_sync_s = max(self.max_sync_s, duration)
+        self._unsynced = False
+        self._last_sync_t = time.monotonic()
+
+    def remove(self, segments: List[int]) -> None:
+        """Remove `segments`, once everything in them is committed to the database.
+
+        Args:
+            segments (List[int]): The numbers of the segments. Must not include the current segment.
+        """
+        for segment in segments:
+            try:
+                os.remove(self.segment_path(segment))
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        """Sync and close the current segment. It is reopened when a record is appended."""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, float]:
+        """Get the counters of this journal.
+
+        Returns:
+            Dict[str, float]: The number of appended records and bytes, the number of `fsync` calls,
+                and the longest `fsync` in milliseconds.
+        """
+        with self._lock:
+            return {
+                "records": self.records,
+                "bytes": self.bytes_written,
+                "syncs": self.syncs,
+                "max_sync_ms": self.max_sync_s * 1000,
+            }
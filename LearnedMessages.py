@@ -0,0 +1,107 @@
+import threading, logging
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# The starts and 3-grams learned from one message, e.g. ((("Hello", "there"),), (("Hello", "there", "<END>"),))
+LearnedNgrams = Tuple[Tuple[Tuple[str, ...], ...], Tuple[Tuple[str, ...], ...]]
+
+class LearnedMessages:
+    """
+    Thread-safe ring buffer of the n-grams learned from the most recent chat messages, keyed by the `id` tag
+    that Twitch sends with every message, and bounded by the number of messages.
+
+    When a message is deleted, Twitch sends a CLEARMSG with that id as `target-msg-id`, so exactly
+    the n-grams that were learned from the message can be unlearned, without tokenizing it again.
+    The oldest messages are forgotten first, and are unlearned from their text instead.
+    The ids of the last `max_entries` unlearned messages are kept, so a repeated CLEARMSG is ignored.
+    """
+    def __init__(self, max_entries: int) -> None:
+        """Initialize the empty buffer.
+
+        Args:
+            max_entries (int): The maximum number of remembered messages. 0 to remember none.
+        """
+        self.max_entries = max_entries
+        # Maps message ids to their learned n-grams, from oldest to newest
+        self._data: "OrderedDict[str, LearnedNgrams]" = OrderedDict()
+        # The ids of the unlearned messages, from oldest to newest
+        self._unlearned: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.duplicates = 0
+
+    def add(self, message_id: str, starts: Sequence[Tuple[str, ...]], rules: Sequence[Tuple[str, ...]]) -> None:
+        """Remember the n-grams that were learned from the message with `message_id`, forgetting the oldest message if the buffer is full.
+
+        Args:
+            message_id (str): The `id` tag of the message, e.g. "b34ccfc7-4977-403a-8a94-33c6bac34fb8".
+            starts (Sequence[Tuple[str, ...]]): The learned starts of sentences.
+            rules (Sequence[Tuple[str, ...]]): The learned 3-grams.
+        """
+        if self.max_entries <= 0 or not message_id:
+            return
+        with self._lock:
+            self._data[message_id] = (tuple(starts), tuple(rules))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, message_id: str) -> Optional[LearnedNgrams]:
+        """Forget the message with `message_id`, get the n-grams that were learned from it, and remember that it was unlearned.
+
+        Args:
+            message_id (str): The `id` tag of the message, i.e. the `target-msg-id` tag of a CLEARMSG.
+
+        Returns:
+            Optional[LearnedNgrams]: The learned starts and 3-grams, or None if the message is not remembered.
+        """
+        with self._lock:
+            learned = self._data.pop(message_id, None)
+            if learned is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if self.max_entries > 0 and message_id:
+                self._unlearned[message_id] = None
+                while len(self._unlearned) > self.max_entries:
+                    self._unlearned.popitem(last=False)
+            return learned
+
+    def was_unlearned(self, message_id: str) -> bool:
+        """Check whether the message with `message_id` was already unlearned, i.e. popped with `self.pop`.
+
+        Args:
+            message_id (str): The `id` tag of the message, i.e. the `target-msg-id` tag of a CLEARMSG.
+
+        Returns:
+            bool: True if the message was unlearned, and must not be unlearned again.
+        """
+        with self._lock:
+            if message_id in self._unlearned:
+                self.duplicates += 1
+                return True
+            return False
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the counters and current size of the buffer.
+
+        Returns:
+            Dict[str, float]: The number of deleted messages that were and were not remembered, the number
+                of forgotten messages, the number of repeated deletions, and the number of remembered messages.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "duplicates": self.duplicates,
+                "entries": len(self._data),
+            }
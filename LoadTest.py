@@ -0,0 +1,455 @@
+import argparse
+import json
+import logging
+import os
+import random
+import select
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from itertools import count, cycle
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from Corpora import generate_chat_messages
+from Settings import Settings
+from Train import IRC_LINE
+
+logger = logging.getLogger(__name__)
+
+class FakeTwitchServer(threading.Thread):
+    """
+    Local stand-in for the Twitch IRC server, to load test a bot process end to end.
+
+    Speaks enough of the Twitch IRC protocol for `TwitchWebsocket`: logging in, joining the channel,
+    acknowledging the tags and commands capabilities, answering the "/mods" request, PING and PONG.
+    Chat is replayed by calling `self.send` with raw IRC lines. Lines the bot does not read in time
+    are buffered up to `max_backlog` bytes, after which lines are dropped, like Twitch does for slow connections.
+
+    Two latencies are measured:
+    - Ingest lag: `self.ping` sends a PING, which the bot only answers once it has handled every line
+      sent before it.
+    - Generate response time: from sending a line with `generate=True` until the next chat message of the bot.
+      This requires that the bot answers every generate command in chat, i.e. has a "Cooldown" of 0.
+    """
+    def __init__(self, channel: str, host: str = "127.0.0.1", port: int = 0, max_backlog: int = 1024 * 1024) -> None:
+        """Start listening on `host`:`port`. Call `self.start` to accept the connection of the bot.
+
+        Args:
+            channel (str): The channel that is replayed, e.g. "#loadtest".
+            host (str, optional): The address to listen on. Defaults to "127.0.0.1".
+            port (int, optional): The port to listen on, or 0 for any free port, see `self.port`. Defaults to 0.
+            max_backlog (int, optional): The maximum number of bytes waiting for the bot to read them,
+                before lines are dropped. Defaults to 1 MiB.
+        """
+        super().__init__(name="FakeTwitchServer", daemon=True)
+        self.channel = channel.lower()
+        self.max_backlog = max_backlog
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen(1)
+        self.port: int = self._listener.getsockname()[1]
+        self._conn: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._backlog = bytearray()
+        self._stopped = threading.Event()
+        # Set once the bot joined the channel, and received the list of moderators
+        self.joined = threading.Event()
+        self.nick = "justinfan"
+
+        # The send times of PINGs and generate commands that were not answered yet, in order
+        self._pings: Deque[float] = deque()
+        self._generates: Deque[float] = deque()
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the counters and measured latencies, e.g. before replaying chat at a new rate."""
+        with self._lock:
+            self.sent = 0
+            self.dropped = 0
+            self.dropped_generates = 0
+            self.whispers = 0
+            self.chat_messages = 0
+            self.ingest_lags: List[float] = []
+            self.response_times: List[float] = []
+
+    def send(self, line: str, generate: bool = False) -> bool:
+        """Send the raw IRC `line` to the bot, or drop it if the bot is too far behind on reading.
+
+        Args:
+            line (str): The IRC line, without "\\r\\n".
+            generate (bool, optional): Whether `line` is a generate command, whose response time is measured.
+                Defaults to False.
+
+        Returns:
+            bool: False if the line was dropped.
+        """
+        with self._lock:
+            if len(self._backlog) > self.max_backlog:
+                self.dropped += 1
+                self.dropped_generates += generate
+                return False
+            self.sent += 1
+            if generate:
+                self._generates.append(time.perf_counter())
+            self._write(line)
+            return True
+
+    def ping(self) -> None:
+        """Send a PING to measure the ingest lag, see `self.ingest_lags`. Never dropped."""
+        with self._lock:
+            self._pings.append(time.perf_counter())
+            self._write("PING :tmi.twitch.tv")
+
+    def pending(self) -> int:
+        """The number of PINGs and generate commands that were not answered yet."""
+        with self._lock:
+            return len(self._pings) + len(self._generates)
+
+    def discard_pending(self) -> int:
+        """Stop waiting for the answers to PINGs and generate commands that were sent so far.
+
+        Returns:
+            int: The number of generate commands that were not answered.
+        """
+        with self._lock:
+            unanswered = len(self._generates)
+            self._pings.clear()
+            self._generates.clear()
+            return unanswered
+
+    def _write(self, line: str) -> None:
+        # Must be called while holding `self._lock`
+        self._backlog += (line + "\r\n").encode("utf-8")
+        self._flush()
+
+    def _flush(self) -> None:
+        # Must be called while holding `self._lock`. Sends as much of the backlog as the socket accepts
+        if self._conn is None or not self._backlog:
+            return
+        try:
+            sent = self._conn.send(self._backlog)
+        except (BlockingIOError, InterruptedError):
+            return
+        del self._backlog[:sent]
+
+    def run(self) -> None:
+        self._listener.settimeout(0.5)
+        while self._conn is None and not self._stopped.is_set():
+            try:
+                conn, _address = self._listener.accept()
+            except socket.timeout:
+                continue
+            conn.setblocking(False)
+            with self._lock:
+                self._conn = conn
+
+        data = b""
+        while not self._stopped.is_set():
+            with self._lock:
+                writers = [self._conn] if self._backlog else []
+            readable, writable, _ = select.select([self._conn], writers, [], 0.1)
+            if writable:
+                with self._lock:
+                    self._flush()
+            if not readable:
+                continue
+            try:
+                received = self._conn.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                break
+            if not received:
+                logger.info("The bot closed the connection.")
+                break
+            *lines, data = (data + received).split(b"\r\n")
+            for line in lines:
+                self.handle(line.decode("utf-8", errors="replace"))
+
+    def handle(self, line: str) -> None:
+        """Respond to the IRC `line` sent by the bot, like Twitch would.
+
+        Args:
+            line (str): The line, without "\\r\\n".
+        """
+        now = time.perf_counter()
+        command, _, params = line.partition(" ")
+        if command == "NICK":
+            self.nick = params
+            with self._lock:
+                self._write(f":tmi.twitch.tv 001 {self.nick} :Welcome, GLHF!")
+        elif command == "JOIN":
+            with self._lock:
+                self._write(f":{self.nick}!{self.nick}@{self.nick}.tmi.twitch.tv JOIN {self.channel}")
+                self._write(f":{self.nick}.tmi.twitch.tv 353 {self.nick} = {self.channel} :{self.nick}")
+                self._write(f":{self.nick}.tmi.twitch.tv 366 {self.nick} {self.channel} :End of /NAMES list")
+        elif command == "CAP":
+            with self._lock:
+                self._write(f":tmi.twitch.tv CAP * ACK {params[len('REQ '):]}")
+        elif command == "PING":
+            with self._lock:
+                self._write("PONG :tmi.twitch.tv")
+        elif command == "PONG":
+            with self._lock:
+                if self._pings:
+                    self.ingest_lags.append(now - self._pings.popleft())
+        elif command == "PRIVMSG":
+            message = params.partition(" :")[2]
+            if message == "/mods":
+                with self._lock:
+                    self._write(f"@msg-id=room_mods :tmi.twitch.tv NOTICE {self.channel} "
+                                f":The moderators of this channel are: {self.channel[1:]}_mod, loadtest_mod")
+                self.joined.set()
+            elif message.startswith("/w "):
+                with self._lock:
+                    self.whispers += 1
+            else:
+                with self._lock:
+                    self.chat_messages += 1
+                    if self._generates:
+                        self.response_times.append(now - self._generates.popleft())
+
+    def stop(self) -> None:
+        """Stop serving, and close the connection to the bot."""
+        self._stopped.set()
+        self.join()
+        if self._conn is not None:
+            self._conn.close()
+        self._listener.close()
+
+def chat_events(channel: str, path: Optional[str] = None, seed: int = 0) -> Iterator[str]:
+    """Endlessly generate the raw IRC lines of a busy chat, excluding generate commands.
+
+    Besides chat messages, about 1% of lines deletes a recent message with CLEARMSG,
+    0.3% whispers "!nopm" or "!yespm" to the bot, and 0.2% are NOTICEs.
+
+    Args:
+        channel (str): The channel, e.g. "#loadtest".
+        path (Optional[str], optional): A recorded chat log to replay on repeat, either with raw IRC lines
+            or with one message per line. Defaults to None, i.e. synthetic messages, see `generate_chat_messages`.
+        seed (int, optional): The seed for the random generator. Defaults to 0.
+
+    Yields:
+        Iterator[str]: IRC lines, without "\\r\\n".
+    """
+    rng = random.Random(seed)
+    if path is not None:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        messages: Iterator[str] = cycle(lines)
+    else:
+        messages = generate_chat_messages(sys.maxsize, seed=seed)
+
+    recent: Deque[Tuple[str, int, str]] = deque(maxlen=100)
+    for message_id in count():
+        kind = rng.random()
+        if kind < 0.01 and recent:
+            user, deleted_id, message = rng.choice(recent)
+            yield f"@login={user};room-id=1;target-msg-id={deleted_id};tmi-sent-ts=0 :tmi.twitch.tv CLEARMSG {channel} :{message}"
+        elif kind < 0.013:
+            user = f"viewer{rng.randrange(5000)}"
+            yield (f"@badges=;color=;display-name={user};emotes=;message-id={message_id};thread-id=1_2;turbo=0;user-id=1;user-type= "
+                   f":{user}!{user}@{user}.tmi.twitch.tv WHISPER loadtestbot :{rng.choice(['!nopm', '!yespm'])}")
+        elif kind < 0.015:
+            yield f"@msg-id=msg_ratelimit :tmi.twitch.tv NOTICE {channel} :Your message was not sent because you are sending messages too quickly."
+        else:
+            line = next(messages)
+            if IRC_LINE.match(line):
+                yield line
+                continue
+            user = f"viewer{rng.randrange(5000)}"
+            recent.append((user, message_id, line))
+            yield (f"@badge-info=;badges=;color=;display-name={user};emotes=;flags=;id={message_id};mod=0;room-id=1;subscriber=0;"
+                   f"tmi-sent-ts=0;turbo=0;user-id=1;user-type= :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG {channel} :{line}")
+
+def generate_command(channel: str, rng: random.Random) -> str:
+    """Get the IRC line of a random viewer using "!g", half of the time with a word as parameter."""
+    user = f"viewer{rng.randrange(5000)}"
+    command = rng.choice(["!g", "!g Kappa", "!g word0", "!g word1 word2"])
+    return (f"@badge-info=;badges=;color=;display-name={user};emotes=;flags=;id=0;mod=0;room-id=1;subscriber=0;"
+            f"tmi-sent-ts=0;turbo=0;user-id=1;user-type= :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG {channel} :{command}")
+
+def percentile(values: List[float], fraction: float) -> float:
+    return sorted(values)[int(len(values) * fraction)] if values else float("nan")
+
+def replay(server: FakeTwitchServer, events: Iterator[str], rate: float, duration: float,
+           burst_interval: float = 5, burst_size: int = 20, ping_interval: float = 0.25, drain_timeout: float = 30) -> Dict[str, float]:
+    """Replay `events` at `rate` lines per second for `duration` seconds, with bursts of generate commands, and measure the bot.
+
+    Args:
+        server (FakeTwitchServer): The server the bot is connected to.
+        events (Iterator[str]): The IRC lines to replay, see `chat_events`.
+        rate (float): The number of chat lines per second.
+        duration (float): The number of seconds to replay.
+        burst_interval (float, optional): The number of seconds between bursts of generate commands. Defaults to 5.
+        burst_size (int, optional): The number of generate commands per burst. Defaults to 20.
+        ping_interval (float, optional): The number of seconds between measurements of the ingest lag. Defaults to 0.25.
+        drain_timeout (float, optional): The maximum number of seconds to wait for the bot to catch up afterwards. Defaults to 30.
+
+    Returns:
+        Dict[str, float]: The replayed lines per second, the number of dropped lines, the ingest lag and
+            generate response time in milliseconds, and the number of unanswered generate commands.
+    """
+    rng = random.Random(int(rate))
+    server.reset()
+    start_t = time.perf_counter()
+    next_ping_t = next_burst_t = start_t
+    sent = 0
+    while True:
+        now = time.perf_counter()
+        if now - start_t >= duration:
+            break
+        if now >= next_ping_t:
+            server.ping()
+            next_ping_t += ping_interval
+        if now >= next_burst_t:
+            for _ in range(burst_size):
+                server.send(generate_command(server.channel, rng), generate=True)
+            next_burst_t += burst_interval
+        # Send all lines that are due, and sleep until the next one if the replay is ahead of schedule
+        due = int((now - start_t) * rate)
+        while sent < due:
+            server.send(next(events))
+            sent += 1
+        ahead = (sent + 1) / rate - (time.perf_counter() - start_t)
+        if ahead > 0:
+            time.sleep(min(ahead, ping_interval))
+    send_duration = time.perf_counter() - start_t
+
+    # Wait until the bot handled everything, or gave up on it
+    server.ping()
+    drain_start_t = time.perf_counter()
+    while server.pending() and time.perf_counter() - drain_start_t < drain_timeout:
+        time.sleep(0.05)
+    unanswered = server.discard_pending()
+
+    lags = [lag * 1000 for lag in server.ingest_lags]
+    responses = [response * 1000 for response in server.response_times]
+    return {
+        "rate": rate,
+        "sent_per_s": server.sent / send_duration,
+        "dropped": server.dropped,
+        "ingest_lag_p50_ms": percentile(lags, 0.5),
+        "ingest_lag_p99_ms": percentile(lags, 0.99),
+        "ingest_lag_max_ms": max(lags, default=float("nan")),
+        "generate_p50_ms": percentile(responses, 0.5),
+        "generate_p99_ms": percentile(responses, 0.99),
+        "unanswered_generates": unanswered + server.dropped_generates,
+        "drain_s": time.perf_counter() - drain_start_t,
+    }
+
+def start_bot(directory: str, channel: str, port: int) -> subprocess.Popen:
+    """Start `MarkovChainBot.py` in its own process in `directory`, connecting to the local server on `port`.
+
+    The settings file in `directory` is overwritten with the defaults, except that the bot connects to the local
+    server, answers every generate command, and sends no help messages or automatic generations.
+    The output of the bot is written to "bot.log" in `directory`.
+
+    Args:
+        directory (str): The directory with the database of the bot.
+        channel (str): The channel to join, e.g. "#loadtest".
+        port (int): The port of the server.
+
+    Returns:
+        subprocess.Popen: The bot process.
+    """
+    with open(os.path.join(directory, "settings.json"), "w") as f:
+        json.dump({**Settings.DEFAULTS, "Host": "127.0.0.1", "Port": port, "Channel": channel, "Nickname": "LoadTestBot",
+                   "Authentication": "oauth:loadtest", "Cooldown": 0, "HelpMessageTimer": -1, "AutomaticGenerationTimer": -1},
+                  f, indent=4)
+    log = open(os.path.join(directory, "bot.log"), "w")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MarkovChainBot.py")
+    return subprocess.Popen([sys.executable, script], cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+
+def load_test(directory: str, rates: List[float], duration: float, warmup: int, path: Optional[str] = None,
+              max_lag: float = 1000, seed: int = 0, **replay_options) -> Dict[str, Dict[str, float]]:
+    """Start a bot connected to a `FakeTwitchServer`, and replay chat at each of `rates` in turn,
+    to find the highest rate the bot keeps up with.
+
+    Args:
+        directory (str): The directory to run the bot in.
+        rates (List[float]): The chat lines per second to replay, in order.
+        duration (float): The number of seconds to replay at each rate.
+        warmup (int): The number of chat lines to send as fast as possible before measuring, so the bot has learned something.
+        path (Optional[str], optional): A recorded chat log to replay, see `chat_events`. Defaults to None.
+        max_lag (float, optional): The maximum p99 ingest lag in milliseconds for the bot to keep up. Defaults to 1000.
+        seed (int, optional): The seed for generating chat. Defaults to 0.
+        **replay_options: Passed on to `replay`.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The results of `replay` per rate, and the highest replayed rate at which nothing 
+            was dropped and the p99 ingest lag stayed below `max_lag`, as the "ceiling".
+    """
+    channel = "#loadtest"
+    server = FakeTwitchServer(channel)
+    server.start()
+    bot = start_bot(directory, channel, server.port)
+    try:
+        if not server.joined.wait(120):
+            raise RuntimeError(f"The bot did not join the channel, see {os.path.join(directory, 'bot.log')!r}.")
+        events = chat_events(channel, path, seed)
+        for _ in range(warmup):
+            while not server.send(next(events)):
+                time.sleep(0.01)
+        server.ping()
+        while server.pending() and bot.poll() is None:
+            time.sleep(0.05)
+        if bot.poll() is not None:
+            raise RuntimeError(f"The bot stopped, see {os.path.join(directory, 'bot.log')!r}.")
+        logger.info(f"Sent {warmup} chat lines to warm up.")
+
+        results = {}
+        ceiling = 0.0
+        for rate in rates:
+            result = replay(server, events, rate, duration, **replay_options)
+            logger.info(f"{rate:g} lines/s: " + ", ".join(f"{key}={value:.2f}" for key, value in result.items()))
+            results[f"{rate:g}"] = result
+            if result["dropped"] or not result["ingest_lag_p99_ms"] < max_lag:
+                break
+            ceiling = max(ceiling, result["sent_per_s"])
+            if result["sent_per_s"] < 0.9 * rate:
+                logger.warning(f"Replaying could not keep up with {rate:g} lines/s, so the ceiling of the bot may be higher.")
+                break
+        results["ceiling"] = {"rate": ceiling}
+        return results
+    finally:
+        bot.terminate()
+        bot.wait()
+        server.stop()
+
+if __name__ == "__main__":
+    from Log import Log
+    Log(__file__)
+
+    parser = argparse.ArgumentParser(description="Load test the bot end to end, by replaying chat from a local fake Twitch IRC server at increasing rates.")
+    parser.add_argument("--rates", default="50,100,200,400,800,1600", help="The comma-separated chat lines per second to replay, in order.")
+    parser.add_argument("--duration", type=float, default=30, help="The number of seconds to replay at each rate.")
+    parser.add_argument("--warmup", type=int, default=10000, help="The number of chat lines to send before measuring.")
+    parser.add_argument("--log", default=None, help="A recorded chat log to replay, instead of synthetic chat.")
+    parser.add_argument("--directory", default=None, help="The directory to run the bot in, e.g. with a copy of a database. Defaults to a temporary directory.")
+    parser.add_argument("--burst-interval", type=float, default=5, help="The number of seconds between bursts of generate commands.")
+    parser.add_argument("--burst-size", type=int, default=20, help="The number of generate commands per burst.")
+    parser.add_argument("--max-lag", type=float, default=1000, help="The maximum p99 ingest lag in milliseconds to keep up with a rate.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed for synthetic chat.")
+    parser.add_argument("--json", default=None, help="A file to write the results to as JSON.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        results = load_test(args.directory or temporary_directory,
+                            [float(rate) for rate in args.rates.split(",")],
+                            args.duration,
+                            args.warmup,
+                            path=os.path.abspath(args.log) if args.log else None,
+                            max_lag=args.max_lag,
+                            seed=args.seed,
+                            burst_interval=args.burst_interval,
+                            burst_size=args.burst_size)
+    logger.info(f"The bot keeps up with {results['ceiling']['rate']:g} chat lines per second.")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
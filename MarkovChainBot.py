@@ -1,14 +1,19 @@
 
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from TwitchWebsocket import Message, TwitchWebsocket
-from nltk.tokenize import sent_tokenize
-import socket, time, logging, re, string
+import socket, time, logging, re, string, threading
 
 from Settings import Settings, SettingsData
 from Database import Database
 from Timer import LoopingTimer
-from Tokenizer import detokenize, tokenize
+from SentencePool import SentencePool
+from CompiledModel import CompiledModel
+from Metrics import Metrics
+from Cache import LRUCache
+from Punkt import SentenceSplitter, ensure_model, model_path
+from Blacklist import Blacklist
+from Tokenizer import detokenize, fast_tokenize, tokenize, load as load_word_tokenizer
 
 from Log import Log
 Log(__file__)
@@ -16,18 +21,52 @@ Log(__file__)
 logger = logging.getLogger(__name__)
 
 class MarkovChain:
-    def __init__(self):
+    def __init__(self, connect: bool = True):
+        """Set up the bot with the settings from settings.json, and run it until it shuts down.
+
+        Args:
+            connect (bool, optional): Whether to open the Database and connect to Twitch. If False, only what determines
+                what is learned is set up, see `self.setup_learning`, e.g. for `Train.py`. Defaults to True.
+        """
         self.prev_message_t = 0
         self._enabled = True
-        # This regex should detect similar phrases as links as Twitch does
-        self.link_regex = re.compile("\w+\.[a-z]{2,}")
         # List of moderators used in blacklist modification, includes broadcaster
         self.mod_list = []
-        self.set_blacklist()
-
-        # Fill previously initialised variables with data from the settings.txt file
-        Settings(self)
-        self.db = Database(self.chan)
+        self.setup_learning()
+        if not connect:
+            return
+        # Import nltk and load the tokenizers while the database is opened and the bot connects
+        threading.Thread(target=self.load_tokenizers, name="LoadTokenizers", daemon=True).start()
+
+        self.db = Database(self.chan,
+                           pragmas=self.database_pragmas,
+                           learn_flush_size=self.learn_flush_size,
+                           learn_flush_interval=self.learn_flush_interval,
+                           journal_sync_interval=self.journal_sync_interval if self.journal_sync_interval >= 0 else None,
+                           transition_cache_entries=self.transition_cache_entries,
+                           transition_cache_bytes=self.transition_cache_bytes,
+                           vocabulary_cache_entries=self.vocabulary_cache_entries,
+                           write_queue_size=self.write_queue_size,
+                           metrics=self.metrics,
+                           migration_processes=self.migration_processes or None,
+                           learned_message_entries=self.learned_message_entries)
+        # Generate using a compiled model shared with other processes if configured, and the Database otherwise
+        self.model = self.db
+        if self.compiled_model_path:
+            self.model = CompiledModel(self.compiled_model_path, self.compiled_model_reload_interval)
+
+        # Set up daemon Thread to keep a pool of sentences ready for generations without parameters
+        self.sentence_pool = None
+        if self.sentence_pool_size > 0:
+            self.sentence_pool = SentencePool(self.generate_tokens, self.sentence_pool_size, self.sentence_pool_max_age)
+            self.sentence_pool.start()
+
+        # Serve the timings and counters of handling messages and generating, if enabled
+        if self.metrics_port >= 0:
+            # Only imported when needed, as importing http.server takes longer than the rest of the bot
+            from MetricsServer import MetricsServer
+            self.register_metrics_collectors()
+            MetricsServer(self.metrics, self.metrics_host, self.metrics_port).start()
 
         # Set up daemon Timer to send help messages
         if self.help_message_timer > 0:
@@ -52,6 +91,66 @@ class MarkovChain:
                                   capability=["commands", "tags"],
                                   live=True)
         self.ws.start_bot()
+        # The bot has shut down, so commit all pending mutations and close the database connections
+        self.db.close()
+
+    def setup_learning(self) -> None:
+        """Load the settings and blacklist that determine what is learned, without connecting to Twitch or the Database.
+
+        This is all that is set up when the bot does not connect, e.g. for `Train.py`, which learns from chat logs like the bot.
+        """
+        # This regex should detect similar phrases as links as Twitch does
+        self.link_regex = re.compile("\w+\.[a-z]{2,}")
+
+        # Fill previously initialised variables with data from the settings.txt file
+        Settings(self)
+        # The blacklist is split into tokens with the tokenizer from the settings
+        self.set_blacklist()
+
+        # Timings and counters of handling messages and generating, only recorded if they are served
+        self.metrics = Metrics(enabled=self.metrics_port >= 0)
+
+        # Fail now if the model to split messages into sentences is missing, rather than on the first message
+        ensure_model(self.punkt_model_path)
+        self.sent_tokenize = SentenceSplitter(self.punkt_model_path)
+        # The tokens of recent messages, as chat often repeats the exact same message, e.g. copypastas and emote spam
+        self.tokenization_cache = LRUCache(self.tokenization_cache_entries, self.tokenization_cache_bytes)
+
+    def load_tokenizers(self) -> None:
+        """Import nltk, load the word tokenizer and sentence splitting model, and tokenize the blacklist now, instead of on the first message.
+
+        Logs how long each step took, so slow starts can be traced.
+        """
+        try:
+            start_t = time.perf_counter()
+            # Imported on its own only to time it
+            import nltk
+            nltk_t = time.perf_counter()
+            load_word_tokenizer()
+            tokenizer_t = time.perf_counter()
+            self.sent_tokenize.load()
+            punkt_t = time.perf_counter()
+            self.blacklist.compile()
+            logger.info(f"Loaded the tokenizers in {time.perf_counter() - start_t:.3f}s: importing nltk took {nltk_t - start_t:.3f}s, "
+                        f"the word tokenizer {tokenizer_t - nltk_t:.3f}s, the Punkt model {punkt_t - tokenizer_t:.3f}s "
+                        f"and tokenizing the blacklist {time.perf_counter() - punkt_t:.3f}s.")
+        except Exception:
+            logger.exception("Failed to load the tokenizers.")
+
+    def register_metrics_collectors(self) -> None:
+        """Collect the queue depth of the database writer, and the sizes and counters of the caches, alongside `self.metrics`."""
+        self.metrics.register_collector("database", self.db.stats)
+        self.metrics.register_collector("database_writer", self.db.write_thread.stats)
+        self.metrics.register_collector("delta_tier", self.db.delta.stats)
+        self.metrics.register_collector("learned_messages", self.db.learned_messages.stats)
+        self.metrics.register_collector("transition_cache", self.db.transition_cache.stats)
+        self.metrics.register_collector("vocabulary_word_ids", self.db.vocabulary.word_ids.stats)
+        self.metrics.register_collector("vocabulary_id_words", self.db.vocabulary.id_words.stats)
+        if self.db.journal is not None:
+            self.metrics.register_collector("journal", self.db.journal.stats)
+        if self.sentence_pool is not None:
+            self.metrics.register_collector("sentence_pool", self.sentence_pool.stats)
+        self.metrics.register_collector("tokenization_cache", self.tokenization_cache.stats)
 
     def set_settings(self, settings: SettingsData):
         """Fill class instance attributes based on the settings file.
@@ -77,8 +176,30 @@ class MarkovChain:
         self.sent_separator = settings["SentenceSeparator"]
         self.allow_generate_params = settings["AllowGenerateParams"]
         self.generate_commands = tuple(settings["GenerateCommands"])
+        self.database_pragmas = settings["DatabasePragmas"]
+        self.learn_flush_size = settings["LearnFlushSize"]
+        self.learn_flush_interval = settings["LearnFlushInterval"]
+        self.journal_sync_interval = settings["JournalSyncInterval"]
+        self.transition_cache_entries = settings["TransitionCacheEntries"]
+        self.transition_cache_bytes = settings["TransitionCacheBytes"]
+        self.vocabulary_cache_entries = settings["VocabularyCacheEntries"]
+        self.write_queue_size = settings["WriteQueueSize"]
+        self.sentence_pool_size = settings["SentencePoolSize"]
+        self.sentence_pool_max_age = settings["SentencePoolMaxAge"]
+        self.compiled_model_path = settings["CompiledModelPath"]
+        self.compiled_model_reload_interval = settings["CompiledModelReloadInterval"]
+        self.metrics_host = settings["MetricsHost"]
+        self.metrics_port = settings["MetricsPort"]
+        # Both tokenizers give identical tokens, see `fast_tokenize`
+        self.tokenize = fast_tokenize if settings["FastTokenizer"] else tokenize
+        self.tokenization_cache_entries = settings["TokenizationCacheEntries"]
+        self.tokenization_cache_bytes = settings["TokenizationCacheBytes"]
+        self.punkt_model_path = model_path(settings["PunktModelPath"])
+        self.migration_processes = settings["MigrationProcesses"]
+        self.learned_message_entries = settings["LearnedMessageEntries"]
 
     def message_handler(self, m: Message):
+        handler_t = self.metrics.clock()
         try:
             if m.type == "366":
                 logger.info(f"Successfully joined channel: #{m.channel}")
@@ -131,12 +252,17 @@ class MarkovChain:
                         self.ws.send_whisper(m.user, f"Please add exactly 1 integer parameter, eg: !setcd 30.")
 
             if m.type == "PRIVMSG":
+                filter_t = self.metrics.clock()
+                message, reason = self.filter_message(m.message, m.user, m.tags.get("emotes", ""))
+                self.metrics.observe("message", "filter", filter_t)
+                if reason is not None:
+                    self.metrics.count("messages", reason)
 
                 # Ignore bot messages
-                if m.user.lower() in self.denied_users:
+                if reason == "denied":
                     return
-                
-                if self.check_if_generate(m.message):
+
+                if reason == "generate":
                     if not self.enable_generate_command and not self.check_if_permissions(m):
                         return
 
@@ -150,7 +276,7 @@ class MarkovChain:
                         if self.check_filter(m.message):
                             sentence = "You can't make me say that, you madman!"
                         else:
-                            params = tokenize(m.message)[2:] if self.allow_generate_params else None
+                            params = list(self.tokenize_message(m.message)[2:]) if self.allow_generate_params else None
                             # Generate an actual sentence
                             sentence, success = self.generate(params)
                             if success:
@@ -168,85 +294,34 @@ class MarkovChain:
                 elif m.message.startswith(("!ghelp", "!genhelp", "!generatehelp")):
                     self.send_help_message()
 
-                # Ignore the message if it is deemed a command
-                elif self.check_if_other_command(m.message):
-                    return
-                
-                # Ignore the message if it contains a link.
-                elif self.check_link(m.message):
-                    return
-
-                if "emotes" in m.tags:
-                    # If the list of emotes contains "emotesv2_", then the message contains a bit emote, 
-                    # and we choose not to learn from those messages.
-                    if "emotesv2_" in m.tags["emotes"]:
-                        return
-
-                    # Replace modified emotes with normal versions, 
-                    # as the bot will never have the modified emotes unlocked at the time.
-                    for modifier in self.extract_modifiers(m.tags["emotes"]):
-                        m.message = m.message.replace(modifier, "")
-
-                # Ignore the message if any word in the sentence is on the ban filter
-                if self.check_filter(m.message):
+                elif reason == "blacklisted":
                     logger.warning(f"Sentence contained blacklisted word or phrase:\"{m.message}\"")
-                    return
-                
-                else:
-                    # Try to split up sentences. Requires nltk's 'punkt' resource
-                    try:
-                        sentences = sent_tokenize(m.message.strip())
-                    # If 'punkt' is not downloaded, then download it, and retry
-                    except LookupError:
-                        logger.debug("Downloading required punkt resource...")
-                        import nltk
-                        nltk.download('punkt')
-                        logger.debug("Downloaded required punkt resource.")
-                        sentences = sent_tokenize(m.message.strip())
-
-                    for sentence in sentences:
-                        # Get all seperate words
-                        words = tokenize(sentence)
-                        # Double spaces will lead to invalid rules. We remove empty words here
-                        if "" in words:
-                            words = [word for word in words if word]
-                            
-                        # If the sentence is too short, ignore it and move on to the next.
-                        if len(words) <= self.key_length:
-                            continue
-                        
-                        # Add a new starting point for a sentence to the <START>
-                        #self.db.add_rule(["<START>"] + [words[x] for x in range(self.key_length)])
-                        self.db.add_start_queue([words[x] for x in range(self.key_length)])
-                        
-                        # Create Key variable which will be used as a key in the Dictionary for the grammar
-                        key = list()
-                        for word in words:
-                            # Set up key for first use
-                            if len(key) < self.key_length:
-                                key.append(word)
-                                continue
-                            
-                            self.db.add_rule_queue(key + [word])
-                            
-                            # Remove the first word, and add the current word,
-                            # so that the key is correct for the next word.
-                            key.pop(0)
-                            key.append(word)
-                        # Add <END> at the end of the sentence
-                        self.db.add_rule_queue(key + ["<END>"])
+
+                # Learn from the message, unless it is a command, contains a link or bit emote, or is blacklisted
+                if reason is None:
+                    sentences = self.tokenize_for_learning(message)
+                    queue_t = self.metrics.clock()
+                    starts, rules = self.learned_ngrams(sentences)
+                    # Learned as one record in the journal, and remembered to unlearn exactly these n-grams if this message is deleted
+                    self.db.learn(starts, rules, m.tags.get("id", ""))
+                    self.metrics.observe("message", "queue", queue_t)
+                    self.metrics.count("messages", "learned" if sentences else "too_short")
                     
             elif m.type == "WHISPER":
                 # Allow people to whisper the bot to disable or enable whispers.
                 if m.message == "!nopm":
                     logger.debug(f"Adding {m.user} to Do Not Whisper.")
-                    self.db.add_whisper_ignore(m.user)
-                    self.ws.send_whisper(m.user, "You will no longer be sent whispers. Type !yespm to reenable. ")
+                    if self.db.add_whisper_ignore(m.user):
+                        self.ws.send_whisper(m.user, "You will no longer be sent whispers. Type !yespm to reenable. ")
+                    else:
+                        self.ws.send_whisper(m.user, "The bot is too busy to disable whispers right now. Please type !nopm again in a moment. ")
 
                 elif m.message == "!yespm":
                     logger.debug(f"Removing {m.user} from Do Not Whisper.")
-                    self.db.remove_whisper_ignore(m.user)
-                    self.ws.send_whisper(m.user, "You will again be sent whispers. Type !nopm to disable again. ")
+                    if self.db.remove_whisper_ignore(m.user):
+                        self.ws.send_whisper(m.user, "You will again be sent whispers. Type !nopm to disable again. ")
+                    else:
+                        self.ws.send_whisper(m.user, "The bot is too busy to reenable whispers right now. Please type !yespm again in a moment. ")
 
                 # Note that I add my own username to this list to allow me to manage the 
                 # blacklist in channels of my bot in channels I am not modded in.
@@ -254,46 +329,61 @@ class MarkovChain:
                 elif m.user.lower() in self.mod_list + ["cubiedev"] + self.allowed_users:
                     # Adding to the blacklist
                     if self.check_if_our_command(m.message, "!blacklist"):
-                        if len(m.message.split()) == 2:
-                            # TODO: Remove newly blacklisted word from the Database
-                            word = m.message.split()[1].lower()
-                            self.blacklist.append(word)
-                            logger.info(f"Added `{word}` to Blacklist.")
-                            self.write_blacklist(self.blacklist)
-                            self.ws.send_whisper(m.user, "Added word to Blacklist.")
+                        if len(m.message.split()) >= 2:
+                            word = " ".join(m.message.split()[1:]).lower()
+                            if self.blacklist.add(word):
+                                logger.info(f"Added `{word}` to Blacklist.")
+                                self.write_blacklist(self.blacklist)
+                                # Pooled sentences may contain the newly blacklisted word
+                                if self.sentence_pool is not None:
+                                    self.sentence_pool.clear()
+                                # Remove the word from the Database in the background, and report back once done
+                                self.db.purge(self.blacklist.terms(word), lambda stats: self.purged(m.user, word, stats))
+                                self.ws.send_whisper(m.user, "Added word to Blacklist. Removing it from the knowledge base...")
+                            else:
+                                self.ws.send_whisper(m.user, "Word was already in the blacklist.")
                         else:
-                            self.ws.send_whisper(m.user, "Expected Format: `!blacklist word` to add `word` to the blacklist")
+                            self.ws.send_whisper(m.user, "Expected Format: `!blacklist word` to add `word` or a phrase of several words to the blacklist")
 
                     # Removing from the blacklist
                     elif self.check_if_our_command(m.message, "!whitelist"):
-                        if len(m.message.split()) == 2:
-                            word = m.message.split()[1].lower()
+                        if len(m.message.split()) >= 2:
+                            word = " ".join(m.message.split()[1:]).lower()
                             try:
                                 self.blacklist.remove(word)
                                 logger.info(f"Removed `{word}` from Blacklist.")
                                 self.write_blacklist(self.blacklist)
+                                if self.sentence_pool is not None:
+                                    self.sentence_pool.clear()
                                 self.ws.send_whisper(m.user, "Removed word from Blacklist.")
                             except ValueError:
                                 self.ws.send_whisper(m.user, "Word was already not in the blacklist.")
                         else:
-                            self.ws.send_whisper(m.user, "Expected Format: `!whitelist word` to remove `word` from the blacklist.")
+                            self.ws.send_whisper(m.user, "Expected Format: `!whitelist word` to remove `word` or a phrase of several words from the blacklist.")
                     
                     # Checking whether a word is in the blacklist
                     elif self.check_if_our_command(m.message, "!check"):
-                        if len(m.message.split()) == 2:
-                            word = m.message.split()[1].lower()
+                        if len(m.message.split()) >= 2:
+                            word = " ".join(m.message.split()[1:]).lower()
                             if word in self.blacklist:
                                 self.ws.send_whisper(m.user, "This word is in the Blacklist.")
                             else:
                                 self.ws.send_whisper(m.user, "This word is not in the Blacklist.")
                         else:
-                            self.ws.send_whisper(m.user, "Expected Format: `!check word` to check whether `word` is on the blacklist.")
+                            self.ws.send_whisper(m.user, "Expected Format: `!check word` to check whether `word` or a phrase of several words is on the blacklist.")
 
             elif m.type == "CLEARMSG":
                 # If a message is deleted, its contents will be unlearned
                 # or rather, the "occurances" attribute of each combinations of words in the sentence
                 # is reduced by 5, and deleted if the occurances is now less than 1. 
-                self.db.unlearn(m.message)
+                # Recent messages are found by their id, and exactly the n-grams learned from them are unlearned.
+                with self.metrics.timer("message", "unlearn"):
+                    if not self.db.unlearn_message(m.tags.get("target-msg-id", "")):
+                        self.db.unlearn(m.message)
+                    # Discard pooled sentences that may have been generated using the deleted message
+                    if self.sentence_pool is not None:
+                        self.sentence_pool.invalidate(self.tokenize_message(m.message))
+                self.metrics.count("messages", "unlearned")
                 
                 # TODO: Think of some efficient way to check whether it was our message that got deleted.
                 # If the bot's message was deleted, log this as an error
@@ -302,10 +392,14 @@ class MarkovChain:
 
         except Exception as e:
             logger.exception(e)
+        finally:
+            self.metrics.observe("message", "total", handler_t)
 
     def generate(self, params: List[str] = None) -> "Tuple[str, bool]":
         """Given an input sentence, generate the remainder of the sentence using the learned data.
 
+        Without params, a pre-generated sentence is taken from the sentence pool, if there is one.
+
         Args:
             params (List[str]): A list of words to use as an input to use as the start of generating.
         
@@ -313,6 +407,28 @@ class MarkovChain:
             Tuple[str, bool]: A tuple of a sentence as the first value, and a boolean indicating
                 whether the generation succeeded as the second value.
         """
+        if not params and self.sentence_pool is not None:
+            sentence = self.sentence_pool.take()
+            if sentence is not None:
+                self.metrics.count("generations", "pooled")
+                return sentence, True
+
+        with self.metrics.timer("generate", "total"):
+            sentence, success, _sentences = self.generate_tokens(params)
+        self.metrics.count("generations", "success" if success else "failed")
+        return sentence, success
+
+    def generate_tokens(self, params: List[str] = None) -> "Tuple[str, bool, List[List[str]]]":
+        """Given an input sentence, generate the remainder of the sentence using the learned data.
+
+        Args:
+            params (List[str]): A list of words to use as an input to use as the start of generating.
+        
+        Returns:
+            Tuple[str, bool, List[List[str]]]: A tuple of a sentence as the first value, a boolean indicating
+                whether the generation succeeded as the second value, and the tokens of each generated
+                sentence as the third value.
+        """
         if params is None:
             params = []
 
@@ -323,11 +439,12 @@ class MarkovChain:
         # Check for commands or recursion, eg: !generate !generate
         if len(params) > 0:
             if self.check_if_other_command(params[0]):
-                return "You can't make me do commands, you madman!", False
+                return "You can't make me do commands, you madman!", False, []
 
         # Get the starting key and starting sentence.
         # If there is more than 1 param, get the last 2 as the key.
         # Note that self.key_length is fixed to 2 in this implementation
+        start_t = self.metrics.clock()
         if len(params) > 1:
             key = params[-self.key_length:]
             # Copy the entire params for the sentence
@@ -335,43 +452,47 @@ class MarkovChain:
 
         elif len(params) == 1:
             # First we try to find if this word was once used as the first word in a sentence:
-            key = self.db.get_next_single_start(params[0])
+            key = self.model.get_next_single_start(params[0])
             if key == None:
                 # If this failed, we try to find the next word in the grammar as a whole
-                key = self.db.get_next_single_initial(0, params[0])
+                key = self.model.get_next_single_initial(0, params[0])
                 if key == None:
                     # Return a message that this word hasn't been learned yet
-                    return f"I haven't extracted \"{params[0]}\" from chat yet.", False
+                    return f"I haven't extracted \"{params[0]}\" from chat yet.", False, []
             # Copy this for the sentence
             sentences[0] = key.copy()
 
         else: # if there are no params
             # Get starting key
-            key = self.db.get_start()
+            key = self.model.get_start()
             if key:
                 # Copy this for the sentence
                 sentences[0] = key.copy()
             else:
                 # If nothing's ever been said
-                return "There is not enough learned information yet.", False
+                return "There is not enough learned information yet.", False, []
+        self.metrics.observe("generate", "start", start_t)
         
         # Counter to prevent infinite loops (i.e. constantly generating <END> while below the 
         # minimum number of words to generate)
         i = 0
         while self.sentence_length(sentences) < self.max_sentence_length and i < self.max_sentence_length * 2:
             # Use key to get next word
+            lookup_t = self.metrics.clock()
             if i == 0:
                 # Prevent fetching <END> on the first word
-                word = self.db.get_next_initial(i, key)
+                word = self.model.get_next_initial(i, key)
             else:
-                word = self.db.get_next(i, key)
+                word = self.model.get_next(i, key)
+            self.metrics.observe("generate", "lookup", lookup_t)
 
             i += 1
 
             if word == "<END>" or word == None:
                 # Break, unless we are before the min_sentence_length
                 if i < self.min_sentence_length:
-                    key = self.db.get_start()
+                    with self.metrics.timer("generate", "start"):
+                        key = self.model.get_start()
                     # Ensure that the key can be generated. Otherwise we still stop.
                     if key:
                         # Start a new sentence
@@ -392,9 +513,116 @@ class MarkovChain:
         # Then the params did not result in an actual sentence
         # If so, restart without params
         if len(params) > 0 and params == sentences[0]:
-            return "I haven't learned what to do with \"" + detokenize(params[-self.key_length:]) + "\" yet.", False
+            return "I haven't learned what to do with \"" + detokenize(params[-self.key_length:]) + "\" yet.", False, []
+
+        with self.metrics.timer("generate", "detokenize"):
+            output = self.sent_separator.join(detokenize(sentence) for sentence in sentences)
+        return output, True, sentences
+
+    def tokenize_for_learning(self, message: str) -> Tuple[Tuple[str, ...], ...]:
+        """Split `message` into sentences, and tokenize each sentence that is long enough to learn from.
+
+        The result is cached in `self.tokenization_cache`, so it must not be modified.
 
-        return self.sent_separator.join(detokenize(sentence) for sentence in sentences), True
+        Args:
+            message (str): The message to learn from.
+
+        Returns:
+            Tuple[Tuple[str, ...], ...]: The tokens of each sentence with more than `self.key_length` tokens, e.g.
+                (('Hello', ',', 'you', "'re", 'Tom', '!'), ('Yes', ',', 'I', 'am', '.'))
+        """
+        key = ("sentences", message)
+        output = self.tokenization_cache.get(key)
+        if output is not None:
+            return output
+
+        sent_tokenize_t = self.metrics.clock()
+        sentences = self.sent_tokenize(message.strip())
+        self.metrics.observe("message", "sent_tokenize", sent_tokenize_t)
+
+        tokenize_t = self.metrics.clock()
+        output = []
+        for sentence in sentences:
+            # Get all seperate words
+            words = self.tokenize(sentence)
+            # Double spaces will lead to invalid rules. We remove empty words here
+            if "" in words:
+                words = [word for word in words if word]
+
+            # If the sentence is too short, ignore it and move on to the next.
+            if len(words) <= self.key_length:
+                continue
+            output.append(tuple(words))
+        output = tuple(output)
+        self.metrics.observe("message", "tokenize", tokenize_t)
+        self.cache_tokens(key, output, sum(len(words) for words in output))
+        return output
+
+    def learned_ngrams(self, sentences: Iterable[Iterable[str]]) -> Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]:
+        """Get the starts and rules that are learned from the tokenized `sentences` of a message.
+
+        Also used by `Train.py`, so chat logs are learned exactly like chat.
+
+        Args:
+            sentences (Iterable[Iterable[str]]): The tokens of each sentence, see `self.tokenize_for_learning`.
+
+        Returns:
+            Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]: The first `self.key_length` words of each sentence,
+                and every `self.key_length` words followed by the next word, or by "<END>" at the end of a sentence.
+        """
+        starts, rules = [], []
+        for words in sentences:
+            # Add a new starting point for a sentence to the <START>
+            #self.db.add_rule(["<START>"] + [words[x] for x in range(self.key_length)])
+            starts.append(tuple(words[:self.key_length]))
+            
+            # Create Key variable which will be used as a key in the Dictionary for the grammar
+            key = list()
+            for word in words:
+                # Set up key for first use
+                if len(key) < self.key_length:
+                    key.append(word)
+                    continue
+                
+                rules.append((*key, word))
+                
+                # Remove the first word, and add the current word,
+                # so that the key is correct for the next word.
+                key.pop(0)
+                key.append(word)
+            # Add <END> at the end of the sentence
+            rules.append((*key, "<END>"))
+        return starts, rules
+
+    def tokenize_message(self, message: str) -> Tuple[str, ...]:
+        """Tokenize `message` as a whole, without splitting it into sentences, e.g. to check it against the blacklist.
+
+        The result is cached in `self.tokenization_cache`, shared with `self.tokenize_for_learning`.
+
+        Args:
+            message (str): The message to tokenize.
+
+        Returns:
+            Tuple[str, ...]: The tokens of the message, e.g. ('!', 'g', 'Hello', ',', 'Tom').
+        """
+        key = ("message", message)
+        output = self.tokenization_cache.get(key)
+        if output is None:
+            output = tuple(self.tokenize(message))
+            self.cache_tokens(key, output, len(output))
+        return output
+
+    def cache_tokens(self, key: Tuple[str, str], tokens: tuple, n_tokens: int) -> None:
+        """Cache the tokens of the message in `key`, with an estimate of the memory used by the message and its tokens.
+
+        Args:
+            key (Tuple[str, str]): The kind of tokenization, and the message.
+            tokens (tuple): The tokens, or the tokens of each sentence.
+            n_tokens (int): The total number of tokens.
+        """
+        # Roughly the size of the message, plus the size of each token object and its characters
+        size = 100 + 2 * len(key[1]) + 64 * n_tokens
+        self.tokenization_cache.put(key, tokens, size, self.tokenization_cache.generation)
 
     def sentence_length(self, sentences: List[List[str]]) -> int:
         """Given a list of tokens representing a sentence, return the number of words in there.
@@ -435,28 +663,49 @@ class MarkovChain:
             pass
         return output
 
-    def write_blacklist(self, blacklist: List[str]) -> None:
-        """Write blacklist.txt given a list of banned words.
+    def write_blacklist(self, blacklist: Iterable[str]) -> None:
+        """Write blacklist.txt given the banned words and phrases.
 
         Args:
-            blacklist (List[str]): The list of banned words to write.
+            blacklist (Iterable[str]): The banned words and phrases to write.
         """
         logger.debug("Writing Blacklist...")
         with open("blacklist.txt", "w") as f:
             f.write("\n".join(sorted(blacklist, key=lambda x: len(x), reverse=True)))
         logger.debug("Written Blacklist.")
 
+    def purged(self, user: str, word: str, stats: Dict[str, float]) -> None:
+        """Report to `user` how many rows were removed from the Database after they blacklisted `word`.
+
+        Called on the writer thread of the Database once `Database.purge_now` is complete.
+
+        Args:
+            user (str): The user who added `word` to the blacklist.
+            word (str): The blacklisted word or phrase.
+            stats (Dict[str, float]): The statistics returned by `Database.purge_now`.
+        """
+        # Sentences may have been pooled while the word was being removed
+        if self.sentence_pool is not None:
+            self.sentence_pool.clear()
+        message = f"Removed {stats['rows']} rows containing `{word}` from the knowledge base."
+        if stats["skipped_terms"]:
+            message += " Phrases of more than 3 words are not removed, but can no longer be learned."
+        try:
+            self.ws.send_whisper(user, message)
+        except OSError as error:
+            logger.warning(f"[OSError: {error}] upon sending whisper about purging `{word}`. Ignoring.")
+
     def set_blacklist(self) -> None:
-        """Read blacklist.txt and set `self.blacklist` to the list of banned words."""
+        """Read blacklist.txt and set `self.blacklist` to the banned words and phrases, one per line."""
         logger.debug("Loading Blacklist...")
         try:
             with open("blacklist.txt", "r") as f:
-                self.blacklist = [l.replace("\n", "") for l in f.readlines()]
+                self.blacklist = Blacklist([l.replace("\n", "") for l in f.readlines()], self.tokenize)
                 logger.debug("Loaded Blacklist.")
         
         except FileNotFoundError:
             logger.warning("Loading Blacklist Failed!")
-            self.blacklist = ["<start>", "<end>"]
+            self.blacklist = Blacklist(["<start>", "<end>"], self.tokenize)
             self.write_blacklist(self.blacklist)
 
     def send_help_message(self) -> None:
@@ -495,16 +744,61 @@ class MarkovChain:
         if self.whisper_cooldown:
             self.ws.send_whisper(user, message)
 
+    def filter_message(self, message: str, user: str = "", emotes: str = "") -> Tuple[str, Optional[str]]:
+        """Check whether to learn from a chat `message`, and remove what must not be learned from it.
+
+        Used by `self.message_handler`, and by `Train.py` so chat logs are filtered exactly like chat.
+
+        Args:
+            message (str): The chat message.
+            user (str, optional): The user who sent the message. Defaults to "", e.g. for a log of only messages.
+            emotes (str, optional): The "emotes" tag of the message. Defaults to "", i.e. no emotes.
+
+        Returns:
+            Tuple[str, Optional[str]]: The message to learn from, with modified emotes replaced by their normal versions,
+                and None if it is learned from. Otherwise, the reason it is not, as counted in the "messages" metrics, i.e.
+                "empty", "denied", "generate", "command", "link", "bit_emote" or "blacklisted".
+        """
+        if not message.strip():
+            return message, "empty"
+
+        # Ignore bot messages
+        if user.lower() in self.denied_users:
+            return message, "denied"
+
+        if self.check_if_generate(message):
+            return message, "generate"
+
+        # Ignore the message if it is deemed a command
+        if self.check_if_other_command(message):
+            return message, "command"
+
+        # Ignore the message if it contains a link.
+        if self.check_link(message):
+            return message, "link"
+
+        # If the list of emotes contains "emotesv2_", then the message contains a bit emote, 
+        # and we choose not to learn from those messages.
+        if "emotesv2_" in emotes:
+            return message, "bit_emote"
+
+        # Replace modified emotes with normal versions, 
+        # as the bot will never have the modified emotes unlocked at the time.
+        for modifier in self.extract_modifiers(emotes):
+            message = message.replace(modifier, "")
+
+        # Ignore the message if any word in the sentence is on the ban filter
+        if self.check_filter(message):
+            return message, "blacklisted"
+        return message, None
+
     def check_filter(self, message: str) -> bool:
-        """Returns True if message contains a banned word.
+        """Returns True if message contains a banned word or phrase.
         
         Args:
             message (str): The message to check.
         """
-        for word in tokenize(message):
-            if word.lower() in self.blacklist:
-                return True
-        return False
+        return self.blacklist.matches(self.tokenize_message(message))
 
     def check_if_our_command(self, message: str, *commands: "Tuple[str]") -> bool:
         """True if the first "word" of the message is in the tuple of commands
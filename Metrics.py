@@ -0,0 +1,173 @@
+import bisect, logging, threading, time
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class StageTimer:
+    """Context manager that records the duration of its block as a stage of `metrics`."""
+    __slots__ = ("metrics", "path", "stage", "start_t")
+
+    def __init__(self, metrics: "Metrics", path: str, stage: str) -> None:
+        self.metrics = metrics
+        self.path = path
+        self.stage = stage
+
+    def __enter__(self) -> "StageTimer":
+        self.start_t = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.metrics.observe(self.path, self.stage, self.start_t)
+
+class NullTimer:
+    """Context manager that does nothing, used for every stage while metrics are disabled."""
+    __slots__ = ()
+
+    def __enter__(self) -> "NullTimer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+NULL_TIMER = NullTimer()
+
+class Metrics:
+    """
+    Counters and timings of the stages of handling chat messages and generating, which can be
+    served in the Prometheus text format with a `MetricsServer.MetricsServer`.
+
+    Stages are identified by a path and a stage name, e.g. ("message", "tokenize") or ("generate", "lookup"),
+    and their durations are recorded in histograms. Counters are identified by a name and a result,
+    e.g. ("messages", "learned"). The `stats` of other components, such as caches and the database
+    writer, are collected as gauges whenever the metrics are rendered, see `self.register_collector`.
+
+    While disabled, timers are a shared no-op context manager, and counting and observing return
+    immediately, so instrumenting the hot path costs next to nothing.
+    """
+    # Upper bounds of the histogram buckets of stage durations, in seconds
+    BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+    def __init__(self, enabled: bool = True, prefix: str = "markov") -> None:
+        """Initialize empty metrics.
+
+        Args:
+            enabled (bool, optional): Whether to record anything. Defaults to True.
+            prefix (str, optional): The prefix of the name of every metric. Defaults to "markov".
+        """
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # Maps (path, stage) to the count per bucket, with the last bucket for durations above all BUCKETS
+        self._buckets: Dict[Tuple[str, str], List[int]] = {}
+        # Maps (path, stage) to the total number of seconds
+        self._sums: Dict[Tuple[str, str], float] = {}
+        # Maps (name, result) to the count
+        self._counters: Dict[Tuple[str, str], int] = {}
+        # The names and functions of which the returned values are rendered as gauges
+        self._collectors: List[Tuple[str, Callable[[], Dict[str, float]]]] = []
+
+    def timer(self, path: str, stage: str) -> "StageTimer":
+        """Get a context manager that records the duration of its block as `stage` of `path`.
+
+        Args:
+            path (str): The path the stage is part of, e.g. "message".
+            stage (str): The name of the stage, e.g. "tokenize".
+
+        Returns:
+            StageTimer: The context manager.
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, path, stage)
+
+    def clock(self) -> float:
+        """Get the start time for `self.observe`, for stages that do not fit in a `with` block."""
+        return time.perf_counter() if self.enabled else 0.0
+
+    def observe(self, path: str, stage: str, start_t: float) -> None:
+        """Record the time since `start_t` as the duration of `stage` of `path`.
+
+        Args:
+            path (str): The path the stage is part of, e.g. "message".
+            stage (str): The name of the stage, e.g. "filter".
+            start_t (float): The start of the stage, from `self.clock`.
+        """
+        if not self.enabled:
+            return
+        duration = time.perf_counter() - start_t
+        key = (path, stage)
+        with self._lock:
+            buckets = self._buckets.get(key)
+            if buckets is None:
+                buckets = self._buckets[key] = [0] * (len(Metrics.BUCKETS) + 1)
+                self._sums[key] = 0.0
+            buckets[bisect.bisect_left(Metrics.BUCKETS, duration)] += 1
+            self._sums[key] += duration
+
+    def count(self, name: str, result: str, amount: int = 1) -> None:
+        """Increment the counter `name` for `result`, e.g. ("messages", "learned").
+
+        Args:
+            name (str): The name of the counter, rendered as "{prefix}_{name}_total".
+            result (str): The value of the "result" label.
+            amount (int, optional): The amount to increment by. Defaults to 1.
+        """
+        if not self.enabled:
+            return
+        key = (name, result)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_collector(self, name: str, collect: Callable[[], Dict[str, float]]) -> None:
+        """Render the values returned by `collect` as gauges whenever the metrics are rendered.
+
+        Args:
+            name (str): The name of the collected component, e.g. "transition_cache". Each value
+                is rendered as "{prefix}_{name}_{key}".
+            collect (Callable[[], Dict[str, float]]): Returns the current values, e.g. `LRUCache.stats`.
+        """
+        self._collectors.append((name, collect))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The rendered metrics.
+        """
+        with self._lock:
+            buckets = {key: list(counts) for key, counts in self._buckets.items()}
+            sums = dict(self._sums)
+            counters = dict(self._counters)
+
+        lines = []
+        if buckets:
+            name = f"{self.prefix}_stage_seconds"
+            lines.append(f"# HELP {name} Duration of each stage of handling messages and generating.")
+            lines.append(f"# TYPE {name} histogram")
+            for (path, stage), counts in sorted(buckets.items()):
+                labels = f'path="{path}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(Metrics.BUCKETS + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {sums[(path, stage)]!r}")
+                lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+        for counter in sorted({name for name, _result in counters}):
+            name = f"{self.prefix}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            for (other, result), count in sorted(counters.items()):
+                if other == counter:
+                    lines.append(f'{name}{{result="{result}"}} {count}')
+
+        for component, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                logger.warning(f"Failed to collect the metrics of {component!r}: {e!r}")
+                continue
+            for key, value in values.items():
+                name = f"{self.prefix}_{component}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value!r}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,59 @@
+import logging, threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from Metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the metrics of the `MetricsServer` on "/metrics", in the Prometheus text format."""
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server for scraping `Metrics` on "http://{host}:{port}/metrics", e.g. by Prometheus.
+
+    Runs in a daemon thread, and renders the metrics only when they are requested,
+    so it does not cost anything between requests.
+    """
+    daemon_threads = True
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9464) -> None:
+        """Bind the server. Requests are served once it is started with `self.start`.
+
+        Args:
+            metrics (Metrics): The metrics to serve.
+            host (str, optional): The host to listen on. Defaults to "127.0.0.1", i.e. only local requests.
+            port (int, optional): The port to listen on, or 0 for any free port. Defaults to 9464.
+        """
+        HTTPServer.__init__(self, (host, port), MetricsRequestHandler)
+        self.metrics = metrics
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> None:
+        """Serve requests in a daemon thread."""
+        thread = threading.Thread(target=self.serve_forever, name="MetricsServer", daemon=True)
+        thread.start()
+        logger.info(f"Serving metrics on http://{self.server_address[0]}:{self.port}/metrics")
+
+    def stop(self) -> None:
+        """Stop serving requests, and close the socket."""
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,359 @@
+import logging
+import math
+import multiprocessing
+import os
+import sqlite3
+import string
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Records which tables of an update are done, so an interrupted update resumes where it left off.
+# Created in the database that an update writes to, and dropped when the update completes.
+CHECKPOINT_TABLE = """
+CREATE TABLE IF NOT EXISTS MigrationCheckpoint (
+    version INTEGER,
+    unit TEXT,
+    rows INTEGER,
+    PRIMARY KEY (version, unit)
+);
+"""
+
+def format_duration(seconds: float) -> str:
+    """Format a number of seconds for logging, e.g. "1h 2m", "3m 4s" or "5s".
+
+    Args:
+        seconds (float): The number of seconds.
+
+    Returns:
+        str: The formatted duration.
+    """
+    seconds = int(math.ceil(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+class MigrationProgress:
+    """
+    Tracks the tables and rows of an update that are done, and logs the progress with an
+    estimate of the remaining time, at most once every `interval` seconds.
+
+    The estimate is based on the rows per second since the update was started or resumed,
+    as the tables of a database differ greatly in size.
+    """
+
+    def __init__(self, description: str, total_units: int, total_rows: int, done_units: int = 0, done_rows: int = 0, interval: float = 10) -> None:
+        """Initialize the progress of an update.
+
+        Args:
+            description (str): What the update does, e.g. "Re-tokenizing".
+            total_units (int): The number of tables of the update, including those that are already done.
+            total_rows (int): The number of rows of all tables, including those that are already done.
+            done_units (int, optional): The number of tables done before the update was resumed. Defaults to 0.
+            done_rows (int, optional): The number of rows done before the update was resumed. Defaults to 0.
+            interval (float, optional): The minimum number of seconds between logging the progress. Defaults to 10.
+        """
+        self.description = description
+        self.total_units = total_units
+        self.total_rows = total_rows
+        self.done_units = done_units
+        self.done_rows = done_rows
+        self.interval = interval
+
+        self.resumed_rows = done_rows
+        self.start_t = time.perf_counter()
+        self.logged_t = self.start_t
+
+    def rows_per_s(self) -> float:
+        """Get the number of rows per second since the update was started or resumed."""
+        elapsed = time.perf_counter() - self.start_t
+        return (self.done_rows - self.resumed_rows) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> Optional[float]:
+        """Get the estimated number of seconds until all rows are done, or None if nothing is done yet."""
+        rate = self.rows_per_s()
+        if rate <= 0:
+            return None
+        return (self.total_rows - self.done_rows) / rate
+
+    def update(self, rows: int) -> None:
+        """Record that a table with `rows` rows is done, and log the progress if it is due.
+
+        Args:
+            rows (int): The number of rows of the table.
+        """
+        self.done_units += 1
+        self.done_rows += rows
+        now = time.perf_counter()
+        if now - self.logged_t >= self.interval or self.done_units == self.total_units:
+            self.logged_t = now
+            self.log()
+
+    def log(self) -> None:
+        """Log the progress, and the estimated remaining time."""
+        percentage = self.done_rows / self.total_rows * 100 if self.total_rows else 100.0
+        eta = self.eta()
+        remaining = f", about {format_duration(eta)} left" if eta is not None and self.done_units < self.total_units else ""
+        logger.info(f"[{percentage:.1f}%] {self.description}: {self.done_units} of {self.total_units} tables, "
+                    f"{self.done_rows} of {self.total_rows} rows ({self.rows_per_s():.0f} rows/s){remaining}.")
+
+# The read-only connections of this process per database file, kept open across the units it runs
+_read_connections: Dict[str, sqlite3.Connection] = {}
+
+def read_connection(path: str) -> sqlite3.Connection:
+    """Get the read-only connection of this process to the database at `path`, and open it if needed.
+
+    Args:
+        path (str): The path of the database file.
+
+    Returns:
+        sqlite3.Connection: The read-only connection.
+    """
+    conn = _read_connections.get(path)
+    if conn is None:
+        conn = _read_connections[path] = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    return conn
+
+def close_read_connections() -> None:
+    """Close the read-only connections of this process opened with `read_connection`."""
+    for conn in _read_connections.values():
+        conn.close()
+    _read_connections.clear()
+
+def _run_unit(args: Tuple[Callable[[str, str, int], Tuple[int, Any]], str, str, int]) -> Tuple[str, int, Any]:
+    """Run `work(source, table, chunk_size)` in a worker process, and return the table with the result."""
+    work, source, table, chunk_size = args
+    return (table, *work(source, table, chunk_size))
+
+class TableMigration:
+    """
+    Runs an update of the Database structure as one unit of work per table, across a pool of processes.
+
+    Each unit is run by `work(source, table, chunk_size)`, which reads the rows of `table` from the
+    database at `source` in chunks of `chunk_size` rows with `read_chunks`, and returns the number of
+    rows with its result. This is where the time is spent, e.g. re-tokenizing every row, so units run
+    in parallel in worker processes.
+
+    The results are written to the database at `path` by `apply(cursor, table, result)` in this process,
+    which is the only writer. Each table is written in its own transaction, together with a row in the
+    MigrationCheckpoint table. Running the update again after it was interrupted skips the tables that
+    are already done.
+    """
+
+    # Worker processes are only started for at least this many rows each, as starting one takes a while
+    ROWS_PER_PROCESS = 50000
+
+    def __init__(self,
+                 source: str,
+                 path: str,
+                 version: int,
+                 description: str,
+                 work: Callable[[str, str, int], Tuple[int, Any]],
+                 apply: Callable[[sqlite3.Cursor, str, Any], None],
+                 processes: Optional[int] = None,
+                 chunk_size: int = 10000) -> None:
+        """Initialize the update from the database at `source` to the database at `path`.
+
+        Args:
+            source (str): The path of the database file to read from, which is not modified.
+            path (str): The path of the database file to write to.
+            version (int): The version the update brings the database to, which identifies its checkpoints.
+            description (str): What the update does, for logging the progress, e.g. "Re-tokenizing".
+            work (Callable[[str, str, int], Tuple[int, Any]]): Runs the unit of a table. Must be a
+                function defined at the top level of a module, so it can be run in a worker process.
+            apply (Callable[[sqlite3.Cursor, str, Any], None]): Writes the result of the unit of a table.
+            processes (Optional[int], optional): The maximum number of worker processes, or None
+                for one per CPU. 1 runs all units in this process. Defaults to None.
+            chunk_size (int, optional): The number of rows that `work` reads at once. Defaults to 10000.
+        """
+        self.source = source
+        self.path = path
+        self.version = version
+        self.description = description
+        self.work = work
+        self.apply = apply
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def run(self, tables: List[str]) -> Dict[str, float]:
+        """Run the units of all `tables` that are not done yet, and log the progress.
+
+        Args:
+            tables (List[str]): The tables to run a unit for.
+
+        Returns:
+            Dict[str, float]: The number of tables and rows, how many of them were already done,
+                the number of processes, and the duration and throughput of this run.
+        """
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            conn.execute(CHECKPOINT_TABLE)
+            done = dict(conn.execute("SELECT unit, rows FROM MigrationCheckpoint WHERE version = ?;", (self.version,)).fetchall())
+            if done:
+                logger.info(f"Resuming the interrupted update, {len(done)} of {len(tables)} tables were already updated.")
+            pending = [table for table in tables if table not in done]
+            # Largest first, so the pool is not left waiting on one large table at the end
+            source = read_connection(self.source)
+            rows = {table: source.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0] for table in pending}
+            pending.sort(key=rows.get, reverse=True)
+
+            total_rows = sum(rows.values())
+            processes = max(1, min(self.processes, len(pending), math.ceil(total_rows / TableMigration.ROWS_PER_PROCESS)))
+            progress = MigrationProgress(self.description, len(tables), total_rows + sum(done.values()),
+                                         done_units=len(done), done_rows=sum(done.values()))
+            start_t = time.perf_counter()
+            if processes == 1:
+                for table in pending:
+                    self.checkpoint(conn, progress, table, *self.work(self.source, table, self.chunk_size))
+            else:
+                logger.info(f"{self.description} {len(pending)} tables with {processes} processes...")
+                # Spawned processes do not inherit the locks held by other threads, unlike forked ones
+                with multiprocessing.get_context("spawn").Pool(processes) as pool:
+                    units = [(self.work, self.source, table, self.chunk_size) for table in pending]
+                    for table, n_rows, result in pool.imap_unordered(_run_unit, units):
+                        self.checkpoint(conn, progress, table, n_rows, result)
+            duration = time.perf_counter() - start_t
+        finally:
+            conn.close()
+            close_read_connections()
+        return {
+            "tables": len(tables),
+            "resumed_tables": len(done),
+            "rows": total_rows,
+            "processes": processes,
+            "seconds": duration,
+            "rows_per_s": total_rows / duration if duration > 0 else 0.0,
+        }
+
+    def checkpoint(self, conn: sqlite3.Connection, progress: MigrationProgress, table: str, rows: int, result: Any) -> None:
+        """Write the result of the unit of `table`, and record that it is done, in one transaction.
+
+        Args:
+            conn (sqlite3.Connection): The connection to write with.
+            progress (MigrationProgress): The progress to update.
+            table (str): The table of the unit.
+            rows (int): The number of rows of the table.
+            result (Any): The result of the unit.
+        """
+        cur = conn.cursor()
+        cur.execute("begin")
+        try:
+            self.apply(cur, table, result)
+            cur.execute("INSERT INTO MigrationCheckpoint (version, unit, rows) VALUES (?, ?, ?);", (self.version, table, rows))
+        except Exception:
+            cur.execute("rollback")
+            raise
+        cur.execute("commit")
+        progress.update(rows)
+
+def read_chunks(path: str, sql: str, chunk_size: int) -> Iterable[List[Tuple[Any, ...]]]:
+    """Yield the rows of `sql` in chunks of `chunk_size` rows, from the read-only connection to `path`.
+
+    Args:
+        path (str): The path of the database file.
+        sql (str): The query to run.
+        chunk_size (int): The maximum number of rows per chunk.
+
+    Yields:
+        List[Tuple[Any, ...]]: The next chunk of rows.
+    """
+    cur = read_connection(path).execute(sql)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+def suffix(character: str) -> str:
+    """Get the suffix of the table for words starting with `character`, like `Database.get_suffix`."""
+    return character.upper() if character in string.ascii_letters else "_"
+
+def retokenize_start_table(path: str, table: str, chunk_size: int) -> Tuple[int, Dict[str, Counter]]:
+    """Re-tokenize the starts of sentences in `table`, for `Database.update_v3`.
+
+    Args:
+        path (str): The path of the database file.
+        table (str): The MarkovStart table to read, e.g. "MarkovStartA".
+        chunk_size (int): The number of rows to read at once.
+
+    Returns:
+        Tuple[int, Dict[str, Counter]]: The number of rows, and the summed counts of the new
+            first two words, per MarkovStart table they belong in.
+    """
+    from Tokenizer import fast_tokenize
+
+    n_rows = 0
+    result: Dict[str, Counter] = {}
+    for rows in read_chunks(path, f"SELECT word1, word2, count FROM {table};", chunk_size):
+        n_rows += len(rows)
+        for word1, word2, count in rows:
+            two_gram = fast_tokenize(f"{word1} {word2}")[:2]
+            # In case there was some issue in the previous Database
+            if len(two_gram) < 2:
+                continue
+            result.setdefault(f"MarkovStart{suffix(two_gram[0][0])}", Counter())[tuple(two_gram)] += count
+    return n_rows, result
+
+def retokenize_grammar_table(path: str, table: str, chunk_size: int) -> Tuple[int, Dict[str, Counter]]:
+    """Re-tokenize the 3-grams in `table`, for `Database.update_v3`.
+
+    Args:
+        path (str): The path of the database file.
+        table (str): The MarkovGrammar table to read, e.g. "MarkovGrammarAB".
+        chunk_size (int): The number of rows to read at once.
+
+    Returns:
+        Tuple[int, Dict[str, Counter]]: The number of rows, and the summed counts of the new
+            3-grams, per MarkovGrammar table they belong in.
+    """
+    from Tokenizer import fast_tokenize
+
+    n_rows = 0
+    result: Dict[str, Counter] = {}
+    for rows in read_chunks(path, f"SELECT word1, word2, word3, count FROM {table};", chunk_size):
+        n_rows += len(rows)
+        for *words, count in rows:
+            # If it ends on "<END>", that must not get tokenized
+            end = words[-1] == "<END>"
+            if end:
+                words = words[:-1]
+            tokenized = fast_tokenize(" ".join(words))
+            if end:
+                tokenized.append("<END>")
+
+            for i in range(len(tokenized) - 2):
+                ngram = tuple(tokenized[i:i + 3])
+                # Filter out the recursive case
+                if ngram[0] == ngram[1] == ngram[2]:
+                    continue
+                result.setdefault(f"MarkovGrammar{suffix(ngram[0][0])}{suffix(ngram[1][0])}", Counter())[ngram] += count
+    return n_rows, result
+
+def retokenize_table(path: str, table: str, chunk_size: int) -> Tuple[int, Dict[str, Counter]]:
+    """Re-tokenize the rows of the MarkovStart or MarkovGrammar `table`, for `Database.update_v3`.
+    See `retokenize_start_table` and `retokenize_grammar_table`."""
+    if table.startswith("MarkovStart"):
+        return retokenize_start_table(path, table, chunk_size)
+    return retokenize_grammar_table(path, table, chunk_size)
+
+def write_retokenized(cur: sqlite3.Cursor, table: str, result: Dict[str, Counter]) -> None:
+    """Add the counts returned by `retokenize_table` to the new tables, for `Database.update_v3`.
+
+    Args:
+        cur (sqlite3.Cursor): The cursor to write with, in a transaction.
+        table (str): The table that was re-tokenized.
+        result (Dict[str, Counter]): The summed counts per table.
+    """
+    for target, counter in result.items():
+        if target.startswith("MarkovStart"):
+            cur.executemany(f"""INSERT INTO {target} (word1, word2, count) VALUES (?, ?, ?)
+                ON CONFLICT (word1 COLLATE BINARY, word2 COLLATE BINARY) DO UPDATE SET count = count + excluded.count;""",
+                            [(*start, count) for start, count in counter.items()])
+        else:
+            cur.executemany(f"""INSERT INTO {target} (word1, word2, word3, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT (word1 COLLATE BINARY, word2 COLLATE BINARY, word3 COLLATE BINARY) DO UPDATE SET count = count + excluded.count;""",
+                            [(*ngram, count) for ngram, count in counter.items()])
@@ -0,0 +1,182 @@
+import argparse
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the contents of the exported model change
+FORMAT_VERSION = 1
+DEFAULT_PATH = "punkt_english.pickle"
+
+class ModelUnpickler(pickle.Unpickler):
+    """Unpickler that refuses to load any class or function, so loading a model can never execute code.
+
+    An exported model only holds sets, dicts, tuples, strings and integers, none of which need one.
+    """
+
+    def find_class(self, module: str, name: str) -> None:
+        raise pickle.UnpicklingError(f"A Punkt model must not contain {module}.{name}.")
+
+def model_path(path: str) -> str:
+    """Get the absolute path of a model, where a relative `path` is relative to the directory of the bot, e.g. `DEFAULT_PATH`."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+def export_model(path: str, language: str = "english", download: bool = True) -> int:
+    """Export the Punkt sentence splitting model of nltk for `language` to `path`.
+
+    The model is stored as plain sets and dicts, which load several times faster than nltk's
+    own data files, and it can be copied to machines without nltk's data or internet access.
+
+    Args:
+        path (str): The path to write the model to. Atomically replaced if it exists.
+        language (str, optional): The language of the model. Defaults to "english".
+        download (bool, optional): Whether to download nltk's Punkt data if it is not installed. Defaults to True.
+
+    Raises:
+        LookupError: If nltk's Punkt data is not installed, and could not be downloaded.
+
+    Returns:
+        int: The size of the exported model in bytes.
+    """
+    import nltk
+    try:
+        from nltk.tokenize.punkt import PunktTokenizer
+    except ImportError:
+        # Versions of nltk before 3.8.2 only distribute the pickled "punkt" data
+        resource = "punkt"
+
+        def load_params():
+            return nltk.data.load(f"tokenizers/punkt/{language}.pickle")._params
+    else:
+        resource = "punkt_tab"
+
+        def load_params():
+            return PunktTokenizer(language)._params
+
+    try:
+        params = load_params()
+    except LookupError:
+        if not download:
+            raise
+        logger.info(f"Downloading the {resource!r} data of nltk...")
+        nltk.download(resource, quiet=True)
+        params = load_params()
+
+    model = {
+        "format": FORMAT_VERSION,
+        "language": language,
+        "abbrev_types": set(params.abbrev_types),
+        "collocations": set(params.collocations),
+        "sent_starters": set(params.sent_starters),
+        "ortho_context": dict(params.ortho_context),
+    }
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        # Protocol 4 stores sets without referring to the `set` class, see `ModelUnpickler`
+        pickle.dump(model, f, protocol=4)
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+def load_model(path: str) -> Callable[[str], List[str]]:
+    """Load the Punkt model exported to `path` with `export_model`.
+
+    Args:
+        path (str): The path of the model.
+
+    Raises:
+        ValueError: If the model was exported in another format.
+
+    Returns:
+        Callable[[str], List[str]]: Splits a text into sentences exactly like nltk's `sent_tokenize`.
+    """
+    with open(path, "rb") as f:
+        model = ModelUnpickler(f).load()
+    if not isinstance(model, dict) or model.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path!r} is not a Punkt model of format {FORMAT_VERSION}, export it again with `python Punkt.py`.")
+
+    from nltk.tokenize.punkt import PunktParameters, PunktSentenceTokenizer
+    params = PunktParameters()
+    params.abbrev_types = model["abbrev_types"]
+    params.collocations = model["collocations"]
+    params.sent_starters = model["sent_starters"]
+    params.ortho_context.update(model["ortho_context"])
+    return PunktSentenceTokenizer(params).tokenize
+
+def ensure_model(path: str) -> None:
+    """Make sure a Punkt model exists at `path`.
+
+    Called when the bot starts, so a missing model is reported right away, instead of when the first message is learned.
+    The model is never downloaded here, as the bot must be able to start without internet access.
+    The model of `DEFAULT_PATH` is distributed with the bot, other models are exported with `python Punkt.py`.
+
+    Args:
+        path (str): The path of the model.
+
+    Raises:
+        RuntimeError: If there is no model at `path`.
+    """
+    if not os.path.isfile(path):
+        raise RuntimeError(f"The Punkt model {path!r} was not found. Set \"PunktModelPath\" in settings.json to {DEFAULT_PATH!r}, "
+                           f"which is distributed with the bot, or run `python Punkt.py --output {path}` to export it from nltk's data.")
+
+class SentenceSplitter:
+    """
+    Splits text into sentences with the Punkt model at `path`, exactly like nltk's `sent_tokenize`.
+
+    Neither the model nor nltk are loaded until the first text is split, or until `load` is called,
+    e.g. in a background thread while connecting.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Initialize the splitter, without loading the model.
+
+        Args:
+            path (str): The path of a model exported with `export_model`.
+        """
+        self.path = path
+        self._tokenize = None
+        self._lock = threading.Lock()
+
+    def load(self) -> float:
+        """Load the model, if it was not loaded yet.
+
+        Returns:
+            float: The number of seconds it took to load the model, or 0 if it was already loaded.
+        """
+        with self._lock:
+            if self._tokenize is not None:
+                return 0.0
+            start_t = time.perf_counter()
+            self._tokenize = load_model(self.path)
+            return time.perf_counter() - start_t
+
+    def __call__(self, text: str) -> List[str]:
+        """Split `text` into sentences.
+
+        Args:
+            text (str): The text to split, e.g. "Hello there. How are you?"
+
+        Returns:
+            List[str]: The sentences, e.g. ["Hello there.", "How are you?"]
+        """
+        if self._tokenize is None:
+            self.load()
+        return self._tokenize(text)
+
+if __name__ == "__main__":
+    from Log import Log
+    Log(__file__)
+
+    parser = argparse.ArgumentParser(description="Export the Punkt sentence splitting model of nltk, which the bot loads at startup. "
+                                                 "Downloads nltk's data if needed. See \"PunktModelPath\" in settings.json.")
+    parser.add_argument("--output", default=model_path(DEFAULT_PATH), help=f"The path of the exported model. Defaults to {DEFAULT_PATH} next to the bot.")
+    parser.add_argument("--language", default="english", help="The language of the model. Defaults to english.")
+    args = parser.parse_args()
+
+    start_t = time.perf_counter()
+    size = export_model(args.output, args.language)
+    logger.info(f"Exported the {args.language} Punkt model to {args.output!r} ({size} bytes) in {time.perf_counter() - start_t:.2f}s.")
@@ -0,0 +1,86 @@
+import random
+from bisect import bisect_right
+from itertools import accumulate
+from typing import List, Optional, Tuple
+
+class TransitionSampler:
+    """
+    Weighted sampler over the learned next words for one key, e.g. all [(word3, count), ...]
+    that follow ("I", "am"). Sampling draws a random number below the total count, and uses a
+    binary search over the cumulative counts to find the corresponding word, in O(log n).
+
+    The words are ordered such that the cumulative counts can be used for all variants of sampling
+    without being rebuilt:
+    > Normal words
+    > Variants of "<END>" with different casing, e.g. "<end>"
+    > "<END>" itself
+    As a result, the weight of "<END>" can depend on the index of the word in the sentence,
+    and "<END>" can be excluded entirely for the first generated word.
+    """
+    __slots__ = ("words", "cumulative", "initial_length", "initial_total", "total", "end_count")
+
+    def __init__(self, data: List[Tuple[str, int]]) -> None:
+        """Build the cumulative counts for `data`.
+
+        Args:
+            data (List[Tuple[str, int]]): A list of word - frequency pairs, e.g.
+                [('"the', 1), ('long', 1), ('<END>', 5), ('an', 2), ('a', 3), ('much', 1)]
+        """
+        normal = [tup for tup in data if tup[0].lower() != "<end>"]
+        end_variants = [tup for tup in data if tup[0].lower() == "<end>" and tup[0] != "<END>"]
+        self.words = [word for word, _count in normal + end_variants]
+        self.cumulative = list(accumulate(count for _word, count in normal + end_variants))
+        # The number and total count of words that may start a generation, and the total count excluding "<END>"
+        self.initial_length = len(normal)
+        self.initial_total = self.cumulative[len(normal) - 1] if normal else 0
+        self.total = self.cumulative[-1] if self.cumulative else 0
+        self.end_count = sum(count for word, count in data if word == "<END>")
+
+    def __len__(self) -> int:
+        return len(self.words) + (self.end_count > 0)
+
+    def sample(self, index: int = 0, initial: bool = False) -> Optional[str]:
+        """Randomly pick a word with word frequency as the weight.
+
+        Equivalent to `Database.pick_word`: `index` is used to decrease the weight of the <END>
+        token for the first 15 words in the sequence, and then increase the weight after the 15th index.
+
+        Args:
+            index (int, optional): The index of the newly generated word in the sentence.
+                Used for modifying how often the <END> token occurs. Defaults to 0.
+            initial (bool, optional): Whether to exclude "<END>", regardless of casing. Defaults to False.
+
+        Returns:
+            Optional[str]: The pseudo-randomly picked word, or None if there is nothing to pick from.
+        """
+        if initial:
+            if self.initial_total <= 0:
+                return None
+            value = random.random() * self.initial_total
+            # Bounding the search protects against floating point rounding of `value`
+            return self.words[bisect_right(self.cumulative, value, 0, self.initial_length - 1)]
+
+        end_weight = self.end_count * ((index + 1) / 15)
+        if self.total + end_weight <= 0:
+            return None
+        value = random.random() * (self.total + end_weight)
+        if self.end_count and value >= self.total:
+            return "<END>"
+        return self.words[bisect_right(self.cumulative, value, 0, len(self.words) - 1)]
+
+    def items(self) -> List[Tuple[str, int]]:
+        """Get the words with their counts, e.g. to build a sampler that includes more counts.
+
+        Returns:
+            List[Tuple[str, int]]: A list of word - frequency pairs, like the `data` this sampler was built with.
+        """
+        counts = [high - low for low, high in zip([0] + self.cumulative, self.cumulative)]
+        return list(zip(self.words, counts)) + ([("<END>", self.end_count)] if self.end_count else [])
+
+    def size(self) -> int:
+        """Approximate the number of bytes used by this sampler, for bounding caches.
+
+        Returns:
+            int: The approximate size in bytes.
+        """
+        return 200 + sum(len(word) + 100 for word in self.words)
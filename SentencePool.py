@@ -0,0 +1,132 @@
+import threading, logging, time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SentencePool(threading.Thread):
+    """
+    Thread that keeps a pool of ready-made sentences generated without parameters,
+    so `!generate` without parameters can be answered without querying the Database.
+
+    Sentences are discarded once they are older than `max_age` seconds, or when they are
+    invalidated because a message they might be derived from was unlearned.
+    """
+    def __init__(self, generate: Callable[[], Tuple[str, bool, List[List[str]]]], size: int, max_age: float, interval: float = 1) -> None:
+        """Initialize the pool. It is filled once the thread is started.
+
+        Args:
+            generate (Callable[[], Tuple[str, bool, List[List[str]]]]): Function that generates a sentence,
+                returning the sentence, whether the generation succeeded, and the tokens of the sentence.
+            size (int): The number of sentences to keep ready.
+            max_age (float): The number of seconds after which a sentence is discarded.
+            interval (float, optional): The maximum number of seconds between checks whether the pool
+                must be refilled. Defaults to 1.
+        """
+        threading.Thread.__init__(self)
+        self.name = "SentencePool"
+        self.daemon = True
+
+        self.generate = generate
+        self.size = size
+        self.max_age = max_age
+        self.interval = interval
+
+        # Stores (creation time, sentence, case-folded 3-grams of the sentence) tuples, oldest first
+        self._pool: Deque[Tuple[float, str, Set[Tuple[str, ...]]]] = deque()
+        self._lock = threading.Lock()
+        self._refill = threading.Event()
+        # Incremented on every invalidation, so sentences generated during an invalidation are discarded
+        self._generation = 0
+
+        self.served = 0
+        self.empty = 0
+        self.invalidated = 0
+
+    def take(self) -> Optional[str]:
+        """Take the oldest sentence from the pool that has not expired.
+
+        Returns:
+            Optional[str]: The sentence, or None if the pool is empty.
+        """
+        with self._lock:
+            self._prune()
+            if not self._pool:
+                self.empty += 1
+                sentence = None
+            else:
+                self.served += 1
+                sentence = self._pool.popleft()[1]
+        self._refill.set()
+        return sentence
+
+    def invalidate(self, tokens: List[str]) -> None:
+        """Discard all sentences that share a 3-gram with `tokens`, e.g. the tokens of an unlearned message.
+
+        Args:
+            tokens (List[str]): The tokens of the message, e.g. ["Hello", ",", "I", "'m", "Tom"].
+        """
+        ngrams = self._ngrams([tokens])
+        with self._lock:
+            before = len(self._pool)
+            self._pool = deque(entry for entry in self._pool if not entry[2] & ngrams)
+            self.invalidated += before - len(self._pool)
+            self._generation += 1
+        self._refill.set()
+
+    def clear(self) -> None:
+        """Discard all sentences, e.g. because the blacklist changed."""
+        with self._lock:
+            self.invalidated += len(self._pool)
+            self._pool.clear()
+            self._generation += 1
+        self._refill.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the current size and counters of this pool.
+
+        Returns:
+            Dict[str, int]: The number of pooled sentences, and the served, empty and invalidated counters.
+        """
+        return {
+            "size": len(self._pool),
+            "served": self.served,
+            "empty": self.empty,
+            "invalidated": self.invalidated,
+        }
+
+    def _ngrams(self, sentences: Iterable[List[str]]) -> Set[Tuple[str, ...]]:
+        """Get the case-folded 3-grams in `sentences`, including the "<END>" of each sentence."""
+        ngrams = set()
+        for sentence in sentences:
+            tokens = [token.lower() for token in sentence] + ["<end>"]
+            ngrams.update(tuple(tokens[i:i + 3]) for i in range(len(tokens) - 2))
+        return ngrams
+
+    def _prune(self) -> None:
+        """Remove expired sentences. Must be called while holding `self._lock`."""
+        now = time.monotonic()
+        while self._pool and now - self._pool[0][0] > self.max_age:
+            self._pool.popleft()
+
+    def run(self) -> None:
+        while True:
+            self._refill.wait(self.interval)
+            self._refill.clear()
+            with self._lock:
+                self._prune()
+                missing = self.size - len(self._pool)
+
+            for _ in range(missing):
+                generation = self._generation
+                try:
+                    sentence, success, sentences = self.generate()
+                except Exception as e:
+                    logger.exception(e)
+                    break
+                # If there is not enough learned information yet, try again later
+                if not success:
+                    break
+                with self._lock:
+                    if generation == self._generation:
+                        self._pool.append((time.monotonic(), sentence, self._ngrams(sentences)))
@@ -1,5 +1,5 @@
 import json, os, logging
-from typing import List
+from typing import Dict, List, Union
 try:
     from typing import TypedDict
 except ImportError:
@@ -24,6 +24,26 @@ class SettingsData(TypedDict):
     WhisperCooldown: bool
     EnableGenerateCommand: bool
     SentenceSeparator: str
+    DatabasePragmas: Dict[str, Union[str, int]]
+    LearnFlushSize: int
+    LearnFlushInterval: float
+    JournalSyncInterval: float
+    TransitionCacheEntries: int
+    TransitionCacheBytes: int
+    VocabularyCacheEntries: int
+    WriteQueueSize: int
+    SentencePoolSize: int
+    SentencePoolMaxAge: float
+    CompiledModelPath: str
+    CompiledModelReloadInterval: float
+    MetricsHost: str
+    MetricsPort: int
+    FastTokenizer: bool
+    TokenizationCacheEntries: int
+    TokenizationCacheBytes: int
+    PunktModelPath: str
+    MigrationProcesses: int
+    LearnedMessageEntries: int
 
 class Settings:
     """ Loads data from settings.json into the bot """
@@ -48,7 +68,33 @@ class Settings:
         "EnableGenerateCommand": True,
         "SentenceSeparator": " - ",
         "AllowGenerateParams": True,
-        "GenerateCommands": ["!generate", "!g"]
+        "GenerateCommands": ["!generate", "!g"],
+        "DatabasePragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 268435456, # 256 MiB
+            "cache_size": -16000, # ~16 MB
+            "temp_store": "MEMORY"
+        },
+        "LearnFlushSize": 10000,
+        "LearnFlushInterval": 30,
+        "JournalSyncInterval": 1,
+        "TransitionCacheEntries": 10000,
+        "TransitionCacheBytes": 33554432, # 32 MiB
+        "VocabularyCacheEntries": 100000,
+        "WriteQueueSize": 10000,
+        "SentencePoolSize": 10,
+        "SentencePoolMaxAge": 300,
+        "CompiledModelPath": "",
+        "CompiledModelReloadInterval": 60,
+        "MetricsHost": "127.0.0.1",
+        "MetricsPort": -1,
+        "FastTokenizer": True,
+        "TokenizationCacheEntries": 10000,
+        "TokenizationCacheBytes": 8388608, # 8 MiB
+        "PunktModelPath": "punkt_english.pickle",
+        "MigrationProcesses": 0,
+        "LearnedMessageEntries": 10000
     }
 
     def __init__(self, bot) -> None:
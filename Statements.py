@@ -0,0 +1,86 @@
+import sqlite3, time
+from typing import Dict, Iterable, List, Tuple
+
+class Statements:
+    """
+    Registry of the SQL statements that the Database executes repeatedly, keyed by table and operation,
+    e.g. ("MarkovGrammar", "transitions").
+
+    `sqlite3` caches the prepared statement of every distinct SQL string, per connection, and parses
+    the statement again once it was pushed out of that cache. Every statement is built once here,
+    so the same operation always uses the exact same string, and every connection gets a cache
+    of `self.cache_size` statements, so it fits all of them.
+    """
+    # Room for statements that are not registered, e.g. PRAGMAs and one-off queries of migrations
+    SPARE_ENTRIES = 32
+
+    def __init__(self) -> None:
+        self._sql: Dict[Tuple[str, str], str] = {}
+
+    def register(self, table: str, operation: str, sql: str) -> None:
+        """Register `sql` as the statement for `operation` on `table`.
+
+        Args:
+            table (str): The name of the table, e.g. "MarkovGrammar".
+            operation (str): The name of the operation, e.g. "transitions".
+            sql (str): The SQL statement, with "?" for where a value ought to be filled in.
+        """
+        if (table, operation) in self._sql:
+            raise ValueError(f"A statement for {operation!r} on {table!r} is already registered.")
+        self._sql[(table, operation)] = sql
+
+    def register_all(self, statements: Iterable[Tuple[str, str, str]]) -> None:
+        """Register all (table, operation, sql) tuples in `statements`, see `self.register`."""
+        for table, operation, sql in statements:
+            self.register(table, operation, sql)
+
+    def __getitem__(self, key: Tuple[str, str]) -> str:
+        return self._sql[key]
+
+    def __len__(self) -> int:
+        return len(self._sql)
+
+    @property
+    def cache_size(self) -> int:
+        """The number of prepared statements every connection should cache to fit all registered statements."""
+        return len(self) + Statements.SPARE_ENTRIES
+
+    def measure(self, conn: sqlite3.Connection, repeat: int = 20) -> Dict[str, float]:
+        """Measure how long parsing and preparing each registered statement takes, i.e. what a cache miss costs.
+
+        Each statement is prepared with EXPLAIN, which compiles the statement without executing it.
+        `conn` should be opened with `cached_statements=0`, so every repetition is prepared again.
+
+        Args:
+            conn (sqlite3.Connection): The connection to prepare the statements on.
+            repeat (int, optional): The number of times to prepare each statement. Defaults to 20.
+
+        Returns:
+            Dict[str, float]: Maps "{table}.{operation}" to the mean time to prepare it, in microseconds.
+        """
+        # Load the schema first, which the first prepared statement would otherwise be charged for
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1;").fetchall()
+        timings = {}
+        for (table, operation), sql in self._sql.items():
+            values = [None] * sql.count("?")
+            start_t = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute("EXPLAIN " + sql, values)
+            timings[f"{table}.{operation}"] = (time.perf_counter() - start_t) / repeat * 1e6
+        return timings
+
+    def query_plans(self, conn: sqlite3.Connection) -> Dict[str, List[str]]:
+        """Get the query plan of each registered statement, e.g. to check that lookups search an index instead of scanning a table.
+
+        Args:
+            conn (sqlite3.Connection): The connection to plan the statements on.
+
+        Returns:
+            Dict[str, List[str]]: Maps "{table}.{operation}" to the details of the steps of its plan, 
+                e.g. ["SEARCH MarkovGrammar USING PRIMARY KEY (word1=? AND word2=?)"]
+        """
+        plans = {}
+        for (table, operation), sql in self._sql.items():
+            values = [None] * sql.count("?")
+            plans[f"{table}.{operation}"] = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, values)]
+        return plans
@@ -0,0 +1,166 @@
+import argparse
+import logging
+import os
+import re
+import time
+from collections import Counter, deque
+from multiprocessing import Pool
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from TwitchWebsocket import Message
+
+from Database import Database
+from MarkovChainBot import MarkovChain
+from Settings import Settings
+
+from Log import Log
+Log(__file__)
+
+logger = logging.getLogger(__name__)
+
+# Matches lines in the IRC format as sent by Twitch, e.g. "@badge-info=;... :user!user@user.tmi.twitch.tv PRIVMSG #channel :Hello"
+IRC_LINE = re.compile(r"^(?:@\S* )?:\S+ [A-Z0-9]+ ")
+
+# The MarkovChain used by each worker process to filter and tokenize messages exactly like the bot.
+# It is set up by `init_worker`, and never connects to Twitch or the Database.
+bot: Optional[MarkovChain] = None
+
+def init_worker() -> None:
+    """Set up the MarkovChain used for filtering and tokenizing in this worker process."""
+    global bot
+    bot = MarkovChain(connect=False)
+
+def extract_message(line: str) -> Optional[str]:
+    """Get the chat message to learn from a line of a log file, filtered by `MarkovChain.filter_message` like in chat.
+
+    Lines in the IRC format are parsed, and only messages sent to chat are used.
+    Any other line is used as a message in its entirety.
+
+    Args:
+        line (str): The line from the log file.
+
+    Returns:
+        Optional[str]: The message to learn from, or None if nothing should be learned from this line.
+    """
+    line = line.strip()
+    if IRC_LINE.match(line):
+        m = Message(line)
+        if m.type != "PRIVMSG":
+            return None
+        message, reason = bot.filter_message(m.message, m.user, m.tags.get("emotes", ""))
+    else:
+        message, reason = bot.filter_message(line)
+    return message if reason is None else None
+
+def process_lines(lines: List[str]) -> Tuple[int, int, Counter, Counter]:
+    """Filter and tokenize `lines`, and count the starts and rules that would be learned from them.
+
+    Executed in a worker process.
+
+    Args:
+        lines (List[str]): Lines from a log file.
+
+    Returns:
+        Tuple[int, int, Counter, Counter]: The number of lines, the number of learned messages,
+            and the counts of the learned 2-gram starts and 3-gram rules.
+    """
+    starts = Counter()
+    rules = Counter()
+    messages = 0
+    for line in lines:
+        message = extract_message(line)
+        if message is None:
+            continue
+        messages += 1
+        message_starts, message_rules = bot.learned_ngrams(bot.tokenize_for_learning(message))
+        starts.update(message_starts)
+        rules.update(message_rules)
+    return len(lines), messages, starts, rules
+
+def read_chunks(paths: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    """Stream the lines of the files in `paths`, in chunks of `chunk_size` lines.
+
+    Args:
+        paths (Iterable[str]): The paths of the log files.
+        chunk_size (int): The number of lines per chunk.
+
+    Yields:
+        Iterator[List[str]]: Chunks of lines.
+    """
+    chunk = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                chunk.append(line)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+def train(paths: List[str], channel: str, processes: Optional[int] = None, chunk_size: int = 2000,
+          flush_size: int = 500000, report_interval: float = 5) -> None:
+    """Learn from the chat logs in `paths`, and store the result in the Database of `channel`.
+
+    The lines are filtered and tokenized in a pool of worker processes, which each count the learned n-grams
+    of a chunk of lines. These counts are merged in the delta tier of the Database, which is compacted
+    whenever it holds `flush_size` distinct n-grams, in one transaction.
+
+    Args:
+        paths (List[str]): The paths of the log files.
+        channel (str): The channel of the Database to learn into, e.g. "#CubieDev".
+        processes (Optional[int], optional): The number of worker processes. Defaults to None, i.e. one per CPU.
+        chunk_size (int, optional): The number of lines per task for a worker process. Defaults to 2000.
+        flush_size (int, optional): The number of distinct n-grams per transaction. Defaults to 500000.
+        report_interval (float, optional): The number of seconds between progress reports. Defaults to 5.
+    """
+    # Training cannot resume after an interruption anyway, so the delta tier is not logged
+    db = Database(channel, learn_flush_size=flush_size, learn_flush_interval=float("inf"), journal_sync_interval=None)
+
+    def learn(result: Tuple[int, int, Counter, Counter]) -> None:
+        nonlocal lines, messages, last_report_t
+        n_lines, n_messages, starts, rules = result
+        db.learn_counts(starts, rules)
+        lines += n_lines
+        messages += n_messages
+
+        now = time.perf_counter()
+        if now - last_report_t >= report_interval:
+            last_report_t = now
+            logger.info(f"Processed {lines} lines, learned {messages} messages ({messages / (now - start_t):.0f} msgs/s).")
+
+    start_t = last_report_t = time.perf_counter()
+    lines = messages = 0
+    try:
+        with Pool(processes, initializer=init_worker) as pool:
+            # Only read a few chunks ahead of the workers, so memory usage does not grow with the size of the logs
+            max_pending = 4 * (processes or os.cpu_count() or 1)
+            pending = deque()
+            for chunk in read_chunks(paths, chunk_size):
+                pending.append(pool.apply_async(process_lines, (chunk,)))
+                if len(pending) >= max_pending:
+                    learn(pending.popleft().get())
+            while pending:
+                learn(pending.popleft().get())
+    finally:
+        db.close()
+
+    duration = time.perf_counter() - start_t
+    logger.info(f"Finished learning {messages} messages out of {lines} lines in {duration:.1f}s ({messages / duration:.0f} msgs/s), "
+                f"writing {db.written_rows} rows.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Learn from chat log files, as if the bot had read these messages in chat. "
+                                                 "Both plain text logs with one message per line, and logs in the IRC format are supported.")
+    parser.add_argument("paths", nargs="+", help="The log files to learn from.")
+    parser.add_argument("--channel", default=None, help="The channel to learn for. Defaults to \"Channel\" from settings.json.")
+    parser.add_argument("--processes", type=int, default=None, help="The number of worker processes. Defaults to the number of CPUs.")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="The number of lines per task for a worker process.")
+    parser.add_argument("--flush-size", type=int, default=500000, help="The number of distinct learned n-grams per database transaction.")
+    args = parser.parse_args()
+
+    train(args.paths,
+          args.channel or Settings.get_channel(),
+          processes=args.processes,
+          chunk_size=args.chunk_size,
+          flush_size=args.flush_size)
@@ -0,0 +1,134 @@
+import sqlite3, logging, string
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from Cache import LRUCache
+from Statements import Statements
+
+logger = logging.getLogger(__name__)
+
+# Lowercases only A-Z, exactly like SQLite's NOCASE collation
+NOCASE_TABLE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+class Vocabulary:
+    """
+    Bidirectional in-memory cache of the Vocabulary table, which maps every learned word to an integer ID.
+    The MarkovStart, MarkovGrammar and StartIndex tables store these IDs instead of the words themselves.
+
+    IDs are never changed or reused once they are committed, so cached entries never become outdated.
+    Only IDs assigned in a transaction that is rolled back are invalid, see `self.clear`.
+
+    Missing words and IDs are looked up with "IN (?, ?, ...)" queries. Batches are padded to a power of two,
+    so only a few distinct statements are ever prepared, see `Statements.py`.
+    """
+    # The maximum number of parameters per query, safely below SQLite's SQLITE_MAX_VARIABLE_NUMBER
+    BATCH_SIZE = 512
+    # The padded batch sizes, i.e. 1, 2, 4, ..., BATCH_SIZE
+    SHAPES = [1 << i for i in range(BATCH_SIZE.bit_length())]
+
+    def __init__(self, max_entries: int, statements: Statements) -> None:
+        """Initialize the empty cache.
+
+        Args:
+            max_entries (int): The maximum number of words cached in each direction.
+            statements (Statements): The registry holding `Vocabulary.statements()`.
+        """
+        self.statements = statements
+        self.word_ids = LRUCache(max_entries, max_entries * 200)
+        self.id_words = LRUCache(max_entries, max_entries * 200)
+
+    @staticmethod
+    def statements() -> List[Tuple[str, str, str]]:
+        """Get the (table, operation, sql) tuples of the lookup statements for every padded batch size."""
+        return [statement for size in Vocabulary.SHAPES for statement in [
+            ("Vocabulary", f"ids_{size}", f"SELECT id, word FROM Vocabulary WHERE word IN ({', '.join('?' * size)});"),
+            ("Vocabulary", f"words_{size}", f"SELECT id, word FROM Vocabulary WHERE id IN ({', '.join('?' * size)});"),
+        ]]
+
+    @staticmethod
+    def batches(items: List[Any]) -> Iterator[Tuple[int, List[Any]]]:
+        """Split `items` into batches of at most `Vocabulary.BATCH_SIZE`, padded to a size in `Vocabulary.SHAPES` by repeating the last item.
+
+        Yields:
+            Iterator[Tuple[int, List[Any]]]: The padded size and the padded batch.
+        """
+        for i in range(0, len(items), Vocabulary.BATCH_SIZE):
+            batch = items[i:i + Vocabulary.BATCH_SIZE]
+            size = 1 << (len(batch) - 1).bit_length()
+            yield size, batch + batch[-1:] * (size - len(batch))
+
+    def get_ids(self, cur: sqlite3.Cursor, words: Iterable[str]) -> Dict[str, int]:
+        """Get the IDs of `words`, adding the words that are not in the Vocabulary table yet.
+
+        Must be called within a transaction on the writer connection.
+
+        Args:
+            cur (sqlite3.Cursor): A cursor of the writer connection.
+            words (Iterable[str]): The words, e.g. ["Hello", "hello", "<END>"].
+
+        Returns:
+            Dict[str, int]: Maps each word to its ID.
+        """
+        ids = {}
+        missing = []
+        for word in set(words):
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                missing.append(word)
+            else:
+                ids[word] = word_id
+
+        for size, batch in Vocabulary.batches(missing):
+            cur.executemany("INSERT OR IGNORE INTO Vocabulary (word, word_folded, word_lower) VALUES (?, ?, ?);",
+                            [(word, word.translate(NOCASE_TABLE), word.lower()) for word in batch])
+            for word_id, word in cur.execute(self.statements["Vocabulary", f"ids_{size}"], batch):
+                ids[word] = word_id
+                self.put(word_id, word)
+        return ids
+
+    def get_words(self, conn: sqlite3.Connection, ids: Iterable[int]) -> Dict[int, str]:
+        """Get the words with `ids`.
+
+        Args:
+            conn (sqlite3.Connection): A connection to read missing words with.
+            ids (Iterable[int]): The IDs of the words.
+
+        Returns:
+            Dict[int, str]: Maps each ID to its word.
+        """
+        words = {}
+        missing = []
+        for word_id in set(ids):
+            word = self.id_words.get(word_id)
+            if word is None:
+                missing.append(word_id)
+            else:
+                words[word_id] = word
+
+        for size, batch in Vocabulary.batches(missing):
+            for word_id, word in conn.execute(self.statements["Vocabulary", f"words_{size}"], batch):
+                words[word_id] = word
+                self.put(word_id, word)
+        return words
+
+    def get_word_list(self, conn: sqlite3.Connection, ids: List[int]) -> List[str]:
+        """Get the words with `ids`, in the same order.
+
+        Args:
+            conn (sqlite3.Connection): A connection to read missing words with.
+            ids (List[int]): The IDs of the words.
+
+        Returns:
+            List[str]: The words, e.g. ["I", "am"].
+        """
+        words = self.get_words(conn, ids)
+        return [words[word_id] for word_id in ids]
+
+    def put(self, word_id: int, word: str) -> None:
+        """Cache that `word` has ID `word_id`, in both directions."""
+        self.word_ids.put(word, word_id, len(word) + 100, self.word_ids.generation)
+        self.id_words.put(word_id, word, len(word) + 100, self.id_words.generation)
+
+    def clear(self) -> None:
+        """Remove all cached words, e.g. because a transaction that assigned new IDs was rolled back."""
+        self.word_ids.clear()
+        self.id_words.clear()
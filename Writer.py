@@ -0,0 +1,173 @@
+import threading, logging, queue
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class DatabaseWriter(threading.Thread):
+    """
+    Thread that owns the writer connection of a `Database`, and executes all
+    mutations that are submitted to it, in order.
+
+    Submitting never blocks, so the thread reading chat never waits on the database: if more than
+    `max_queue_size` mutations are queued, mutations submitted with `self.submit` are dropped, and counted
+    in the metrics of the Database. Mutations that must not be lost, like unlearning, are submitted with
+    `self.submit_required`, which queues them regardless, or with `self.submit_wait`, which also waits
+    until they are executed. Whenever the queue is idle, the Database is asked to commit learned data that is due.
+    """
+    def __init__(self, db: "Database", max_queue_size: int, idle_interval: float = 0.5) -> None:
+        threading.Thread.__init__(self)
+        self.name = "DatabaseWriter"
+        self.daemon = True
+
+        self.db = db
+        # The queue itself is unbounded, so required mutations always fit. Only `self.submit` checks the size.
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.max_queue_size = max_queue_size
+        self.idle_interval = idle_interval
+        # Whether the last submitted mutation was dropped, so a full queue is only logged once until it drains
+        self._full = False
+
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> bool:
+        """Queue `func(*args)` to be executed on this thread.
+
+        If this thread is not running, e.g. before the Database is fully initialised or after it
+        was closed, `func(*args)` is executed immediately on the calling thread instead.
+
+        Args:
+            func (Callable[..., Any]): The function to execute.
+            args (Any): The arguments for `func`.
+
+        Returns:
+            bool: False if the queue was full, and the mutation was dropped. True otherwise.
+        """
+        if not self.is_alive():
+            func(*args)
+            return True
+        if self.queue.qsize() >= self.max_queue_size:
+            self.dropped += 1
+            self.db.metrics.count("database_writes", "dropped")
+            if not self._full:
+                self._full = True
+                logger.warning(f"Database write queue is full, dropping mutations until it drains. Dropped {func.__name__}.")
+            return False
+        self.queue.put((func, args))
+        self._full = False
+        return True
+
+    def submit_required(self, func: Callable[..., Any], *args: Any) -> None:
+        """Queue `func(*args)` to be executed on this thread, even if the queue is full.
+
+        Like `self.submit`, but for mutations that must not be lost, like unlearning and purging.
+        Never blocks, as the queue itself is unbounded.
+
+        Args:
+            func (Callable[..., Any]): The function to execute.
+            args (Any): The arguments for `func`.
+        """
+        if not self.is_alive():
+            func(*args)
+            return
+        self.queue.put((func, args))
+
+    def submit_wait(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> bool:
+        """Queue `func(*args)` to be executed on this thread, even if the queue is full, and wait until it is executed.
+
+        If `func` was not started within `timeout` seconds, it is cancelled, so it is never executed.
+        Once started, it is always waited for.
+
+        Args:
+            func (Callable[..., Any]): The function to execute.
+            args (Any): The arguments for `func`.
+            timeout (Optional[float], optional): The maximum number of seconds to wait for `func` to start. 
+                Defaults to None.
+
+        Returns:
+            bool: True if `func(*args)` was executed without raising an exception, False if it was cancelled or failed.
+        """
+        if not self.is_alive():
+            func(*args)
+            return True
+        lock = threading.Lock()
+        done = threading.Event()
+        # Whether `func` was started, was cancelled, and succeeded
+        state = {"started": False, "cancelled": False, "succeeded": False}
+        def execute():
+            with lock:
+                if state["cancelled"]:
+                    return
+                state["started"] = True
+            try:
+                func(*args)
+                state["succeeded"] = True
+            finally:
+                done.set()
+        self.queue.put((execute, ()))
+        if not done.wait(timeout):
+            with lock:
+                if not state["started"]:
+                    state["cancelled"] = True
+                    return False
+            done.wait()
+        return state["succeeded"]
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything submitted so far is executed and committed.
+
+        Args:
+            timeout (Optional[float], optional): The maximum number of seconds to wait. Defaults to None.
+
+        Returns:
+            bool: True if everything was committed within `timeout`.
+        """
+        if not self.is_alive():
+            self.db.execute_commit()
+            return True
+        done = threading.Event()
+        def commit():
+            self.db.execute_commit()
+            done.set()
+        self.queue.put((commit, ()))
+        return done.wait(timeout)
+
+    def stop(self) -> None:
+        """Execute and commit everything submitted so far, and then stop this thread."""
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the queue depth and counters of this writer.
+
+        Returns:
+            Dict[str, int]: The queue depth, and the number of processed, dropped and failed mutations.
+        """
+        return {
+            "queue_depth": self.queue.qsize(),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def run(self) -> None:
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_interval)
+            except queue.Empty:
+                item = ()
+
+            try:
+                if item is None:
+                    self.db.execute_commit()
+                    return
+                if item:
+                    func, args = item
+                    func(*args)
+                    self.processed += 1
+                self.db.commit_if_due()
+            except Exception as e:
+                self.failed += 1
+                logger.exception(e)
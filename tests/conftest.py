@@ -0,0 +1,31 @@
+import os, sys
+
+import pytest
+
+# The modules of the bot live in the root of the repository, next to MarkovChainBot.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Database import Database
+from databases import LEGACY_MESSAGES, create_legacy_database
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A new, empty Database of the channel "#test", whose files are created in a temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    db = Database("#test")
+    yield db
+    db.close()
+
+@pytest.fixture
+def v2_database(tmp_path, monkeypatch):
+    """The path of a version 2 database of the channel "#test" in a temporary directory, containing `LEGACY_MESSAGES`."""
+    monkeypatch.chdir(tmp_path)
+    create_legacy_database("MarkovChain_test.db", 2, LEGACY_MESSAGES)
+    return tmp_path / "MarkovChain_test.db"
+
+@pytest.fixture
+def v3_database(tmp_path, monkeypatch):
+    """The path of a version 3 database of the channel "#test" in a temporary directory, containing `LEGACY_MESSAGES`."""
+    monkeypatch.chdir(tmp_path)
+    create_legacy_database("MarkovChain_test.db", 3, LEGACY_MESSAGES)
+    return tmp_path / "MarkovChain_test.db"
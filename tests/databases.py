@@ -0,0 +1,101 @@
+"""Helpers to create and inspect the databases of the tests."""
+import sqlite3, string
+from collections import Counter
+
+# Messages as tokenized since version 3, which split punctuation from words
+LEGACY_MESSAGES = [
+    ["Hello", "there", ",", "how", "are", "you", "?"],
+    ["how", "are", "you", "doing", "today"],
+    ["I", "am", "fine", ",", "thanks"],
+    ["Kappa", "Kappa", "Kappa", "LUL"],
+    ["école", "is", "open"],
+    ["42", "is", "the", "answer"],
+    ["Hello", "there", ",", "friend"],
+]
+
+def legacy_suffix(word: str) -> str:
+    return word[0].upper() if word[0] in string.ascii_letters else "_"
+
+def legacy_counts(messages):
+    """The counts of the starts and 3-grams of `messages`, as learned by the bot."""
+    starts, grammar = Counter(), Counter()
+    for words in messages:
+        starts[tuple(words[:2])] += 1
+        for ngram in [tuple(words[i:i + 3]) for i in range(len(words) - 2)] + [(*words[-2:], "<END>")]:
+            if not ngram[0] == ngram[1] == ngram[2]:
+                grammar[ngram] += 1
+    return starts, grammar
+
+def create_legacy_database(path: str, version: int, messages) -> None:
+    """Create a database at `path` with the structure of `version` 2 or 3, i.e. one table per first
+    character(s), containing `messages`. Version 2 has no Version table yet."""
+    starts, grammar = legacy_counts(messages)
+    conn = sqlite3.connect(path)
+    characters = list(string.ascii_uppercase) + ["_"]
+    for first_char in characters:
+        conn.execute(f"""CREATE TABLE MarkovStart{first_char} (word1 TEXT COLLATE NOCASE, word2 TEXT COLLATE NOCASE, count INTEGER,
+                         PRIMARY KEY (word1 COLLATE BINARY, word2 COLLATE BINARY));""")
+        for second_char in characters:
+            conn.execute(f"""CREATE TABLE MarkovGrammar{first_char}{second_char} (word1 TEXT COLLATE NOCASE, word2 TEXT COLLATE NOCASE,
+                             word3 TEXT COLLATE NOCASE, count INTEGER, PRIMARY KEY (word1 COLLATE BINARY, word2 COLLATE BINARY, word3 COLLATE BINARY));""")
+    for (word1, word2), count in starts.items():
+        conn.execute(f"INSERT INTO MarkovStart{legacy_suffix(word1)} VALUES (?, ?, ?);", (word1, word2, count))
+    for (word1, word2, word3), count in grammar.items():
+        conn.execute(f"INSERT INTO MarkovGrammar{legacy_suffix(word1)}{legacy_suffix(word2)} VALUES (?, ?, ?, ?);", (word1, word2, word3, count))
+    conn.execute("CREATE TABLE WhisperIgnore (username TEXT, PRIMARY KEY (username));")
+    conn.execute("INSERT INTO WhisperIgnore VALUES ('quiet_user');")
+    if version >= 3:
+        conn.execute("CREATE TABLE Version (version INTEGER);")
+        conn.execute("INSERT INTO Version VALUES (?);", (version,))
+    conn.commit()
+    conn.close()
+
+def stored_counts(db):
+    """The counts of all rows of MarkovStart and MarkovGrammar of `db`, by their words."""
+    conn = db.writer
+    words = dict(conn.execute("SELECT id, word FROM Vocabulary;"))
+    starts = Counter({(words[word1], words[word2]): count
+                      for word1, word2, count in conn.execute("SELECT word1, word2, count FROM MarkovStart;")})
+    grammar = Counter({(words[word1], words[word2], words[word3]): count
+                       for word1, word2, word3, count in conn.execute("SELECT word1, word2, word3, count FROM MarkovGrammar;")})
+    return starts, grammar
+
+def learn(db, words, message_id=""):
+    """Learn the message of `words` with `db`, exactly like the bot learns a message of one sentence."""
+    rules = [tuple(words[i:i + 3]) for i in range(len(words) - 2)] + [(*words[-2:], "<END>")]
+    db.learn([tuple(words[:2])], rules, message_id)
+
+def start_index_problems(db):
+    """Compare the StartIndex and StartTotals of `db` with a recount of MarkovStart.
+
+    Returns:
+        List[str]: A description of every difference, i.e. an empty list if they are consistent.
+    """
+    conn = db.writer
+    words = dict(conn.execute("SELECT id, word FROM Vocabulary;"))
+    problems = []
+    counts = {(word1, word2): count for word1, word2, count in conn.execute("SELECT word1, word2, count FROM MarkovStart;")}
+    ranges = Counter()
+    totals = Counter()
+    for suffix, low, high, word1, word2 in conn.execute("SELECT suffix, low, high, word1, word2 FROM StartIndex ORDER BY suffix, low;"):
+        if legacy_suffix(words[word1]) != suffix:
+            problems.append(f"range [{low}, {high}) of {words[word1]!r} has suffix {suffix!r}")
+        ranges[(word1, word2)] += high - low
+        totals[suffix] += high - low
+    for start in set(counts) | set(ranges):
+        if counts.get(start, 0) != ranges[start]:
+            problems.append(f"{tuple(words[word_id] for word_id in start)} has count {counts.get(start, 0)}, but ranges of {ranges[start]}")
+    for suffix, total, extent, n_ranges in conn.execute("SELECT suffix, total, extent, ranges FROM StartTotals;"):
+        if total != totals[suffix]:
+            problems.append(f"suffix {suffix!r} has total {total}, but ranges of {totals[suffix]}")
+        n_rows, highest = conn.execute("SELECT COUNT(*), coalesce(MAX(high), 0) FROM StartIndex WHERE suffix = ?;", (suffix,)).fetchone()
+        if n_ranges != n_rows or extent < highest:
+            problems.append(f"suffix {suffix!r} has {n_ranges} ranges up to {extent}, but {n_rows} ranges up to {highest}")
+    # Ranges must not overlap
+    for suffix, in conn.execute("SELECT suffix FROM StartTotals;"):
+        previous = 0
+        for low, high in conn.execute("SELECT low, high FROM StartIndex WHERE suffix = ? ORDER BY low;", (suffix,)):
+            if low < previous or high <= low:
+                problems.append(f"range [{low}, {high}) of suffix {suffix!r} overlaps or is empty")
+            previous = high
+    return problems
@@ -0,0 +1,85 @@
+import random
+
+from Blacklist import Blacklist, PhraseMatcher
+from Tokenizer import fast_tokenize
+
+def naive_matches(entries, tokens):
+    """Whether any entry occurs in `tokens`, as a token equal to the entry, or as a sequence of its tokens."""
+    lowered = [token.lower() for token in tokens]
+    for entry in entries:
+        phrase = [token.lower() for token in fast_tokenize(entry)]
+        if entry.lower() in lowered:
+            return True
+        if phrase and any(lowered[i:i + len(phrase)] == phrase for i in range(len(lowered) - len(phrase) + 1)):
+            return True
+    return False
+
+def test_words_and_phrases():
+    blacklist = Blacklist(["Kappa", "can't stop", "<start>"], fast_tokenize)
+    assert blacklist.matches(["KAPPA"])
+    assert blacklist.matches(["I", "ca", "n't", "stop", "now"])
+    assert not blacklist.matches(["ca", "n't", "go"])
+    assert blacklist.matches(["<START>"])
+    assert not blacklist.matches(["Hello"])
+
+def test_entries_match_as_soon_as_they_are_added():
+    blacklist = Blacklist(["a b c"], fast_tokenize)
+    blacklist.compile()
+    assert blacklist.add("very bad phrase")
+    # Whether or not the matcher is rebuilt yet
+    assert blacklist.matches(["a", "Very", "bad", "phrase"])
+    assert blacklist.wait_rebuilt(5)
+    assert blacklist.matches(["a", "Very", "bad", "phrase"])
+    assert blacklist._state[2] == ()
+    blacklist.add("LUL")
+    assert blacklist.matches(["lul"])
+
+def test_remove_keeps_words_of_other_entries():
+    # Both entries are the token "lul"
+    blacklist = Blacklist(["LUL", "lul ", "can't stop", "stop"], fast_tokenize)
+    blacklist.compile()
+    blacklist.remove("LUL")
+    assert blacklist.wait_rebuilt(5)
+    assert blacklist.matches(["Lul"])
+    blacklist.remove("lul ")
+    assert blacklist.wait_rebuilt(5)
+    assert not blacklist.matches(["Lul"])
+
+    blacklist.remove("CAN'T STOP")
+    assert blacklist.wait_rebuilt(5)
+    assert not blacklist.matches(["ca", "n't", "go"])
+    assert blacklist.matches(["ca", "n't", "stop"])
+    assert blacklist.entries == ["stop"]
+
+def test_random_updates_match_naive():
+    rng = random.Random(0)
+    vocabulary = ["a", "b", "c", "d", "e", "can't", "LUL"]
+    blacklist = Blacklist([], fast_tokenize)
+    blacklist.compile()
+    entries = []
+    for step in range(300):
+        if entries and rng.random() < 0.4:
+            entry = rng.choice(entries)
+            entries.remove(entry)
+            blacklist.remove(entry)
+        else:
+            entry = " ".join(rng.choices(vocabulary, k=rng.randint(1, 3)))
+            if blacklist.add(entry):
+                entries.append(entry)
+        if step % 10 == 0:
+            blacklist.wait_rebuilt(5)
+        for _ in range(20):
+            tokens = fast_tokenize(" ".join(rng.choices(vocabulary + ["x", "y"], k=rng.randint(1, 8))))
+            expected = naive_matches(entries, tokens)
+            # Removed entries may still match until the blacklist is rebuilt, but added ones always match
+            assert blacklist.matches(tokens) >= expected
+        blacklist.wait_rebuilt(5)
+        for _ in range(20):
+            tokens = fast_tokenize(" ".join(rng.choices(vocabulary + ["x", "y"], k=rng.randint(1, 8))))
+            assert blacklist.matches(tokens) == naive_matches(entries, tokens)
+
+def test_phrase_matcher_overlapping_phrases():
+    matcher = PhraseMatcher([("a", "b", "c"), ("b", "d"), ("c",)])
+    assert matcher.search(["a", "b", "d"])
+    assert matcher.search(["a", "b", "x", "c"])
+    assert not matcher.search(["a", "b", "x"])
@@ -0,0 +1,126 @@
+import random
+from collections import Counter
+
+import pytest
+
+from CompiledModel import CompiledModel, compile_model
+from databases import learn
+
+# Includes words that only differ in casing, and a variant of "<END>", which are all looked up case-insensitively
+MESSAGES = [
+    ["How", "are", "you", "?"],
+    ["how", "are", "you", "doing"],
+    ["HOW", "ARE", "YOU", "doing", "today"],
+    ["I", "am", "fine", ",", "thanks"],
+    ["I", "am", "<end>", "of", "it"],
+    ["Kappa", "Kappa", "LUL"],
+    ["école", "is", "open"],
+    ["École", "is", "closed"],
+]
+# The number of evenly spaced values that `random.random` returns, to compare samplers without randomness
+GRID = 2000
+
+@pytest.fixture
+def model(database, tmp_path):
+    for words in MESSAGES * 3 + MESSAGES[:4]:
+        learn(database, words)
+    database.flush()
+    path = str(tmp_path / "MarkovChain_test.model")
+    compile_model(database.db_name, path)
+    return CompiledModel(path, reload_interval=3600)
+
+def grid_counts(monkeypatch, sample):
+    """Count the results of `sample()` for `GRID` evenly spaced values of `random.random`.
+
+    A sampler that splits [0, 1) into intervals by weight, in any order, gets counts within 1 of `GRID` times each share.
+    """
+    values = iter((k + 0.5) / GRID for k in range(GRID))
+    monkeypatch.setattr(random, "random", lambda: next(values))
+    counts = Counter(sample() for _ in range(GRID))
+    monkeypatch.undo()
+    return counts
+
+def assert_same_shares(counts, weights):
+    total = sum(weights.values())
+    if total == 0:
+        assert counts == {None: GRID}
+        return
+    assert set(counts) == {word for word, weight in weights.items() if weight > 0}
+    for word, weight in weights.items():
+        assert abs(counts[word] - GRID * weight / total) <= 1, (word, counts[word], GRID * weight / total)
+
+def summed(items):
+    counts = Counter()
+    for word, count in items:
+        counts[word] += count
+    return counts
+
+def grouped(model, prefix, word_section):
+    """Map the keys of the `prefix` sections of `model` to the counts of their words."""
+    sections, _end_id = model._model
+    keys, offsets, cumulative = sections[f"{prefix}_keys"], sections[f"{prefix}_offsets"], sections[f"{prefix}_cumulative"]
+    result = {}
+    for i, key in enumerate(keys):
+        counts = Counter()
+        for j in range(offsets[i], offsets[i + 1]):
+            counts[model._word(sections, sections[word_section][j])] += cumulative[j] - (cumulative[j - 1] if j else 0)
+        result[key] = counts
+    return result
+
+def folded_word(model, folded_id):
+    sections, _end_id = model._model
+    offsets = sections["folded_offsets"]
+    return sections["folded"][offsets[folded_id]:offsets[folded_id + 1]].tobytes().decode("utf-8")
+
+def test_transitions_match_database(database, model, monkeypatch):
+    keys = database.query("""
+        SELECT DISTINCT v1.word_folded, v2.word_folded FROM MarkovGrammar
+        JOIN Vocabulary v1 ON v1.id = word1 JOIN Vocabulary v2 ON v2.id = word2;""")
+    compiled = {(folded_word(model, key >> 32), folded_word(model, key & 0xFFFFFFFF)): counts
+                for key, counts in grouped(model, "grammar", "grammar_words").items()}
+    assert set(compiled) == set(keys)
+    for key in keys:
+        sampler = database.get_sampler(list(key))
+        assert compiled[key] == summed(sampler.items())
+        # Both sample the same words with the same weights, including the reweighted "<END>"
+        for index in (0, 7, 20):
+            weights = {word: count * (index + 1) / 15 if word == "<END>" else count for word, count in compiled[key].items()}
+            assert_same_shares(grid_counts(monkeypatch, lambda: model.get_next(index, list(key))), weights)
+            assert_same_shares(grid_counts(monkeypatch, lambda: sampler.sample(index)), weights)
+        weights = {word: count for word, count in compiled[key].items() if word.lower() != "<end>"}
+        assert_same_shares(grid_counts(monkeypatch, lambda: model.get_next_initial(0, list(key))), weights)
+        assert_same_shares(grid_counts(monkeypatch, lambda: sampler.sample(initial=True)), weights)
+
+def test_singles_and_starts_match_database(database, model, monkeypatch):
+    for word in ("how", "I", "ÉCOLE", "école", "Kappa", "missing"):
+        folded = database.nocase(word)
+        singles = database.query(database.statements["MarkovGrammar", "singles"], (folded, "<end>"))
+        expected = Counter({database.vocabulary.get_words(database.reader, [word_id])[word_id]: count for word_id, count in singles})
+        if expected:
+            assert_same_shares(grid_counts(monkeypatch, lambda: model.get_next_single_initial(0, word)[1]), expected)
+        else:
+            assert model.get_next_single_initial(0, word) is None
+
+        seconds = database.query(database.statements["MarkovStart", "seconds"], (folded,))
+        expected = summed((database.vocabulary.get_words(database.reader, [word_id])[word_id], count) for word_id, count in seconds)
+        if expected:
+            assert_same_shares(grid_counts(monkeypatch, lambda: model.get_next_single_start(word)[1]), expected)
+        else:
+            assert model.get_next_single_start(word) is None
+
+def test_start_distribution_matches_database(database, model, monkeypatch):
+    starts = Counter()
+    for word1, word2, count in database.query("""
+            SELECT v1.word, v2.word, count FROM MarkovStart JOIN Vocabulary v1 ON v1.id = word1 JOIN Vocabulary v2 ON v2.id = word2;"""):
+        starts[(word1, word2)] += count
+    assert_same_shares(grid_counts(monkeypatch, lambda: tuple(model.get_start())), starts)
+
+def test_reload_picks_up_recompiled_model(database, model):
+    assert model.get_next(0, ["Brand", "new"]) is None
+    assert not model.reload_if_changed()
+
+    learn(database, ["Brand", "new", "words"])
+    database.flush()
+    compile_model(database.db_name, model.path)
+    assert model.reload_if_changed()
+    assert model.get_next_initial(0, ["brand", "NEW"]) == "words"
@@ -0,0 +1,117 @@
+import os, subprocess, sys, textwrap, threading
+from collections import Counter
+
+from Database import Database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def transitions(db, words):
+    """The summed counts of the next words after `words`, merged from the delta tier and the database."""
+    counter = Counter()
+    for word, count in db.get_sampler(words).items():
+        counter[word] += count
+    return counter
+
+def counts(db):
+    """The counts of all rows of MarkovStart and MarkovGrammar, by their words."""
+    conn = db.writer
+    words = dict(conn.execute("SELECT id, word FROM Vocabulary;"))
+    starts = {(words[word1], words[word2]): count for word1, word2, count in conn.execute("SELECT word1, word2, count FROM MarkovStart;")}
+    grammar = {(words[word1], words[word2], words[word3]): count
+               for word1, word2, word3, count in conn.execute("SELECT word1, word2, word3, count FROM MarkovGrammar;")}
+    return starts, grammar
+
+def crash(tmp_path, code):
+    """Run `code` with `db`, a Database of "#test" in `tmp_path`, in a new process, which then exits without closing it."""
+    script = textwrap.dedent(f"""
+        import os, sys
+        sys.path.insert(0, {ROOT!r})
+        from Database import Database
+        db = Database("#test", learn_flush_interval=3600, journal_sync_interval=0)
+        def learn(words, message_id=""):
+            rules = [tuple(words[i:i + 3]) for i in range(len(words) - 2)] + [(*words[-2:], "<END>")]
+            db.learn([tuple(words[:2])], rules, message_id)
+    """) + textwrap.dedent(code) + "\nos._exit(0)\n"
+    subprocess.run([sys.executable, "-c", script], cwd=tmp_path, check=True)
+
+def test_reader_never_counts_compacted_ngrams_twice(database, monkeypatch):
+    database.learn([("How", "are")], [("How", "are", "you")])
+    database.flush()
+    database.learn([("How", "are")], [("How", "are", "you"), ("How", "are", "me")])
+
+    committed = threading.Event()
+    proceed = threading.Event()
+    drop = database.delta.drop
+    def drop_later(frozen):
+        # Reached on the writer thread once the compacted counts are committed, but before the frozen tier is dropped
+        committed.set()
+        assert proceed.wait(5)
+        drop(frozen)
+    monkeypatch.setattr(database.delta, "drop", drop_later)
+
+    flush = threading.Thread(target=database.flush)
+    flush.start()
+    assert committed.wait(5)
+    read = {}
+    reader = threading.Thread(target=lambda: read.update(transitions(database, ["How", "are"])))
+    reader.start()
+    reader.join(0.2)
+    proceed.set()
+    reader.join(5)
+    flush.join(5)
+    assert read == {"you": 2, "me": 1}
+    assert transitions(database, ["How", "are"]) == {"you": 2, "me": 1}
+
+def test_uncompacted_segment_is_replayed_after_crash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    crash(tmp_path, """
+        learn(["How", "are", "you"])
+        db.flush()
+        learn(["How", "are", "you"])
+        learn(["I", "am", "fine"])
+    """)
+    db = Database("#test")
+    try:
+        # The second and third message were only in the journal, and are compacted when it is replayed
+        assert db.delta.stats()["compacted_ngrams"] == 6
+        assert counts(db) == ({("How", "are"): 2, ("I", "am"): 1},
+                              {("How", "are", "you"): 2, ("are", "you", "<END>"): 2, ("I", "am", "fine"): 1, ("am", "fine", "<END>"): 1})
+        assert transitions(db, ["How", "are"]) == {"you": 2}
+        assert db.delta.journal.existing_segments() == []
+    finally:
+        db.close()
+
+def test_compacted_segment_is_not_replayed_after_crash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Crash after the compaction is committed, but before its journal segment is removed
+    crash(tmp_path, """
+        db.delta.journal.remove = lambda segments: os._exit(0)
+        learn(["How", "are", "you"])
+        db.flush()
+    """)
+    assert os.path.exists(tmp_path / "MarkovChain_test_delta_1.log")
+    db = Database("#test")
+    try:
+        assert db.delta.stats()["active_ngrams"] == 0
+        assert counts(db) == ({("How", "are"): 1}, {("How", "are", "you"): 1, ("are", "you", "<END>"): 1})
+    finally:
+        db.close()
+
+def test_unlearned_message_is_applied_after_crash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Crash after the unlearned message is journaled, but before it is applied
+    crash(tmp_path, """
+        for _ in range(6):
+            learn(["How", "are", "you"])
+        learn(["I", "am", "fine"], "message-id")
+        db.flush()
+        db.unlearn_ngrams_now = lambda *args: os._exit(0)
+        db.unlearn_message("message-id")
+        db.flush()
+    """)
+    db = Database("#test")
+    try:
+        assert counts(db) == ({("How", "are"): 6}, {("How", "are", "you"): 6, ("are", "you", "<END>"): 6})
+        assert db.query("SELECT unlearned FROM DeltaLog;") == [(1,)]
+    finally:
+        db.close()
@@ -0,0 +1,31 @@
+import json
+
+from DeltaTier import DeltaTier
+from Journal import Journal
+
+def test_message_is_one_record_and_is_replayed(tmp_path):
+    prefix = str(tmp_path / "MarkovChain_test_delta")
+    journal = Journal(prefix)
+    delta = DeltaTier(journal)
+    delta.add_many([("MarkovStart", ("How", "are"), 1),
+                    ("MarkovGrammar", ("How", "are", "you"), 1),
+                    ("MarkovGrammar", ("are", "you", "<END>"), 1)])
+    number = delta.add_unlearn("Hello there friend")
+    journal.close()
+    assert journal.stats()["records"] == 2
+
+    replayed = DeltaTier(Journal(prefix))
+    assert replayed.replay(compacted=0, unlearned=0) == (3, [(number, "Hello there friend")])
+    assert replayed.active.tables == delta.active.tables
+
+def test_replays_records_of_single_ngrams(tmp_path):
+    # Journals from before n-grams were recorded per message
+    prefix = str(tmp_path / "MarkovChain_test_delta")
+    with open(f"{prefix}_1.log", "w", encoding="utf-8") as f:
+        f.write(json.dumps(["MarkovStart", ["How", "are"], 1]) + "\n")
+        f.write(json.dumps(["MarkovGrammar", ["How", "are", "you"], 2]) + "\n")
+
+    delta = DeltaTier(Journal(prefix))
+    assert delta.replay(compacted=0, unlearned=0) == (3, [])
+    assert delta.active.tables["MarkovStart"] == {("How", "are"): 1}
+    assert delta.active.tables["MarkovGrammar"] == {("How", "are", "you"): 2}
@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+import Migration
+from Database import Database
+from databases import LEGACY_MESSAGES, legacy_counts, stored_counts
+
+def traced(monkeypatch):
+    """Record every statement executed by the connections that Databases open from now on."""
+    statements = []
+    connect = Database.connect
+    def connect_traced(self, read_only=False):
+        conn = connect(self, read_only)
+        conn.set_trace_callback(statements.append)
+        return conn
+    monkeypatch.setattr(Database, "connect", connect_traced)
+    return statements
+
+def test_update_from_v3_skips_indices_of_replaced_tables(v3_database, monkeypatch):
+    statements = traced(monkeypatch)
+    db = Database("#test", migration_processes=1)
+    try:
+        assert db.get_version() == Database.VERSION
+        # The 756 tables of version 3 are replaced by version 6, so version 4 does not index them
+        assert not [sql for sql in statements if "CREATE INDEX" in sql and "_lookup" in sql]
+        assert not db.query("SELECT name FROM sqlite_master WHERE name LIKE 'Markov%' AND name NOT IN ('MarkovStart', 'MarkovGrammar');")
+        assert stored_counts(db) == legacy_counts(LEGACY_MESSAGES)
+        assert db.check_whisper_ignore("quiet_user")
+    finally:
+        db.close()
+
+def record_updates(monkeypatch):
+    """Record the names of the updates and bootstraps of the Database structure that Databases run from now on."""
+    calls = []
+    migrations, create_tables = Database.migrations, Database.create_tables
+    def recorded(migrate):
+        def migrate_recorded():
+            calls.append(migrate.__name__)
+            migrate()
+        return migrate_recorded
+    def migrations_recorded(self, channel):
+        return [(version, recorded(migrate)) for version, migrate in migrations(self, channel)]
+    def create_tables_recorded(self):
+        calls.append("create_tables")
+        create_tables(self)
+    monkeypatch.setattr(Database, "migrations", migrations_recorded)
+    monkeypatch.setattr(Database, "create_tables", create_tables_recorded)
+    return calls
+
+def test_current_version_skips_bootstrap(database, monkeypatch):
+    database.close()
+    calls = record_updates(monkeypatch)
+    statements = traced(monkeypatch)
+    db = Database("#test")
+    try:
+        assert calls == []
+        # Only the version is read, nothing is created or written
+        assert not [sql for sql in statements if sql.lstrip().startswith(("CREATE", "INSERT", "DELETE"))]
+    finally:
+        db.close()
+
+def test_old_version_runs_updates_and_bootstrap(v3_database, monkeypatch):
+    calls = record_updates(monkeypatch)
+    db = Database("#test", migration_processes=1)
+    try:
+        assert calls[-1] == "create_tables"
+        assert "update_v3" not in calls and "update_v4" in calls
+        assert db.get_version() == Database.VERSION
+    finally:
+        db.close()
+
+def test_interrupted_update_resumes_from_checkpoint(v2_database, monkeypatch):
+    applied = []
+    write_retokenized = Migration.write_retokenized
+    def write_interrupted(cur, table, result):
+        if len(applied) == 100:
+            raise KeyboardInterrupt
+        write_retokenized(cur, table, result)
+        applied.append(table)
+    monkeypatch.setattr(Migration, "write_retokenized", write_interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        Database("#test", migration_processes=1)
+    assert os.path.isfile("MarkovChain_test_modified.db")
+
+    retokenized = []
+    retokenize_table = Migration.retokenize_table
+    def retokenize_recorded(path, table, chunk_size):
+        retokenized.append(table)
+        return retokenize_table(path, table, chunk_size)
+    monkeypatch.setattr(Migration, "write_retokenized", write_retokenized)
+    monkeypatch.setattr(Migration, "retokenize_table", retokenize_recorded)
+    db = Database("#test", migration_processes=1)
+    try:
+        # Only the tables that were not checkpointed yet are re-tokenized again, and none are counted twice
+        assert db.migration_stats["resumed_tables"] == 100
+        assert len(retokenized) == db.migration_stats["tables"] - 100
+        assert not set(retokenized) & set(applied)
+        assert db.get_version() == Database.VERSION
+        assert stored_counts(db) == legacy_counts(LEGACY_MESSAGES)
+        assert db.check_whisper_ignore("quiet_user")
+        assert not os.path.isfile("MarkovChain_test_modified.db")
+    finally:
+        db.close()
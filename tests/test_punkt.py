@@ -0,0 +1,46 @@
+import pickle
+
+import pytest
+
+from Corpora import generate_adversarial_messages, generate_chat_messages
+from Punkt import DEFAULT_PATH, ModelUnpickler, SentenceSplitter, export_model, model_path
+
+nltk = pytest.importorskip("nltk")
+
+# Abbreviations, initials, numbers and collocations are where Punkt does more than split on periods
+EDGE_CASES = [
+    "", "Hello there. How are you?", "I met Dr. Smith at 5 p.m. yesterday. He was fine.", "The U.S. army is big. Kappa",
+    "e.g. this one. And i.e. that one.", "It costs 3.50 dollars. Cheap!", "Mr. and Mrs. Jones left... Then what?",
+    "Wait!!! what?? no way. ok", "He said \"stop.\" Then he left.", "See ch. 3. It explains it.", "jan. 5th. feb. 6th.",
+    "lol. LUL. :) bye.", "A. B. C. D.", "I'm gonna go. brb", "(Hello there.) (How are you?)", "Visit example.com. Now.",
+]
+
+@pytest.fixture(scope="module")
+def sent_tokenize():
+    try:
+        nltk.data.find("tokenizers/punkt_tab/english/")
+    except LookupError:
+        pytest.skip("The punkt_tab data of nltk is not installed.")
+    return lambda text: nltk.sent_tokenize(text, "english")
+
+def test_distributed_model_splits_like_nltk(sent_tokenize):
+    split = SentenceSplitter(model_path(DEFAULT_PATH))
+    messages = EDGE_CASES + list(generate_chat_messages(5000)) + list(generate_adversarial_messages(5000))
+    # Chat messages rarely hold several sentences, so also split them joined into longer texts
+    messages += [". ".join(messages[i:i + 5]) for i in range(0, len(messages), 5)]
+    mismatches = [(message, split(message), sent_tokenize(message)) for message in messages if split(message) != sent_tokenize(message)]
+    assert mismatches == []
+
+def test_distributed_model_is_current(sent_tokenize, tmp_path):
+    # If this fails after updating nltk, export the model again with `python Punkt.py`
+    path = str(tmp_path / "punkt_english.pickle")
+    export_model(path, download=False)
+    with open(path, "rb") as exported, open(model_path(DEFAULT_PATH), "rb") as distributed:
+        assert ModelUnpickler(exported).load() == ModelUnpickler(distributed).load()
+
+def test_model_with_classes_is_refused(tmp_path):
+    path = tmp_path / "evil.pickle"
+    with open(path, "wb") as f:
+        pickle.dump({"format": 1, "callable": print}, f, protocol=4)
+    with pytest.raises(pickle.UnpicklingError):
+        SentenceSplitter(str(path)).load()
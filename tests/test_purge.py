@@ -0,0 +1,77 @@
+import sqlite3
+
+from Blacklist import Blacklist
+from Database import Database
+from Tokenizer import fast_tokenize
+
+MESSAGES = [
+    ["ÉCOLE", "is", "great"],
+    ["the", "école", "is", "open"],
+    ["I", "like", "École", "a", "lot"],
+    ["ecole", "without", "accent", "stays"],
+    ["we", "go", "to", "ÉcOlE", "now"],
+    ["Kappa", "Kappa", "LUL"],
+]
+
+def learn(db, messages):
+    for words in messages:
+        rules = [tuple(words[i:i + 3]) for i in range(len(words) - 2)] + [(*words[-2:], "<END>")]
+        db.learn([tuple(words[:2])], rules)
+    db.flush()
+
+def rows(db):
+    """All words of all rows of MarkovStart and MarkovGrammar."""
+    conn = db.writer
+    words = dict(conn.execute("SELECT id, word FROM Vocabulary;"))
+    grammar = [tuple(words[word_id] for word_id in row) for row in conn.execute("SELECT word1, word2, word3 FROM MarkovGrammar;")]
+    starts = [tuple(words[word_id] for word_id in row) for row in conn.execute("SELECT word1, word2 FROM MarkovStart;")]
+    return grammar, starts
+
+def test_purge_non_ascii_word_in_every_case(database):
+    learn(database, MESSAGES)
+    blacklist = Blacklist(["ÉCOLE"], fast_tokenize)
+    stats = database.purge_now(blacklist.terms("ÉCOLE"))
+
+    grammar, starts = rows(database)
+    # Every row that the blacklist would block is removed
+    for row in grammar + starts:
+        assert not blacklist.matches(row), row
+    assert stats["rows"] > 0
+    # Words that only look similar are kept
+    assert ("ecole", "without", "accent") in grammar
+    assert ("ecole", "without") in starts
+    assert ("Kappa", "Kappa", "LUL") in grammar
+
+    # The StartIndex still covers exactly the remaining starts
+    conn = database.writer
+    assert conn.execute("SELECT SUM(total) FROM StartTotals;").fetchone()[0] == conn.execute("SELECT SUM(count) FROM MarkovStart;").fetchone()[0]
+    assert conn.execute("SELECT SUM(high - low) FROM StartIndex;").fetchone()[0] == conn.execute("SELECT SUM(count) FROM MarkovStart;").fetchone()[0]
+
+def test_update_v10_adds_lowercase_words(database):
+    learn(database, MESSAGES)
+    database.close()
+    # Recreate the Vocabulary of version 9, without the lowercase words
+    conn = sqlite3.connect(database.db_name)
+    conn.executescript("""
+        DROP INDEX Vocabulary_lower;
+        CREATE TABLE Vocabulary_v9 (id INTEGER PRIMARY KEY, word TEXT NOT NULL UNIQUE, word_folded TEXT NOT NULL);
+        INSERT INTO Vocabulary_v9 SELECT id, word, word_folded FROM Vocabulary;
+        DROP TABLE Vocabulary;
+        ALTER TABLE Vocabulary_v9 RENAME TO Vocabulary;
+        CREATE INDEX Vocabulary_folded ON Vocabulary (word_folded);
+        UPDATE Version SET version = 9;
+    """)
+    conn.close()
+
+    db = Database("#test")
+    try:
+        assert db.get_version() == Database.VERSION
+        lowered = dict(db.writer.execute("SELECT word, word_lower FROM Vocabulary;"))
+        assert lowered["ÉCOLE"] == "école"
+        assert lowered["Kappa"] == "kappa"
+        assert all(word.lower() == word_lower for word, word_lower in lowered.items())
+        db.purge_now([("école",)])
+        grammar, _starts = rows(db)
+        assert not any(word.lower() == "école" for row in grammar for word in row)
+    finally:
+        db.close()
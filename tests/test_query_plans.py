@@ -0,0 +1,50 @@
+import pytest
+
+# The statements executed while generating, learning and unlearning, which must look up rows through an index
+HOT_LOOKUPS = [
+    ("MarkovGrammar", "transitions"),
+    ("MarkovGrammar", "singles"),
+    ("MarkovGrammar", "unlearn"),
+    ("MarkovGrammar", "delete_unlearned"),
+    ("MarkovGrammar", "thirds"),
+    ("MarkovGrammar", "decrement"),
+    ("MarkovGrammar", "prune"),
+    ("MarkovStart", "seconds"),
+    ("MarkovStart", "unlearn"),
+    ("MarkovStart", "delete_unlearned"),
+    ("MarkovStart", "count"),
+    ("StartIndex", "find"),
+    ("StartIndex", "delete_start"),
+    ("StartTotals", "extent"),
+    ("Vocabulary", "ids_1"),
+    ("Vocabulary", "words_1"),
+    ("Vocabulary", "lowered"),
+    ("WordIndex", "first_words"),
+    ("WhisperIgnore", "check"),
+]
+
+# Statements that read every row of a table on purpose, as those tables only hold a few rows,
+# or as they rebuild the StartIndex for all words that do not start with a letter
+SCANS = {
+    "StartTotals.totals",
+    "DeltaLog.compacted",
+    "DeltaLog.unlearned",
+    "StartIndex.rebuild_other",
+    "StartTotals.rebuild_other",
+}
+
+def table_scans(plan):
+    """Get the steps of `plan` that scan a table, rather than a subquery or a constant row."""
+    return [step for step in plan if step.startswith("SCAN ") and not step.startswith(("SCAN (", "SCAN CONSTANT ROW"))]
+
+@pytest.mark.parametrize("table, operation", HOT_LOOKUPS)
+def test_hot_lookup_searches_index(database, table, operation):
+    plan = database.statements.query_plans(database.writer)[f"{table}.{operation}"]
+    assert plan[0].startswith(f"SEARCH {table} USING ")
+    assert "INDEX" in plan[0] or "PRIMARY KEY" in plan[0]
+    assert not table_scans(plan), plan
+
+def test_no_statement_scans_a_table(database):
+    plans = database.statements.query_plans(database.writer)
+    scanning = {name: table_scans(plan) for name, plan in plans.items() if name not in SCANS and table_scans(plan)}
+    assert not scanning
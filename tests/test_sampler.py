@@ -0,0 +1,49 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from Sampler import TransitionSampler
+
+# Includes a variant of "<END>" with different casing, which is weighted like a normal word, but never starts a generation
+TRANSITIONS = [("the", 40), ("a", 25), ("Kappa", 12), ("<end>", 3), ("much", 1), ("<END>", 30), ("LUL", 7)]
+N_SAMPLES = 100000
+
+def expected_distribution(index, initial=False):
+    """The distribution that `Database.pick_word` samples from, with the weight of "<END>" scaled by (index + 1) / 15."""
+    if initial:
+        weights = {word: count for word, count in TRANSITIONS if word.lower() != "<end>"}
+    else:
+        weights = {word: count * ((index + 1) / 15) if word == "<END>" else count for word, count in TRANSITIONS}
+    total = sum(weights.values())
+    return {word: weight / total for word, weight in weights.items()}
+
+def assert_matches(counts, expected):
+    assert set(counts) <= set(expected)
+    for word, probability in expected.items():
+        # 5 standard deviations of the binomial share of `word`
+        tolerance = 5 * math.sqrt(probability * (1 - probability) / N_SAMPLES)
+        assert abs(counts[word] / N_SAMPLES - probability) <= tolerance, (word, counts[word] / N_SAMPLES, probability)
+    distance = sum(abs(counts[word] / N_SAMPLES - probability) for word, probability in expected.items()) / 2
+    assert distance < 0.01
+
+@pytest.mark.parametrize("index", [0, 7, 14, 30])
+def test_sample_matches_end_reweighting(index):
+    random.seed(index)
+    sampler = TransitionSampler(TRANSITIONS)
+    counts = Counter(sampler.sample(index) for _ in range(N_SAMPLES))
+    assert_matches(counts, expected_distribution(index))
+
+def test_initial_sample_excludes_end():
+    random.seed(1)
+    sampler = TransitionSampler(TRANSITIONS)
+    counts = Counter(sampler.sample(initial=True) for _ in range(N_SAMPLES))
+    assert_matches(counts, expected_distribution(0, initial=True))
+
+def test_items_round_trip():
+    assert sorted(TransitionSampler(TRANSITIONS).items()) == sorted(TRANSITIONS)
+
+def test_empty():
+    assert TransitionSampler([]).sample(3) is None
+    assert TransitionSampler([("<END>", 4)]).sample(initial=True) is None
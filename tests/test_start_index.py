@@ -0,0 +1,63 @@
+import math
+import random
+from collections import Counter
+
+from databases import learn, start_index_problems, stored_counts
+
+# Starts with several first letters, one with a non-letter suffix, and starts that only differ in casing
+MESSAGES = [
+    ["How", "are", "you"],
+    ["how", "are", "we"],
+    ["Hello", "there", "friend"],
+    ["I", "am", "fine"],
+    ["I", "am", "tired"],
+    ["Kappa", "Kappa", "LUL"],
+    ["123", "go", "now"],
+    ["Are", "you", "there"],
+]
+N_SAMPLES = 20000
+
+def learn_and_unlearn(database, check=lambda: None):
+    """Learn `MESSAGES` a varying number of times, unlearn some of them, and learn more, leaving gaps in the StartIndex.
+
+    `check()` is called after every flush.
+    """
+    for i, words in enumerate(MESSAGES):
+        for _ in range(i + 2):
+            learn(database, words)
+        database.flush()
+        check()
+    # Reduces "I am" and "123 go" by 5, and removes "How are" and "how are" entirely
+    database.unlearn("I am fine")
+    database.unlearn("How are you")
+    database.unlearn("123 go now")
+    database.flush()
+    check()
+    # Relearned starts get a new range at the end of the extent of their suffix
+    learn(database, ["How", "are", "things"])
+    learn(database, ["Hi", "there", "friend"])
+    database.flush()
+    check()
+
+def test_ranges_match_recount_after_learning_and_unlearning(database):
+    def check():
+        assert start_index_problems(database) == []
+    learn_and_unlearn(database, check)
+
+    # The ranges were updated incrementally, rather than rebuilt without gaps
+    assert any(extent > total for _suffix, total, extent in database.query("SELECT suffix, total, extent FROM StartTotals;"))
+
+def test_start_distribution_matches_start_counts(database):
+    learn_and_unlearn(database)
+    assert database.delta.get_start_total() == 0
+    starts, _grammar = stored_counts(database)
+    total = sum(starts.values())
+
+    random.seed(4)
+    counts = Counter(tuple(database.get_start()) for _ in range(N_SAMPLES))
+    assert set(counts) == set(starts)
+    for start, count in starts.items():
+        probability = count / total
+        # 5 standard deviations of the binomial share of `start`
+        tolerance = 5 * math.sqrt(probability * (1 - probability) / N_SAMPLES)
+        assert abs(counts[start] / N_SAMPLES - probability) <= tolerance, (start, counts[start] / N_SAMPLES, probability)
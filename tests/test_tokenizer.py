@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from Corpora import TOKENIZER_FRAGMENTS, generate_adversarial_messages, generate_chat_messages
+from Tokenizer import RULE_TRIGGERS, fast_tokenize, tokenize
+
+# The characters that emoticons, rules and whitespace handling of the tokenizers depend on, and some plain ones
+FUZZ_ALPHABET = sorted(set("".join(RULE_TRIGGERS.values())) | set(":;=8<>()[]{}dDpPxX/\\|@-_'\"`.,!?") |
+                       set("aAnNtTsSmMlLrReEvVdD0123456789 ") | set("\t\n 　İıſßé’“”«»„"))
+
+EDGE_CASES = [
+    "", " ", "Kappa", "Hello there!", "I'm gonna :) go", ":):):)", "<3 <3", "don't DON'T Don'T", "cannot CanNot",
+    "'tis 'Twas", "rock'n'roll", "\"quoted\" ''twice''", "``ticks``", "a...b..", "1:30 3,36 $5 3.88",
+    "@user #tag", "end.", "end. ", "(parens) [brackets] {braces}", "-- dashes --", "x' y' z'", "D: xD 8D",
+    "gİmme 'tİs 'twaſ", " :) ", "word\twith\ttabs", ">:( =]",
+]
+
+def assert_same_tokens(messages):
+    mismatches = [(message, tokenize(message), fast_tokenize(message)) for message in messages
+                  if tokenize(message) != fast_tokenize(message)]
+    assert not mismatches, f"{len(mismatches)} mismatches, e.g. {mismatches[:5]!r}"
+
+@pytest.mark.parametrize("message", EDGE_CASES)
+def test_edge_case(message):
+    assert fast_tokenize(message) == tokenize(message)
+
+def test_fragments():
+    assert_same_tokens(TOKENIZER_FRAGMENTS)
+    assert_same_tokens(a + b for a in TOKENIZER_FRAGMENTS for b in TOKENIZER_FRAGMENTS)
+
+def test_chat_corpus():
+    assert_same_tokens(generate_chat_messages(10000, seed=0))
+
+def test_adversarial_corpus():
+    assert_same_tokens(generate_adversarial_messages(10000, seed=0))
+
+@pytest.mark.parametrize("seed", range(3))
+def test_character_fuzz(seed):
+    rng = random.Random(seed)
+    assert_same_tokens("".join(rng.choices(FUZZ_ALPHABET, k=rng.randint(1, 24))) for _ in range(5000))
@@ -0,0 +1,74 @@
+from TwitchWebsocket import Message
+
+from Database import Database
+from MarkovChainBot import MarkovChain
+from Settings import Settings
+from databases import stored_counts
+
+def irc_line(message, user="viewer", emotes=""):
+    return (f"@badge-info=;badges=;color=;display-name={user};emotes={emotes};flags=;id=1;mod=0;room-id=1;subscriber=0;"
+            f"tmi-sent-ts=0;turbo=0;user-id=1;user-type= :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #test :{message}")
+
+# One line for every way in which a message is filtered, and lines that are learned from
+LOG = [
+    irc_line("Hello there, how are you doing?"),
+    irc_line("I am fine. Thanks for asking! How about you?"),
+    irc_line("Hello there, how are you doing?"),
+    irc_line("Messages from denied users are ignored", user="DeniedUser"),
+    irc_line("!g hello there"),
+    irc_line("!ghelp with more words"),
+    irc_line("!other command with words"),
+    irc_line("look at example.com right now"),
+    irc_line("cheer100 bit emotes are ignored", emotes="emotesv2_abc:0-7"),
+    irc_line("modified Kappa_HZ emotes are learned as normal emotes", emotes="25_HZ:9-16"),
+    irc_line("this message has a forbidden word in it"),
+    irc_line("two words"),
+    ":tmi.twitch.tv NOTICE #test :This is not a chat message at all",
+    "A plain line is learned as a message, like chat.",
+    "",
+    "plain lines with forbidden words are ignored too",
+]
+
+class StubWebsocket:
+    def send_message(self, message):
+        pass
+
+    def send_whisper(self, user, message):
+        pass
+
+def test_train_learns_like_the_bot(tmp_path, monkeypatch):
+    import Train
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Settings, "PATH", str(tmp_path / "settings.json"))
+    Settings.write_settings_file({**Settings.DEFAULTS, "Channel": "#bot", "Nickname": "TestBot", "DeniedUsers": ["DeniedUser"],
+                                  "HelpMessageTimer": -1, "AutomaticGenerationTimer": -1, "SentencePoolSize": 0})
+    (tmp_path / "blacklist.txt").write_text("<start>\n<end>\nforbidden")
+    (tmp_path / "chat.log").write_text("\n".join(LOG), encoding="utf-8")
+
+    Train.train([str(tmp_path / "chat.log")], "#train", processes=1)
+
+    bot = MarkovChain(connect=False)
+    bot.db = bot.model = Database("#bot")
+    bot.sentence_pool = None
+    bot.ws = StubWebsocket()
+    try:
+        # Chat has no empty messages, which only occur as empty lines in logs
+        for line in filter(None, LOG):
+            bot.message_handler(Message(line if line.startswith(("@", ":")) else irc_line(line)))
+        bot.db.flush()
+        trained = Database("#train")
+        try:
+            starts, grammar = stored_counts(trained)
+            assert (starts, grammar) == stored_counts(bot.db)
+        finally:
+            trained.close()
+    finally:
+        bot.db.close()
+
+    # Only the learnable lines are learned, with "Kappa_HZ" as "Kappa"
+    assert starts[("Hello", "there")] == 2
+    assert starts[("A", "plain")] == 1
+    assert ("modified", "Kappa", "emotes") in grammar
+    assert not [ngram for ngram in list(starts) + list(grammar)
+                if {"!g", "!ghelp", "!other", "denied", "Messages", "cheer100", "example.com", "forbidden", "two", "Kappa_HZ"} & set(ngram)]
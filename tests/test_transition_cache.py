@@ -0,0 +1,85 @@
+from Blacklist import Blacklist
+from Cache import LRUCache
+from Tokenizer import fast_tokenize
+from databases import learn
+
+MESSAGES = [
+    ["How", "are", "you"],
+    ["how", "are", "we"],
+    ["I", "am", "fine"],
+    ["Kappa", "Kappa", "LUL"],
+]
+
+def cached(db, words):
+    """Whether a sampler for the transitions after `words` is cached."""
+    return (db.nocase(words[0]), db.nocase(words[1])) in db.transition_cache._data
+
+def prime(db):
+    """Learn `MESSAGES`, and cache the samplers after the first two words of each."""
+    for words in MESSAGES:
+        learn(db, words)
+    db.flush()
+    for words in MESSAGES:
+        db.get_sampler(words[:2])
+        assert cached(db, words[:2])
+
+def test_put_after_invalidation_is_rejected():
+    cache = LRUCache(10, 1000)
+    generation = cache.generation
+    cache.invalidate([("other", "key")])
+    cache.put(("how", "are"), "outdated", 10, generation)
+    assert cache.get(("how", "are")) is None
+
+    generation = cache.generation
+    cache.clear()
+    cache.put(("how", "are"), "outdated", 10, generation)
+    assert cache.get(("how", "are")) is None
+
+    cache.put(("how", "are"), "current", 10, cache.generation)
+    assert cache.get(("how", "are")) == "current"
+
+def test_learning_invalidates_affected_keys(database):
+    prime(database)
+    learn(database, ["HOW", "ARE", "things"])
+    database.flush()
+
+    # Keys are case-insensitive, so "HOW ARE" invalidates "How are" and "how are"
+    assert not cached(database, ["How", "are"])
+    assert not cached(database, ["ARE", "things"])
+    assert cached(database, ["I", "am"])
+    assert cached(database, ["Kappa", "Kappa"])
+    assert sorted(database.get_sampler(["how", "are"]).items()) == [("things", 1), ("we", 1), ("you", 1)]
+
+def test_unlearning_invalidates_affected_keys(database):
+    prime(database)
+    database.unlearn("I am fine")
+    database.flush()
+    assert not cached(database, ["I", "am"])
+    assert cached(database, ["How", "are"])
+    assert database.get_sampler(["I", "am"]).items() == []
+
+    learn(database, ["Kappa", "Kappa", "Kappa"], "message-id")
+    database.flush()
+    database.get_sampler(["Kappa", "Kappa"])
+    database.unlearn_message("message-id")
+    database.flush()
+    assert not cached(database, ["Kappa", "Kappa"])
+    assert cached(database, ["How", "are"])
+    assert database.get_sampler(["Kappa", "Kappa"]).items() == [("LUL", 1)]
+
+def test_sampler_read_before_purge_is_not_cached(database, monkeypatch):
+    prime(database)
+    database.transition_cache.clear()
+    query = database.query
+    def purge_after_read(sql, *args, **kwargs):
+        # The purge commits after the reader read the transitions, but before it caches them
+        data = query(sql, *args, **kwargs)
+        if sql == database.statements["MarkovGrammar", "transitions"]:
+            monkeypatch.setattr(database, "query", query)
+            database.purge_now(Blacklist(["fine"], fast_tokenize).terms("fine"))
+        return data
+    monkeypatch.setattr(database, "query", purge_after_read)
+
+    assert database.get_sampler(["I", "am"]).items() == [("fine", 1)]
+    assert not cached(database, ["I", "am"])
+    assert database.get_sampler(["I", "am"]).items() == []
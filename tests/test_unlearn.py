@@ -0,0 +1,95 @@
+import random
+
+from Database import Database
+from databases import learn, start_index_problems, stored_counts
+
+BASE = [
+    ["How", "are", "you"],
+    ["I", "am", "fine", "thanks"],
+    ["Kappa", "LUL", "Kappa"],
+]
+
+def test_unlearn_message_restores_counts_exactly(database):
+    for words in BASE:
+        learn(database, words)
+    database.flush()
+    before = stored_counts(database)
+
+    learn(database, ["Deleted", "message", "here", "!"], "deleted-id")
+    database.flush()
+    assert stored_counts(database) != before
+    assert database.unlearn_message("deleted-id")
+    database.flush()
+    assert stored_counts(database) == before
+    assert start_index_problems(database) == []
+
+def test_unlearn_message_reduces_shared_ngrams_by_five(database):
+    for _ in range(7):
+        learn(database, ["How", "are", "you"])
+    learn(database, ["How", "are", "you", "doing"], "deleted-id")
+    database.flush()
+    assert database.unlearn_message("deleted-id")
+    database.flush()
+    starts, grammar = stored_counts(database)
+    assert starts == {("How", "are"): 8 - 5}
+    # Counts of n-grams that were only learned from the deleted message drop to 0 or less, and are removed
+    assert grammar == {("How", "are", "you"): 8 - 5, ("are", "you", "<END>"): 7}
+    assert start_index_problems(database) == []
+
+def test_forgotten_message_falls_back_to_unlearn(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = Database("#test", learned_message_entries=2)
+    try:
+        learn(db, ["Oldest", "message", "here"], "oldest-id")
+        learn(db, ["Second", "message", "here"], "second-id")
+        learn(db, ["Third", "message", "here"], "third-id")
+        db.flush()
+        assert db.learned_messages.stats()["evictions"] == 1
+
+        # The bot then unlearns the message by its words
+        assert not db.unlearn_message("oldest-id")
+        db.unlearn("Oldest message here")
+        db.flush()
+        starts, grammar = stored_counts(db)
+        assert ("Oldest", "message") not in starts
+        assert not [ngram for ngram in grammar if ngram[0] == "Oldest"]
+        assert ("Second", "message") in starts
+        # The message is not unlearned by its words again
+        assert db.unlearn_message("oldest-id")
+    finally:
+        db.close()
+
+def test_repeated_clearmsg_is_ignored(database):
+    for _ in range(12):
+        learn(database, ["How", "are", "you"])
+    learn(database, ["How", "are", "you"], "deleted-id")
+    database.flush()
+    assert database.unlearn_message("deleted-id")
+    database.flush()
+    after = stored_counts(database)
+    assert after[0] == {("How", "are"): 13 - 5}
+
+    assert database.unlearn_message("deleted-id")
+    database.flush()
+    assert stored_counts(database) == after
+    assert database.learned_messages.stats()["duplicates"] == 1
+
+def test_start_index_stays_consistent_with_unlearning(database):
+    rng = random.Random(0)
+    vocabulary = ["How", "how", "are", "you", "I", "am", "fine", "Kappa", "LUL", "école", "42", "?", "!"]
+    learned = []
+    for i in range(300):
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(2, 6))]
+        learn(database, words, f"id-{i}")
+        learned.append((f"id-{i}", words))
+        if rng.random() < 0.3:
+            message_id, words = learned.pop(rng.randrange(len(learned)))
+            if rng.random() < 0.5:
+                database.unlearn_message(message_id)
+            else:
+                database.unlearn(" ".join(words))
+        if i % 50 == 49:
+            database.flush()
+            assert start_index_problems(database) == []
+    database.flush()
+    assert start_index_problems(database) == []
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from Database import Database
+from Metrics import Metrics
+from Writer import DatabaseWriter
+
+class StubDatabase:
+    """The parts of a Database that the writer uses, without a database."""
+    def __init__(self):
+        self.metrics = Metrics()
+
+    def execute_commit(self):
+        pass
+
+    def commit_if_due(self):
+        pass
+
+def test_submit_drops_instead_of_blocking_when_full():
+    db = StubDatabase()
+    writer = DatabaseWriter(db, max_queue_size=2)
+    writer.start()
+    release = threading.Event()
+    started = threading.Event()
+    try:
+        # Keep the writer busy, so the queue fills up
+        writer.submit(lambda: (started.set(), release.wait()))
+        assert started.wait(5)
+        assert writer.submit(lambda: None)
+        assert writer.submit(lambda: None)
+
+        start_t = time.perf_counter()
+        assert not writer.submit(lambda: None)
+        assert time.perf_counter() - start_t < 0.1
+        assert writer.stats()["dropped"] == 1
+        assert 'markov_database_writes_total{result="dropped"} 1' in db.metrics.render()
+    finally:
+        release.set()
+        writer.stop()
+    assert writer.stats()["processed"] == 3
+
+def block(writer):
+    """Keep the writer thread busy until the returned event is set, and fill its queue."""
+    release = threading.Event()
+    started = threading.Event()
+    writer.submit(lambda: (started.set(), release.wait()))
+    assert started.wait(5)
+    while writer.submit(lambda: None):
+        pass
+    return release
+
+def test_whisper_ignore_and_unlearn_are_not_dropped_when_full(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = Database("#test", write_queue_size=2)
+    try:
+        db.learn([("How", "are")], [("How", "are", "you"), ("are", "you", "<END>")], "message-id")
+        db.flush()
+
+        release = block(db.write_thread)
+        assert db.write_thread.stats()["dropped"] == 1
+        # Unlearning is queued even though the queue is full
+        assert db.unlearn_message("message-id")
+        db.unlearn("other message here")
+        # Adding waits until it is committed, so it is visible as soon as the user is told
+        threading.Timer(0.2, release.set).start()
+        assert db.add_whisper_ignore("user")
+        assert db.check_whisper_ignore("user")
+
+        assert db.flush(5)
+        assert db.query("SELECT COUNT(*) FROM MarkovGrammar;") == [(0,)]
+        assert db.query("SELECT COUNT(*) FROM MarkovStart;") == [(0,)]
+        assert db.write_thread.stats()["dropped"] == 1
+    finally:
+        db.close()
+
+def test_whisper_ignore_is_cancelled_if_writer_is_too_busy(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Database, "WHISPER_IGNORE_TIMEOUT", 0.1)
+    db = Database("#test", write_queue_size=2, metrics=Metrics())
+    try:
+        release = block(db.write_thread)
+        assert not db.add_whisper_ignore("user")
+        release.set()
+        assert db.flush(5)
+        # The change was never made, so the user was told the truth
+        assert not db.check_whisper_ignore("user")
+        assert 'markov_database_writes_total{result="failed"} 1' in db.metrics.render()
+    finally:
+        db.close()